@@ -2,174 +2,155 @@
 # coding: utf-8
 
 # College Scorecard ROI Analysis - Data Preprocessing
+#
+# Each Part is timed by the profiler (written to data/profiles/); the previews,
+# info() and describe() output only run with --debug (or SCORECARD_DEBUG=1).
+# Rows dropped by the validation rules in Part 6 are kept in data/quarantine/.
 
 # Part 1: Setup & Data Loading
+import sys
 import pandas as pd
-import gdown
 from pathlib import Path
-
-# Setup file path and download link
-data_dir = Path('../data/raw')
-file_path = data_dir / 'Most-Recent-Cohorts-Field-of-Study.csv'
-drive_link = "https://drive.google.com/file/d/1ER-vyYO-dxN-qLAwDFsovOU_-JSw30SP/view?usp=sharing"
-
-data_dir.mkdir(parents=True, exist_ok=True)
-
-if not file_path.exists():
-    print(f"File not found at '{file_path}', downloading from Google Drive...")
-    gdown.download(drive_link, str(file_path), fuzzy=True)
-    print("Download complete!")
-else:
-    print(f"File already exists at '{file_path}', skip download.")
-
-# Load CSV data
-df_raw = pd.read_csv(file_path, low_memory=False)
+from loader import load_field_of_study
+from profiling import Profiler
+from rawdata import FOS_FILE, ensure_raw
+from compact import format_footprint
+from cube import CUBE_NAME, build_cube
+from store import write_processed
+from transforms import (
+    AFFORD_BINS, AFFORD_LABELS, COLUMNS_TO_KEEP, EARNINGS_BOUNDS, MIN_CLASS_SIZE, NUMERIC_COLS,
+    ROI_BINS, ROI_LABELS, add_roi_features, categorize, clean, filter_rows, select_columns,
+)
+from validation import QUARANTINE_NAME, QuarantineWriter, format_summary
+
+profiler = Profiler('01_preprocess')
+debug = profiler.debug
+profiler.stage("Part 1: Setup & Data Loading")
+
+# Resolve the raw file through the checksum-verified cache (downloads it, or
+# copies it from $SCORECARD_MIRROR, only when missing or corrupt)
+file_path = ensure_raw(FOS_FILE, Path('../data/raw'))
+
+# Load CSV data (only the columns used below, streamed in chunks with declared dtypes)
+df_raw = load_field_of_study(file_path)
 print("Data loaded successfully!")
+profiler.end(rows_out=len(df_raw))
 
 # Part 2: Initial Data Exploration
+profiler.stage("Part 2: Initial Data Exploration", rows_in=len(df_raw))
 print(f"Dataset shape (rows, columns): {df_raw.shape}")
-print("\nFirst 5 rows of the raw data:")
-print(df_raw.head())
-print("\nData types and non-null values:")
-df_raw.info()
+if debug:
+    print("\nFirst 5 rows of the raw data:")
+    print(df_raw.head())
+    print("\nData types and non-null values:")
+    df_raw.info()
+profiler.end(rows_out=len(df_raw))
 
 # Part 3: Column Selection for ROI Analysis
-columns_to_keep = [
-    'EARN_MDN_5YR',
-    'DEBT_ALL_STGP_ANY_MDN',
-    'DEBT_ALL_STGP_EVAL_MDN',
-    'DEBT_ALL_STGP_ANY_MDN10YRPAY',
-    'DEBT_ALL_STGP_EVAL_MDN10YRPAY',
-    'INSTNM',
-    'CIPCODE',
-    'CIPDESC',
-    'CREDLEV',
-    'CREDDESC',
-    'CONTROL',
-    'IPEDSCOUNT2',
-]
-
-df_selected = df_raw[columns_to_keep].copy()
+profiler.stage("Part 3: Column Selection for ROI Analysis", rows_in=len(df_raw))
+# The steps below assign columns in place (copy=False) instead of copying the frame each time
+df_selected = select_columns(df_raw, COLUMNS_TO_KEEP, copy=False)
 print("\nDataFrame after selecting columns:")
 print(f"New shape: {df_selected.shape}")
-print(df_selected.head())
-df_selected.info()
+if debug:
+    print(df_selected.head())
+    df_selected.info()
+profiler.end(rows_out=len(df_selected))
 
 # Part 4: Data Cleaning & Type Conversion
-df_cleaned = df_selected.copy()
-numeric_cols = [
-    'EARN_MDN_5YR', 'DEBT_ALL_STGP_ANY_MDN', 'DEBT_ALL_STGP_EVAL_MDN',
-    'DEBT_ALL_STGP_ANY_MDN10YRPAY', 'DEBT_ALL_STGP_EVAL_MDN10YRPAY', 'IPEDSCOUNT2'
-]
-
-for col in numeric_cols:
-    df_cleaned[col] = pd.to_numeric(df_cleaned[col], errors='coerce')
-
-print("\nData types after conversion:")
-df_cleaned.info()
-
-missing_counts = df_cleaned.isnull().sum()
-missing_percentage = (missing_counts / len(df_cleaned) * 100).round(2)
-missing_summary = pd.DataFrame({
-    'missing_count': missing_counts,
-    'missing_percentage': missing_percentage
-})
-print("\nMissing value analysis:")
-print(missing_summary[missing_summary['missing_count'] > 0].sort_values(by='missing_percentage', ascending=False))
+profiler.stage("Part 4: Data Cleaning & Type Conversion", rows_in=len(df_selected))
+df_cleaned = clean(df_selected, NUMERIC_COLS, copy=False)
+
+if debug:
+    print("\nData types after conversion:")
+    df_cleaned.info()
+
+    missing_counts = df_cleaned.isnull().sum()
+    missing_percentage = (missing_counts / len(df_cleaned) * 100).round(2)
+    missing_summary = pd.DataFrame({
+        'missing_count': missing_counts,
+        'missing_percentage': missing_percentage
+    })
+    print("\nMissing value analysis:")
+    print(missing_summary[missing_summary['missing_count'] > 0].sort_values(by='missing_percentage', ascending=False))
+profiler.end(rows_out=len(df_cleaned))
 
 # Part 5: Feature Engineering - ROI Metrics
-df_roi = df_cleaned.copy()
-df_roi['ROI_EARNINGS_TO_DEBT'] = df_roi['EARN_MDN_5YR'] / df_roi['DEBT_ALL_STGP_ANY_MDN']
-df_roi['DEBT_TO_INCOME_RATIO'] = df_roi['DEBT_ALL_STGP_ANY_MDN'] / df_roi['EARN_MDN_5YR']
-df_roi['PAYBACK_YEARS'] = df_roi['DEBT_ALL_STGP_ANY_MDN'] / df_roi['EARN_MDN_5YR']
-monthly_earnings = df_roi['EARN_MDN_5YR'] / 12
-df_roi['MONTHLY_PAYMENT_PCT'] = (df_roi['DEBT_ALL_STGP_ANY_MDN10YRPAY'] / monthly_earnings) * 100
-
-print("\nPreview with new ROI metrics:")
-print(df_roi.head())
-print("\nStatistics for new ROI metrics:")
-print(df_roi[['ROI_EARNINGS_TO_DEBT', 'PAYBACK_YEARS', 'MONTHLY_PAYMENT_PCT']].describe())
+profiler.stage("Part 5: Feature Engineering - ROI Metrics", rows_in=len(df_cleaned))
+df_roi = add_roi_features(df_cleaned, copy=False)
+
+if debug:
+    print("\nPreview with new ROI metrics:")
+    print(df_roi.head())
+    print("\nStatistics for new ROI metrics:")
+    print(df_roi[['ROI_EARNINGS_TO_DEBT', 'PAYBACK_YEARS', 'MONTHLY_PAYMENT_PCT']].describe())
+profiler.end(rows_out=len(df_roi))
 
 # Part 6: Data Filtering
-df_filtered = df_roi.copy()
-initial_rows = len(df_filtered)
+profiler.stage("Part 6: Data Filtering", rows_in=len(df_roi))
+initial_rows = len(df_roi)
 print(f"\nStarting with {initial_rows} rows.")
 
-df_filtered = df_filtered.dropna(subset=['ROI_EARNINGS_TO_DEBT'])
-df_filtered = df_filtered[df_filtered['IPEDSCOUNT2'] >= 10]
-df_filtered = df_filtered[df_filtered['EARN_MDN_5YR'].between(10000, 500000)]
+# Rows failing a validation rule go to data/quarantine/ with the rules they failed
+with QuarantineWriter(QUARANTINE_NAME) as quarantine:
+    df_filtered = filter_rows(df_roi, min_class_size=MIN_CLASS_SIZE, earnings_bounds=EARNINGS_BOUNDS,
+                              quarantine=quarantine)
 
 final_rows = len(df_filtered)
 print(f"Filtering complete. {final_rows} rows remaining ({(final_rows/initial_rows*100):.2f}% of original).")
-print("\nStatistics after filtering:")
-print(df_filtered[['ROI_EARNINGS_TO_DEBT', 'PAYBACK_YEARS', 'MONTHLY_PAYMENT_PCT']].describe())
+print(format_summary(quarantine.summary()))
+print(f"Quarantined rows written to: {quarantine.dataset_path} (summary: {quarantine.summary_path})")
+if debug:
+    print("\nStatistics after filtering:")
+    print(df_filtered[['ROI_EARNINGS_TO_DEBT', 'PAYBACK_YEARS', 'MONTHLY_PAYMENT_PCT']].describe())
+profiler.end(rows_out=len(df_filtered))
 
 # Part 7: Advanced Feature Engineering
-df_final = df_filtered.copy()
-
-credential_map = {
-    1: 'Undergraduate Certificate',
-    2: 'Associate Degree',
-    3: 'Bachelor Degree',
-    4: 'Post-baccalaureate Certificate',
-    5: 'Master Degree',
-    6: 'Doctoral Degree',
-    7: 'First Professional Degree',
-    8: 'Graduate Certificate'
-}
-df_final['CREDENTIAL_LEVEL_NAME'] = df_final['CREDLEV'].map(credential_map)
-
-df_final['CIP_2DIGIT'] = df_final['CIPCODE'].astype(str).str[:2]
-major_map = {
-    '11': 'Computer Science',
-    '14': 'Engineering',
-    '15': 'Engineering Technology',
-    '26': 'Biological Sciences',
-    '27': 'Mathematics',
-    '40': 'Physical Sciences',
-    '52': 'Business',
-    '51': 'Health Professions',
-    '42': 'Psychology',
-    '45': 'Social Sciences',
-    '23': 'English Language',
-    '24': 'Liberal Arts & Humanities',
-    '50': 'Visual & Performing Arts',
-    '13': 'Education',
-}
-df_final['MAJOR_FIELD'] = df_final['CIP_2DIGIT'].map(major_map).fillna('Other')
-
-roi_bins = [0, 1, 1.5, 2.5, 4, float('inf')]
-roi_labels = ['Poor (<1)', 'Low (1-1.5)', 'Average (1.5-2.5)', 'Good (2.5-4)', 'Excellent (>4)']
-df_final['ROI_CATEGORY'] = pd.cut(df_final['ROI_EARNINGS_TO_DEBT'], bins=roi_bins, labels=roi_labels, right=False)
-
-afford_bins = [0, 8, 12, 20, float('inf')]
-afford_labels = ['Very Affordable (<8%)', 'Affordable (8-12%)', 'Moderate (12-20%)', 'Expensive (>20%)']
-df_final['AFFORDABILITY'] = pd.cut(df_final['MONTHLY_PAYMENT_PCT'], bins=afford_bins, labels=afford_labels, right=False)
-
-print("\nPreview with new categorical features:")
-print(df_final.head())
-print(df_final[['INSTNM', 'MAJOR_FIELD', 'CIPDESC', 'CREDENTIAL_LEVEL_NAME', 'ROI_EARNINGS_TO_DEBT', 'ROI_CATEGORY', 'AFFORDABILITY']].head())
+profiler.stage("Part 7: Advanced Feature Engineering", rows_in=len(df_filtered))
+df_final = categorize(df_filtered, roi_bins=ROI_BINS, roi_labels=ROI_LABELS,
+                      afford_bins=AFFORD_BINS, afford_labels=AFFORD_LABELS, copy=False)
+
+if debug:
+    print("\nPreview with new categorical features:")
+    print(df_final.head())
+    print(df_final[['INSTNM', 'MAJOR_FIELD', 'CIPDESC', 'CREDENTIAL_LEVEL_NAME', 'ROI_EARNINGS_TO_DEBT', 'ROI_CATEGORY', 'AFFORDABILITY']].head())
 
 print("\nDistribution of ROI Categories:")
 print(df_final['ROI_CATEGORY'].value_counts(normalize=True).sort_index())
 
-print("\nMajor field distribution:")
-print(df_final['MAJOR_FIELD'].value_counts())
-print(df_final['MAJOR_FIELD'].value_counts(normalize=True) * 100)
+if debug:
+    print("\nMajor field distribution:")
+    print(df_final['MAJOR_FIELD'].value_counts())
+    print(df_final['MAJOR_FIELD'].value_counts(normalize=True) * 100)
+profiler.end(rows_out=len(df_final))
 
 # Part 8: Final Validation & Export
+profiler.stage("Part 8: Final Validation & Export", rows_in=len(df_final))
 print("Final DataFrame shape:", df_final.shape)
-print("\nFinal DataFrame columns:")
-print(df_final.columns.tolist())
-print("\nFinal DataFrame info:")
-df_final.info()
-
-# Export processed data
+if debug:
+    print("\nFinal DataFrame columns:")
+    print(df_final.columns.tolist())
+    print("\nFinal DataFrame info:")
+    df_final.info()
+    print("\nMemory footprint (categorical strings, float32 amounts):")
+    print(format_footprint(df_final))
+
+# Export processed data (partitioned Parquet; pass --csv to also write the CSV)
 processed_dir = Path('../data/processed')
-processed_dir.mkdir(parents=True, exist_ok=True)
-output_path = processed_dir / 'field_of_study_processed.csv'
+export_csv = '--csv' in sys.argv[1:]
 
-df_final.to_csv(output_path, index=False)
+output_path, csv_path = write_processed(df_final, processed_dir, export_csv=export_csv)
 print(f"\nSuccessfully exported processed data to: {output_path}")
+if csv_path is not None:
+    print(f"CSV export written to: {csv_path}")
+
+# Pre-aggregated cube for group-by queries (median ROI by field, credential, control, ...)
+cube = build_cube(df_final, processed_dir)
+print(f"Aggregate cube with {cube.n_cells} cells written to: {processed_dir / CUBE_NAME}")
 print("This file is now ready for analysis and visualization.")
+profiler.end(rows_out=len(df_final))
+
+print("\nProfile:")
+print(profiler.report())
+print("Written to: {} and {}".format(*profiler.save()))
 
@@ -2,31 +2,45 @@
 # coding: utf-8
 
 # College Scorecard ROI Analysis - Data Exploration & Analysis
+#
+# Each block is timed by the profiler (written to data/profiles/); previews,
+# info() and describe() output only run with --debug (or SCORECARD_DEBUG=1).
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
-import statsmodels.api as sm
-from statsmodels.stats.outliers_influence import variance_inflation_factor
+import time
 from pathlib import Path
+from bootstrap import median_ranking_ci
+from figure_jobs import FigureJob, render_jobs, report
+from profiling import Profiler
+from store import read_processed
+from vif import reduce_vif, vif_table
 
 # Create directory to save figures
 figures_dir = Path('../figures')
 figures_dir.mkdir(parents=True, exist_ok=True)
 
-# Configure plot style
-plt.style.use("seaborn-v0_8")
-sns.set_palette("Set2")
+# Plot style, applied in each figure worker
+plot_style = "seaborn-v0_8"
+plot_palette = "Set2"
 
 print("Current working directory:", os.getcwd())
 
+profiler = Profiler('02_analysis')
+debug = profiler.debug
+
 # Load processed data
-field_of_study = pd.read_csv("../data/processed/field_of_study_processed.csv")
+profiler.stage("Load processed data")
+field_of_study = read_processed("../data/processed")
 print("Processed data loaded.")
 
-print(field_of_study.head())
+# Zero debt (ROI) and payments that never cover interest (PAYBACK_YEARS) are
+# stored as inf; treat them as missing for the statistics and plots below
+field_of_study = field_of_study.replace([np.inf, -np.inf], np.nan)
+
+if debug:
+    print(field_of_study.head())
 
 # Rename some variables for clarity
 field_of_study = field_of_study.rename(columns={
@@ -37,22 +51,28 @@ field_of_study = field_of_study.rename(columns={
 })
 
 # Fix institution type values
-field_of_study["PUBL_OR_PRIV"] = field_of_study["PUBL_OR_PRIV"].replace({
+field_of_study["PUBL_OR_PRIV"] = field_of_study["PUBL_OR_PRIV"].cat.rename_categories({
     "Private, nonprofit": "Private non-profit",
     "Private, for-profit": "Private for-profit"
 })
 
 print("Data shape:", field_of_study.shape)
-field_of_study.info()
+profiler.end(rows_out=len(field_of_study))
+
+if debug:
+    profiler.stage("Summary statistics", rows_in=len(field_of_study))
+    field_of_study.info()
 
-# Summary statistics
-print(field_of_study.describe(include="all"))
+    # Summary statistics
+    print(field_of_study.describe(include="all"))
 
-# Value counts for categorical features
-for col in field_of_study.select_dtypes(include="object").columns:
-    print(f"\nValue counts for {col}:\n", field_of_study[col].value_counts().head())
+    # Value counts for categorical features
+    for col in field_of_study.select_dtypes(include=["object", "category"]).columns:
+        print(f"\nValue counts for {col}:\n", field_of_study[col].value_counts().head())
+    profiler.end()
 
 # Remove redundant variables
+profiler.stage("Remove redundant variables", rows_in=len(field_of_study))
 field_of_study = field_of_study.drop(
     columns=[
         "DEBT_ALL_STGP_EVAL_MDN",
@@ -70,11 +90,14 @@ field_of_study = field_of_study.drop(
 print("Columns after dropping redundant:")
 print(field_of_study.columns)
 
-print(field_of_study.head())
-print("Missing values per column:")
-print(field_of_study.isnull().sum())
+if debug:
+    print(field_of_study.head())
+    print("Missing values per column:")
+    print(field_of_study.isnull().sum())
+profiler.end(rows_out=len(field_of_study))
 
 # Multicollinearity check using VIF
+profiler.stage("Multicollinearity check (VIF)", rows_in=len(field_of_study))
 features = [
     "EARN_MDN_5YR",
     "DEBT_ALL_STGP_ANY_MDN",
@@ -85,131 +108,108 @@ features = [
     "PAYBACK_YEARS"
 ]
 X = field_of_study[features].dropna()
-X_const = sm.add_constant(X)
 
-vif_df = pd.DataFrame()
-vif_df["Feature"] = X.columns
-vif_df["VIF"] = [variance_inflation_factor(X_const.values, i+1)
-                 for i in range(len(X.columns))]
+vif_df = vif_table(X)
 print(vif_df.sort_values("VIF", ascending=False))
 
-def reduce_vif(X, thresh=10.0):
-    dropped = True
-    while dropped:
-        dropped = False
-        X_const = sm.add_constant(X)
-        vif = [variance_inflation_factor(X_const.values, i+1) for i in range(len(X.columns))]
-        max_vif = max(vif)
-        if max_vif > thresh:
-            maxloc = vif.index(max_vif)
-            print(f"Dropping '{X.columns[maxloc]}' with VIF={max_vif:.2f}")
-            X = X.drop(columns=[X.columns[maxloc]])
-            dropped = True
-    return X
-
 X_reduced = reduce_vif(X, thresh=10.0)
 remaining_features = X_reduced.columns.tolist()
 print("Remaining features:", remaining_features)
+profiler.end(rows_out=len(X))
 
 # Create reduced dataframe
+profiler.stage("Reduced dataframe and ROI score", rows_in=len(field_of_study))
 field_of_study_reduced = field_of_study[remaining_features + [
     "DEG_DEPT", "UNI_NAME", "PUBL_OR_PRIV", "CREDENTIAL_LEVEL_NAME", "MAJOR_FIELD", "ROI_CATEGORY"
 ]]
 
-print(field_of_study_reduced.head())
-
-# Numeric distributions
-field_of_study_reduced.hist(bins=50, figsize=(12, 10))
-plt.suptitle("Distributions of Numeric Features")
-figure_path = figures_dir / 'notebook2' / 'distribution_of_numeric_features.png'
-plt.savefig(figure_path, bbox_inches='tight')
-plt.show()
+if debug:
+    print(field_of_study_reduced.head())
 
-# Class size distribution
-field_of_study_reduced["CLASS_SIZE"].hist(bins=50, range=(0, 400))
-plt.title("Distribution of Class Size")
-plt.xlim(0, 400)
-figure_path = figures_dir / 'notebook2' / 'distribution_of_class_size.png'
-plt.savefig(figure_path, bbox_inches='tight')
-plt.show()
+# Numeric distributions and class size (rendered with the other figures below)
+jobs = [
+    FigureJob('notebook2/distribution_of_numeric_features.png', 'hist', 'reduced', columns=remaining_features,
+              options={'bins': 50, 'figsize': (12, 10), 'suptitle': "Distributions of Numeric Features"}),
+    FigureJob('notebook2/distribution_of_class_size.png', 'hist', 'reduced', columns=["CLASS_SIZE"],
+              options={'column': "CLASS_SIZE", 'bins': 50, 'range': (0, 400),
+                       'title': "Distribution of Class Size", 'xlim': (0, 400)}),
+]
 
 # ROI numeric score
 field_of_study_reduced["ROI_Numeric_Score"] = (
     field_of_study_reduced["EARN_MDN_5YR"] / field_of_study_reduced["DEBT_ALL_STGP_ANY_MDN"]
 )
-print(field_of_study_reduced["ROI_Numeric_Score"].describe())
-
-# Aggregate by major field
-df_no_other = field_of_study_reduced[
-    field_of_study_reduced["MAJOR_FIELD"].str.strip().str.lower() != "other"
-].copy()
+if debug:
+    print(field_of_study_reduced["ROI_Numeric_Score"].describe())
+profiler.end(rows_out=len(field_of_study_reduced))
 
+# Aggregate by major field: exact medians for the published figure (one
+# pass over the in-memory frame; the cube's medians are sketch estimates)
+profiler.stage("Aggregate by major field", rows_in=len(field_of_study_reduced))
 agg = (
-    df_no_other.dropna(subset=["ROI_Numeric_Score"])
-    .groupby("MAJOR_FIELD", as_index=False)
+    field_of_study_reduced.dropna(subset=["ROI_Numeric_Score"])
+    .groupby("MAJOR_FIELD", as_index=False, observed=True)
     .agg(ROI=("ROI_Numeric_Score", "median"), n=("ROI_Numeric_Score", "size"))
 )
+agg = agg[agg["MAJOR_FIELD"].astype(str).str.strip().str.lower() != "other"]
 agg = agg[agg["n"] >= 20]
-
-top7 = agg.nlargest(7, "ROI")
-bottom7 = agg.nsmallest(7, "ROI")
-
-fig, axes = plt.subplots(1, 2, figsize=(16, 8), sharex=False)
-
-order_top = top7.sort_values("ROI", ascending=False)["MAJOR_FIELD"]
-sns.barplot(x="ROI", y="MAJOR_FIELD", data=top7,
-            order=order_top, ax=axes[0], errorbar=None)
-axes[0].set_title("Top 7 Fields of Study by ROI (Median)")
-axes[0].set_xlabel("ROI (Earnings / Debt)")
-axes[0].set_ylabel("Field of Study")
-
-order_bot = bottom7.sort_values("ROI", ascending=True)["MAJOR_FIELD"]
-sns.barplot(x="ROI", y="MAJOR_FIELD", data=bottom7,
-            order=order_bot, ax=axes[1], errorbar=None)
-axes[1].set_title("Bottom 7 Fields of Study by ROI (Median)")
-axes[1].set_xlabel("ROI (Earnings / Debt)")
-axes[1].set_ylabel("")
-
-plt.tight_layout()
-figure_path = figures_dir / 'notebook2' / 'top_bottom_7.png'
-plt.savefig(figure_path, bbox_inches='tight')
-plt.show()
+profiler.end(rows_out=len(agg))
+
+# How settled is the ranking? Bootstrap CIs of each field's median ROI and the
+# share of resamples in which it stays in the top / bottom 7
+profiler.stage("Bootstrap CIs for the ranking", rows_in=len(field_of_study))
+ranking_ci = median_ranking_ci(field_of_study, "ROI_EARNINGS_TO_DEBT", "MAJOR_FIELD", k=7, min_count=20)
+print("\nMedian ROI by major field with 95% bootstrap CIs:")
+print(ranking_ci.round(3))
+(figures_dir / 'notebook2').mkdir(parents=True, exist_ok=True)
+ranking_ci.to_csv(figures_dir / 'notebook2' / 'top_bottom_7_ci.csv')
+profiler.end(rows_out=len(ranking_ci))
+
+jobs.append(FigureJob('notebook2/top_bottom_7.png', 'top_bottom', 'agg', options={
+    'value': "ROI", 'label': "MAJOR_FIELD", 'n': 7, 'figsize': (16, 8),
+    'titles': ("Top 7 Fields of Study by ROI (Median)", "Bottom 7 Fields of Study by ROI (Median)"),
+    'axis_labels': ("ROI (Earnings / Debt)", "Field of Study"),
+}))
 
 # Storytelling visualizations
 if {"EARN_MDN_5YR", "DEBT_ALL_STGP_ANY_MDN"}.issubset(field_of_study_reduced.columns):
-    plt.figure(figsize=(10, 6))
-    sns.scatterplot(
-        x="DEBT_ALL_STGP_ANY_MDN", y="EARN_MDN_5YR",
-        hue="PUBL_OR_PRIV", data=field_of_study_reduced, alpha=0.7
-    )
-    plt.title("Earnings vs Debt by Institution Control")
-    plt.xlabel("Median Debt (All Federal Loans)")
-    plt.ylabel("Median Earnings (5 Years After Graduation)")
-    figure_path = figures_dir / 'notebook2' / 'earnings_debts_by_institution_control.png'
-    plt.savefig(figure_path, bbox_inches='tight')
-    plt.show()
+    # Every row, binned on a grid colored by control (outliers drawn as points)
+    jobs.append(FigureJob('notebook2/earnings_debts_by_institution_control.png', 'density', 'reduced',
+                          columns=["DEBT_ALL_STGP_ANY_MDN", "EARN_MDN_5YR", "PUBL_OR_PRIV"], options={
+        'x': "DEBT_ALL_STGP_ANY_MDN", 'y': "EARN_MDN_5YR", 'hue': "PUBL_OR_PRIV", 'figsize': (10, 6),
+        'title': "Earnings vs Debt by Institution Control",
+        'xlabel': "Median Debt (All Federal Loans)",
+        'ylabel': "Median Earnings (5 Years After Graduation)",
+    }))
 
 if {"ROI_Numeric_Score", "CREDENTIAL_LEVEL_NAME"}.issubset(field_of_study_reduced.columns):
-    plt.figure(figsize=(10, 6))
-    sns.boxplot(x="CREDENTIAL_LEVEL_NAME", y="ROI_Numeric_Score",
-        data=field_of_study_reduced, palette="Set2")
-    plt.title("Distribution of ROI by Credential Level")
-    plt.xlabel("Credential Level")
-    plt.ylabel("ROI (Earnings / Debt)")
-    plt.xticks(rotation=30)
-    figure_path = figures_dir / 'notebook2' / 'distribution_of_roi_by_credential_level.png'
-    plt.savefig(figure_path, bbox_inches='tight')
-    plt.show()
+    jobs.append(FigureJob('notebook2/distribution_of_roi_by_credential_level.png', 'box', 'reduced',
+                          columns=["CREDENTIAL_LEVEL_NAME", "ROI_Numeric_Score"], options={
+        'x': "CREDENTIAL_LEVEL_NAME", 'y': "ROI_Numeric_Score", 'palette': "Set2", 'figsize': (10, 6),
+        'title': "Distribution of ROI by Credential Level",
+        'xlabel': "Credential Level",
+        'ylabel': "ROI (Earnings / Debt)",
+        'xticks_rotation': 30,
+    }))
 
 if {"ROI_Numeric_Score", "PUBL_OR_PRIV"}.issubset(field_of_study_reduced.columns):
-    plt.figure(figsize=(8, 6))
-    sns.barplot(
-        x="PUBL_OR_PRIV", y="ROI_Numeric_Score",
-        data=field_of_study_reduced, estimator="mean", errorbar="sd", palette="Set2"
-    )
-    plt.title("Average ROI by Institution Type")
-    plt.xlabel("Institution Type")
-    plt.ylabel("Average ROI (Earnings / Debt)")
-    figure_path = figures_dir / 'notebook2' / 'avg_roi_by_institution_type.png'
-    plt.savefig(figure_path, bbox_inches='tight')
-    plt.show()
+    jobs.append(FigureJob('notebook2/avg_roi_by_institution_type.png', 'bar', 'reduced',
+                          columns=["PUBL_OR_PRIV", "ROI_Numeric_Score"], options={
+        'x': "PUBL_OR_PRIV", 'y': "ROI_Numeric_Score", 'estimator': "mean", 'errorbar': "sd", 'palette': "Set2",
+        'figsize': (8, 6),
+        'title': "Average ROI by Institution Type",
+        'xlabel': "Institution Type",
+        'ylabel': "Average ROI (Earnings / Debt)",
+    }))
+
+# Render all figures headless on a process pool; the frames are shared with each worker once
+profiler.stage("Render figures", rows_in=len(field_of_study_reduced))
+start = time.perf_counter()
+results = render_jobs(jobs, {"reduced": field_of_study_reduced, "agg": agg}, figures_dir,
+                      style=plot_style, palette=plot_palette)
+print(report(results, time.perf_counter() - start))
+profiler.end(rows_out=len(results))
+
+print("\nProfile:")
+print(profiler.report())
+print("Written to: {} and {}".format(*profiler.save()))
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Benchmark Suite
+#
+# Times each step of the pipeline (load, clean, ROI features, filtering,
+# categorizing, the institution join, cube aggregation, VIF and figure
+# rendering) on synthetic data of a given scale (see synthetic.py), which is
+# generated on first use. Every step runs --repeat times under the profiler
+# and its best and median wall times are appended, with the git commit, host
+# and library versions, to data/benchmarks/history.jsonl. A step is flagged as
+# a regression when its best time is more than REGRESSION_THRESHOLD slower
+# than the median of the last BASELINE_RUNS runs at the same scale on the same
+# host (and slower by at least MIN_DELTA_S, so tiny steps do not flap):
+#     python benchmark.py --scale 100k
+#     python benchmark.py --scale 1m --repeat 5 --fail-on-regression
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cube import build_cube
+from figure_jobs import FigureJob, render_jobs
+from institutions import build_institution_dimension, join_institutions, read_institutions
+from loader import load_field_of_study
+from profiling import Profiler
+from synthetic import SCALES, SYNTHETIC_DIR, ensure_synthetic, parse_rows
+from transforms import NUMERIC_COLS, add_roi_features, categorize, clean, filter_rows, select_columns
+from vif import reduce_vif, vif_table
+
+BENCH_DIR = Path('../data/benchmarks')
+HISTORY_NAME = 'history.jsonl'
+DEFAULT_REPEAT = 3
+BASELINE_RUNS = 5
+REGRESSION_THRESHOLD = 0.20
+MIN_DELTA_S = 0.05
+
+STEPS = ['load', 'clean', 'roi', 'filter', 'categorize', 'join', 'aggregate', 'vif', 'render']
+VIF_FEATURES = ['EARN_MDN_5YR', 'DEBT_ALL_STGP_ANY_MDN', 'IPEDSCOUNT2', 'ROI_EARNINGS_TO_DEBT', 'DEBT_TO_INCOME_RATIO',
+                'MONTHLY_PAYMENT_PCT', 'PAYBACK_YEARS']
+
+
+def _aggregate(df):
+    cube = build_cube(df)
+    for by in (['MAJOR_FIELD'], ['CREDLEV', 'CONTROL'], ['MAJOR_FIELD', 'CREDLEV']):
+        cube.query('ROI_EARNINGS_TO_DEBT', by=by, quantiles=(0.25, 0.5, 0.75))
+    df.groupby(['MAJOR_FIELD', 'CREDENTIAL_LEVEL_NAME'], observed=True)['ROI_EARNINGS_TO_DEBT'].median()
+    return cube.n_cells
+
+
+def _vif(df):
+    X = df[VIF_FEATURES].replace([np.inf, -np.inf], np.nan).dropna()
+    vif_table(X)
+    return reduce_vif(X, thresh=10.0, verbose=False)
+
+
+def _render(df, workers):
+    columns = ['EARN_MDN_5YR', 'DEBT_ALL_STGP_ANY_MDN', 'ROI_EARNINGS_TO_DEBT', 'PAYBACK_YEARS']
+    frame = df[columns + ['CONTROL']].replace([np.inf, -np.inf], np.nan)
+    jobs = [
+        FigureJob('hist.png', 'hist', 'df', columns=columns, options={'bins': 50, 'figsize': (12, 10)}),
+        FigureJob('density.png', 'density', 'df', columns=['DEBT_ALL_STGP_ANY_MDN', 'EARN_MDN_5YR', 'CONTROL'],
+                  options={'x': 'DEBT_ALL_STGP_ANY_MDN', 'y': 'EARN_MDN_5YR', 'hue': 'CONTROL', 'figsize': (10, 6)}),
+    ]
+    with tempfile.TemporaryDirectory() as figures_dir:
+        return render_jobs(jobs, {'df': frame}, Path(figures_dir), workers=workers)
+
+
+def run_once(profiler, fos_path, inst_path, steps=STEPS, workers=1):
+    """One pass over the pipeline, each selected step in its own profiler stage.
+
+    The load-to-categorize chain always runs, untimed where not selected, since later steps need its output.
+    """
+
+    def step(name, func, rows_in=None):
+        if name not in steps:
+            return func()
+        with profiler.stage(name, rows_in) as stage:
+            result = func()
+            stage.rows_out = len(result) if hasattr(result, '__len__') else None
+        return result
+
+    df = step('load', lambda: load_field_of_study(fos_path))
+    df = step('clean', lambda: clean(select_columns(df, copy=False), NUMERIC_COLS, copy=False), len(df))
+    df = step('roi', lambda: add_roi_features(df, copy=False), len(df))
+    df = step('filter', lambda: filter_rows(df), len(df))
+    df = step('categorize', lambda: categorize(df, copy=False), len(df))
+    if 'join' in steps:
+        step('join', lambda: join_institutions(df, build_institution_dimension(read_institutions(inst_path)))[0],
+             len(df))
+    if 'aggregate' in steps:
+        step('aggregate', lambda: _aggregate(df), len(df))
+    if 'vif' in steps:
+        step('vif', lambda: _vif(df), len(df))
+    if 'render' in steps:
+        step('render', lambda: _render(df, workers), len(df))
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _environment():
+    import matplotlib
+    return {
+        'host': platform.node(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'matplotlib': matplotlib.__version__,
+    }
+
+
+def summarize(records, steps=STEPS):
+    """Per-step best / median wall time, CPU time and peak RSS over the repeats."""
+    summary = {}
+    for step in steps:
+        runs = [record for record in records if record['stage'] == step]
+        if not runs:
+            continue
+        wall = [record['wall_s'] for record in runs]
+        summary[step] = {
+            'min_s': round(min(wall), 6),
+            'median_s': round(float(np.median(wall)), 6),
+            'cpu_s': round(float(np.median([record['cpu_s'] for record in runs])), 6),
+            'peak_rss_mb': max(record['peak_rss_mb'] for record in runs),
+            'rows_in': runs[0]['rows_in'],
+            'rows_out': runs[0]['rows_out'],
+        }
+    return summary
+
+
+def read_history(path):
+    if not Path(path).exists():
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(summary, history, rows, host, runs=BASELINE_RUNS, threshold=REGRESSION_THRESHOLD, min_delta=MIN_DELTA_S):
+    """Each step's best time against the median best time of the last `runs` comparable runs.
+
+    Returns {step: {'baseline_s', 'change', 'regression'}}; baseline_s is None without history.
+    """
+    previous = [entry for entry in history if entry['rows'] == rows and entry['environment']['host'] == host]
+    result = {}
+    for step, stats in summary.items():
+        past = [entry['steps'][step]['min_s'] for entry in previous if step in entry['steps']][-runs:]
+        if not past:
+            result[step] = {'baseline_s': None, 'change': None, 'regression': False}
+            continue
+        baseline = float(np.median(past))
+        change = stats['min_s'] / baseline - 1 if baseline > 0 else 0.0
+        result[step] = {
+            'baseline_s': round(baseline, 6),
+            'change': round(change, 4),
+            'regression': change > threshold and stats['min_s'] - baseline > min_delta,
+        }
+    return result
+
+
+def format_summary(summary, comparison):
+    lines = [f"{'step':<12} {'best s':>8} {'median s':>9} {'cpu s':>8} {'peak MB':>8} {'rows in':>10} "
+             f"{'baseline s':>10} {'change':>8}"]
+    for step, stats in summary.items():
+        versus = comparison[step]
+        baseline = '' if versus['baseline_s'] is None else f"{versus['baseline_s']:.3f}"
+        change = '' if versus['change'] is None else f"{versus['change']:+.1%}"
+        flag = '  REGRESSION' if versus['regression'] else ''
+        rows_in = '' if stats['rows_in'] is None else stats['rows_in']
+        lines.append(f"{step:<12} {stats['min_s']:8.3f} {stats['median_s']:9.3f} {stats['cpu_s']:8.3f} "
+                     f"{stats['peak_rss_mb']:8.1f} {rows_in:>10} {baseline:>10} {change:>8}{flag}")
+    return '\n'.join(lines)
+
+
+def run_benchmark(scale, repeat=DEFAULT_REPEAT, steps=STEPS, workers=1, data_dir=None, bench_dir=BENCH_DIR,
+                  record=True):
+    """Run the suite at one scale; returns (entry, comparison) and appends the entry to the history."""
+    rows = parse_rows(scale)
+    start = time.perf_counter()
+    fos_path, inst_path = ensure_synthetic(rows, data_dir or SYNTHETIC_DIR / str(rows))
+    print(f"Synthetic data ({rows:,} rows) ready in {time.perf_counter() - start:.2f}s: {fos_path.parent}")
+
+    profiler = Profiler(f'benchmark-{scale}', debug=False)
+    for i in range(repeat):
+        with profiler.stage(f'run {i + 1}'):
+            run_once(profiler, fos_path, inst_path, steps, workers)
+    summary = summarize(profiler.records, steps)
+    entry = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': _git_commit(),
+        'scale': scale,
+        'rows': rows,
+        'repeat': repeat,
+        'environment': _environment(),
+        'steps': summary,
+    }
+    history_path = Path(bench_dir) / HISTORY_NAME
+    comparison = compare(summary, read_history(history_path), rows, entry['environment']['host'])
+    entry['regressions'] = [step for step, versus in comparison.items() if versus['regression']]
+    profiler.save(bench_dir)
+    if record:
+        history_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(history_path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+    return entry, comparison
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline steps on synthetic Scorecard data.")
+    parser.add_argument('--scale', default='100k', help=f"rows of synthetic data, e.g. 250000 or one of {list(SCALES)}")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="runs per step (the best one is compared)")
+    parser.add_argument('--steps', nargs='+', choices=STEPS, default=STEPS, help="steps to time")
+    parser.add_argument('--workers', type=int, default=1, help="processes for the render step")
+    parser.add_argument('--data', type=Path, default=None, help="synthetic data directory (default: ../data/synthetic/ROWS)")
+    parser.add_argument('--no-record', action='store_true', help="do not append this run to the history")
+    parser.add_argument('--fail-on-regression', action='store_true', help="exit with status 1 on any regression")
+    args = parser.parse_args()
+
+    steps = [step for step in STEPS if step in args.steps]
+    entry, comparison = run_benchmark(args.scale, args.repeat, steps, args.workers, args.data, record=not args.no_record)
+    print(f"\nBenchmark at {entry['scale']} ({entry['rows']:,} rows, best of {entry['repeat']}, "
+          f"commit {entry['commit'] or 'unknown'}):")
+    print(format_summary(entry['steps'], comparison))
+    if entry['regressions']:
+        print(f"\nRegressions (> {REGRESSION_THRESHOLD:.0%} slower than the median of the last {BASELINE_RUNS} runs): "
+              f"{', '.join(entry['regressions'])}")
+    elif not args.no_record:
+        print(f"\nNo regressions; recorded in {BENCH_DIR / HISTORY_NAME}")
+    sys.exit(1 if args.fail_on_regression and entry['regressions'] else 0)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Command Line Entry Points
+#
+# One `scorecard` command (plus scorecard-preprocess / -analyze / -fairness)
+# for the scripts in this directory, installed by `pip install .` from the
+# repository root (see pyproject.toml); preprocess(), analyze() and fairness()
+# can also be called from Python with a list of arguments. Each command runs
+# its script as __main__ from the Scripts/ directory of the project checkout
+# (this one, $SCORECARD_HOME, or the checkout the current directory is in), so
+# the ../data and ../figures paths resolve as when the script is run by hand,
+# and passes the remaining arguments through.
+# Commands run in batch mode: MPLBACKEND defaults to Agg, so nothing selects a
+# GUI backend. matplotlib, seaborn, statsmodels and scipy are only imported by
+# the functions that plot or fit, never with a module; `scorecard startup`
+# measures each command's cold start (interpreter plus its imports, in a fresh
+# process) and saves it to data/benchmarks/startup.json:
+#     scorecard preprocess --csv
+#     scorecard-fairness --debug
+#     scorecard startup
+#     python cli.py analyze             # same, without installing
+
+import argparse
+import ast
+import json
+import os
+import runpy
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+HOME_ENV = 'SCORECARD_HOME'
+COMMANDS = {
+    'preprocess': '01_preprocess.py',
+    'analyze': '02_analysis.py',
+    'fairness': '03_fairness.py',
+    'pipeline': 'pipeline.py',
+    'query': 'query.py',
+    'neighbors': 'neighbors.py',
+    'regression': 'regression.py',
+    'benchmark': 'benchmark.py',
+}
+# Imports that should never happen just by starting a command
+HEAVY_MODULES = ['matplotlib', 'seaborn', 'statsmodels', 'scipy']
+STARTUP_NAME = 'startup.json'
+STARTUP_REPEAT = 3
+
+
+def scripts_dir():
+    """Scripts/ of the project checkout whose data the commands use.
+
+    This directory when it is the checkout (editable installs), else
+    $SCORECARD_HOME, else the checkout containing the current directory.
+    """
+    home = os.environ.get(HOME_ENV)
+    candidates = [SCRIPTS_DIR.parent] + ([Path(home)] if home else []) + [Path.cwd(), *Path.cwd().parents]
+    for root in candidates:
+        if (root / 'Scripts' / COMMANDS['preprocess']).exists():
+            return (root / 'Scripts').resolve()
+    raise SystemExit(f"No project checkout found: run from inside the repository or set {HOME_ENV} to it")
+
+
+def run_script(command, args=()):
+    """Run a command's script as __main__ with `args` as its command line.
+
+    The working directory, sys.argv and sys.path are restored afterwards, so
+    this can be called from Python as well as from a console script.
+    """
+    scripts = scripts_dir()
+    path = scripts / COMMANDS[command]
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    saved = os.getcwd(), sys.argv, list(sys.path)
+    sys.path.insert(0, str(scripts))
+    os.chdir(scripts)
+    sys.argv = [str(path), *args]
+    try:
+        runpy.run_path(str(path), run_name='__main__')
+    finally:
+        os.chdir(saved[0])
+        sys.argv, sys.path[:] = saved[1], saved[2]
+
+
+def script_imports(path):
+    """Modules a script imports at its top level (including under `if __name__ == '__main__':`)."""
+    modules = []
+    nodes = list(ast.parse(Path(path).read_text()).body)
+    while nodes:
+        node = nodes.pop(0)
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+        elif isinstance(node, ast.If):
+            nodes[:0] = node.body
+    return list(dict.fromkeys(modules))
+
+
+_PROBE = '''
+import importlib, json, sys, time
+start = time.perf_counter()
+for module in sys.argv[1:]:
+    importlib.import_module(module)
+print(json.dumps({'import_s': time.perf_counter() - start,
+                  'heavy': [m for m in %r if m in sys.modules]}))
+'''
+
+
+def measure_startup(command, repeat=STARTUP_REPEAT):
+    """Best-of-`repeat` cold start of a command: process wall time and the time spent in its imports."""
+    scripts = scripts_dir()
+    modules = script_imports(scripts / COMMANDS[command])
+    env = {**os.environ, 'MPLBACKEND': os.environ.get('MPLBACKEND', 'Agg')}
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', _PROBE % HEAVY_MODULES, *modules], cwd=scripts, env=env,
+                             capture_output=True, text=True, check=True).stdout
+        runs.append({'wall_s': time.perf_counter() - start, **json.loads(out)})
+    best = min(runs, key=lambda run: run['wall_s'])
+    return {'command': command, 'wall_s': round(best['wall_s'], 4), 'import_s': round(best['import_s'], 4),
+            'heavy_modules': best['heavy'], 'imports': modules}
+
+
+def startup_report(commands=None, repeat=STARTUP_REPEAT, benchmarks_dir=Path('../data/benchmarks')):
+    """Cold start of every command next to a bare interpreter; saved to benchmarks_dir/startup.json."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+    interpreter = (time.perf_counter() - start) / repeat
+    results = [measure_startup(command, repeat) for command in (commands or COMMANDS)]
+    report = {'python': sys.version.split()[0], 'interpreter_s': round(interpreter, 4), 'commands': results}
+    path = (scripts_dir() / benchmarks_dir / STARTUP_NAME).resolve()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2))
+    return report, path
+
+
+def format_startup(report):
+    lines = [f"Bare interpreter: {report['interpreter_s'] * 1000:.0f} ms",
+             f"{'command':<12} {'cold start ms':>13} {'imports ms':>11}  heavy modules loaded"]
+    for result in report['commands']:
+        heavy = ', '.join(result['heavy_modules']) or 'none'
+        lines.append(f"{result['command']:<12} {result['wall_s'] * 1000:13.0f} {result['import_s'] * 1000:11.0f}  "
+                     f"{heavy}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='scorecard', description="College Scorecard ROI analysis scripts.")
+    parser.add_argument('command', choices=[*COMMANDS, 'startup'],
+                        help="script to run, or 'startup' to measure cold-start times")
+    parser.add_argument('args', nargs=argparse.REMAINDER, help="arguments passed on to the script")
+    args = parser.parse_args(argv)
+    if args.command == 'startup':
+        unknown = [command for command in args.args if command not in COMMANDS]
+        if unknown:
+            parser.error(f"unknown command(s) for startup: {', '.join(unknown)}")
+        report, path = startup_report(args.args or None)
+        print(format_startup(report))
+        print(f"\nWritten to: {path}")
+        return
+    run_script(args.command, args.args)
+
+
+def preprocess(args=None):
+    """01_preprocess.py with `args` (default: the command line), e.g. preprocess(['--csv'])."""
+    run_script('preprocess', sys.argv[1:] if args is None else args)
+
+
+def analyze(args=None):
+    """02_analysis.py with `args` (default: the command line)."""
+    run_script('analyze', sys.argv[1:] if args is None else args)
+
+
+def fairness(args=None):
+    """03_fairness.py with `args` (default: the command line)."""
+    run_script('fairness', sys.argv[1:] if args is None else args)
+
+
+if __name__ == '__main__':
+    main()
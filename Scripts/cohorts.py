@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Multi-Year Cohort Ingestion
+#
+# Ingests every yearly Field of Study release found in data/raw/field_of_study/
+# (e.g. FieldOfStudyData1718_1819_PP.csv) into one Parquet dataset partitioned
+# by YEAR. Each file is parsed and run through the same select / clean / ROI /
+# filter / categorize steps as 01_preprocess.py, on a process pool, and written
+# straight to its own YEAR=... partition; the rows failing validation go to
+# data/quarantine/field_of_study_<year>_quarantine.parquet. A manifest records
+# the SHA-256 of each ingested file and a digest of the rules' code, so
+# re-running only parses new or changed years (or all of them after the rules
+# change); a year whose file is gone is dropped from the dataset. With
+# --memory-limit each year is streamed through the rules in chunks instead of
+# loaded whole:
+#     python cohorts.py
+#     python cohorts.py --workers 4 --force 2019
+#     python cohorts.py --memory-limit 2G
+
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+import compact
+import loader
+import outofcore
+import roi_metrics
+import store
+import transforms
+import validation
+from loader import FOS_COLUMNS, FOS_DTYPES, iter_field_of_study, load_field_of_study
+from outofcore import MEMORY_ENV, data_budget, memory_limit, plan_chunk_rows, process_chunk
+from rawdata import cached_digest
+from store import PROCESSED_DIR, DatasetWriter, read_processed
+from validation import QUARANTINE_DIR, QUARANTINE_NAME, QuarantineWriter
+
+COHORTS_DIR = Path('../data/raw/field_of_study')
+YEARLY_NAME = 'field_of_study_by_year.parquet'
+# Names starting with '_' are ignored by Parquet dataset readers
+MANIFEST_NAME = '_ingested.json'
+YEAR_COL = 'YEAR'
+
+# FieldOfStudyData1718_1819_PP.csv -> 2019 (the later of the two award years);
+# otherwise any four-digit year in the file name
+_PAIR_PATTERN = re.compile(r'(\d{2})(\d{2})_(\d{2})(\d{2})')
+_YEAR_PATTERN = re.compile(r'(?<!\d)((?:19|20)\d{2})(?!\d)')
+
+
+def cohort_year(path):
+    """The release year a Field of Study file covers, from its name."""
+    name = Path(path).name
+    match = _PAIR_PATTERN.search(name)
+    if match:
+        return 2000 + int(match.group(4))
+    match = _YEAR_PATTERN.search(name)
+    if match:
+        return int(match.group(1))
+    raise ValueError(f"Cannot tell the cohort year of '{name}'")
+
+
+def discover_cohorts(raw_dir=COHORTS_DIR):
+    """{year: path} for every CSV in raw_dir, sorted by year."""
+    cohorts = {}
+    for path in sorted(Path(raw_dir).glob('*.csv')):
+        year = cohort_year(path)
+        if year in cohorts:
+            raise ValueError(f"Two files for {year}: '{cohorts[year].name}' and '{path.name}'")
+        cohorts[year] = path
+    return dict(sorted(cohorts.items()))
+
+
+def rules_digest():
+    """Hash of the loading, cleaning, ROI, filtering and writing code; a change re-ingests every year."""
+    modules = (loader, compact, roi_metrics, transforms, validation, outofcore, store)
+    source = '\n'.join(inspect.getsource(module) for module in modules)
+    return hashlib.sha256(source.encode()).hexdigest()[:20]
+
+
+def process_cohort(path, year, dataset_path, limit=None):
+    """Parse one yearly file, apply the processing rules and write its YEAR partition.
+
+    With a memory limit (bytes) the file is streamed through the rules in chunks
+    sized to fit it (see outofcore.py) instead of being loaded whole.
+    """
+    start = time.perf_counter()
+    header = pd.read_csv(path, nrows=0).columns
+    present = [col for col in FOS_COLUMNS if col in header]
+    # Older releases lack some columns (e.g. 5-year earnings); they stay empty
+    missing = [col for col in FOS_COLUMNS if col not in header]
+    if limit:
+        budget, _ = data_budget(limit)
+        chunks = iter_field_of_study(path, columns=present, chunksize=plan_chunk_rows(path, budget, present))
+    else:
+        chunks = [load_field_of_study(path, columns=present)]
+
+    partition = Path(dataset_path) / f'{YEAR_COL}={year}'
+    with DatasetWriter(partition, partition_cols=[], tmp_path=partition.with_name('_' + partition.name + '.tmp')) \
+            as writer, QuarantineWriter(f'{QUARANTINE_NAME}_{year}') as quarantine:
+        for df in chunks:
+            df = df.assign(**{col: pd.Series(index=df.index, dtype=FOS_DTYPES[col]) for col in missing})
+            df = process_chunk(df, quarantine=quarantine)
+            if len(df) or not writer.parts:
+                writer.write(df)
+    return {'year': year, 'rows': writer.rows, 'quarantined': quarantine.writer.rows, 'missing_columns': missing,
+            'seconds': round(time.perf_counter() - start, 3)}
+
+
+def _read_manifest(dataset_path):
+    path = Path(dataset_path) / MANIFEST_NAME
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def _write_manifest(dataset_path, manifest):
+    path = Path(dataset_path) / MANIFEST_NAME
+    tmp_path = path.with_suffix('.tmp')
+    tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    tmp_path.replace(path)
+
+
+def ingest(raw_dir=COHORTS_DIR, processed_dir=PROCESSED_DIR, workers=None, force=(), limit=None):
+    """Bring the year-partitioned dataset up to date with raw_dir.
+
+    Years whose file checksum and rules digest match the manifest are skipped;
+    years no longer in raw_dir lose their partition, quarantine files and manifest entry.
+    With a memory limit (bytes, shared by the workers) years are streamed in chunks.
+    Returns one row per year with whether it was parsed, its row count, quarantined rows and seconds.
+    """
+    dataset_path = Path(processed_dir) / YEARLY_NAME
+    dataset_path.mkdir(parents=True, exist_ok=True)
+    manifest = _read_manifest(dataset_path)
+    rules = rules_digest()
+
+    cohorts = discover_cohorts(raw_dir)
+    for year in sorted(set(manifest) - {str(year) for year in cohorts}):
+        shutil.rmtree(dataset_path / f'{YEAR_COL}={year}', ignore_errors=True)
+        for side_file in QUARANTINE_DIR.glob(f'{QUARANTINE_NAME}_{year}_*'):
+            if side_file.is_dir():
+                shutil.rmtree(side_file)
+            else:
+                side_file.unlink()
+        print(f"Removed {year}: '{manifest.pop(year)['file']}' is no longer in {raw_dir}")
+        _write_manifest(dataset_path, manifest)
+
+    todo, report = {}, []
+    for year, path in cohorts.items():
+        checksum = cached_digest(path)
+        entry = manifest.get(str(year), {})
+        current = (entry.get('sha256') == checksum and entry.get('rules') == rules
+                   and (dataset_path / f'{YEAR_COL}={year}').exists())
+        if current and year not in force:
+            report.append({'year': year, 'file': path.name, 'ingested': False, 'rows': entry['rows'],
+                           'quarantined': entry.get('quarantined'), 'seconds': 0.0})
+        else:
+            todo[year] = (path, checksum)
+
+    workers = min(workers or os.cpu_count() or 1, max(len(todo), 1))
+    worker_limit = limit // workers if limit else None
+    with ProcessPoolExecutor(workers) as pool:
+        futures = {pool.submit(process_cohort, path, year, dataset_path, worker_limit): year for year, (path, _) in todo.items()}
+        for future in as_completed(futures):
+            result = future.result()
+            year = result['year']
+            path, checksum = todo[year]
+            manifest[str(year)] = {'file': path.name, 'sha256': checksum, 'rules': rules, 'rows': result['rows'],
+                                   'quarantined': result['quarantined'], 'missing_columns': result['missing_columns']}
+            # Saved after every year, so an interrupted run keeps the years it finished
+            _write_manifest(dataset_path, manifest)
+            report.append({'year': year, 'file': path.name, 'ingested': True, 'rows': result['rows'],
+                           'quarantined': result['quarantined'], 'seconds': result['seconds']})
+    columns = ['year', 'file', 'ingested', 'rows', 'quarantined', 'seconds']
+    return pd.DataFrame(report, columns=columns).sort_values('year')
+
+
+def read_cohorts(processed_dir=PROCESSED_DIR, columns=None, filters=None):
+    """Load the multi-year dataset; filter on YEAR to read only some releases, e.g. [('YEAR', '>=', 2018)]."""
+    return read_processed(processed_dir, columns=columns, filters=filters, dataset_name=YEARLY_NAME)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ingest every yearly Field of Study release into one dataset.")
+    parser.add_argument('--raw-dir', type=Path, default=COHORTS_DIR, help="directory of yearly CSV files")
+    parser.add_argument('--workers', type=int, default=None, help="parallel parse processes (default: all cores)")
+    parser.add_argument('--force', type=int, action='append', default=[], metavar='YEAR',
+                        help="re-ingest this year even if it is unchanged")
+    parser.add_argument('--memory-limit', default=None,
+                        help="stream each year in chunks within this limit, e.g. 2G (default: $SCORECARD_MEMORY_LIMIT "
+                             "if set, else load each year whole)")
+    args = parser.parse_args()
+
+    limit = memory_limit(args.memory_limit) if args.memory_limit or os.environ.get(MEMORY_ENV) else None
+    start = time.perf_counter()
+    report = ingest(args.raw_dir, workers=args.workers, force=set(args.force), limit=limit)
+    print(report.to_string(index=False))
+    print(f"\n{int(report['ingested'].sum())} of {len(report)} years ingested in {time.perf_counter() - start:.2f}s "
+          f"-> {PROCESSED_DIR / YEARLY_NAME}")
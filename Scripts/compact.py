@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Compact Column Types
+#
+# The dtype policy for the Field of Study frame: repeated strings (institution,
+# program and credential names, control, major field) are dictionary-encoded
+# categoricals, whole-dollar amounts and head counts are float32 (exact below
+# 2**24), and integer codes use the narrowest nullable integer type. The ROI
+# metrics stay float64. loader.py parses straight into these types, and
+# compact() applies them to any frame, downcasting floats only when exact.
+# Run directly to compare the footprint against the old float64/object layout:
+#     python compact.py
+
+import numpy as np
+import pandas as pd
+
+CATEGORY_COLS = ['INSTNM', 'CIPDESC', 'CREDDESC', 'CONTROL', 'CIP_2DIGIT', 'MAJOR_FIELD', 'CREDENTIAL_LEVEL_NAME']
+
+# Whole dollars and counts; float32 holds every integer up to 16,777,216 exactly
+FLOAT32_COLS = ['EARN_MDN_5YR', 'DEBT_ALL_STGP_ANY_MDN', 'DEBT_ALL_STGP_EVAL_MDN', 'IPEDSCOUNT2']
+
+INT_DTYPES = {
+    'UNITID': 'Int32',
+    'OPEID6': 'Int32',
+    'CIPCODE': 'Int32',
+    'CREDLEV': 'Int8',
+}
+
+
+def _exact_in_float32(values):
+    values = np.asarray(values, dtype='float64')
+    return np.array_equal(values, values.astype('float32').astype('float64'), equal_nan=True)
+
+
+def compact(df):
+    """Convert df's columns to the compact types in place (and return it).
+
+    Float columns are only narrowed when every value survives the round trip.
+    """
+    for col in CATEGORY_COLS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    for col in FLOAT32_COLS:
+        if col in df.columns and df[col].dtype == 'float64' and _exact_in_float32(df[col]):
+            df[col] = df[col].astype('float32')
+    for col, dtype in INT_DTYPES.items():
+        if col in df.columns and df[col].dtype != dtype:
+            info = np.iinfo(dtype.lower())
+            values = df[col].dropna()
+            if values.empty or (values.min() >= info.min and values.max() <= info.max):
+                df[col] = df[col].astype(dtype)
+    return df
+
+
+def memory_footprint(df):
+    """Bytes per column (strings and categories counted in full), plus a TOTAL row."""
+    usage = df.memory_usage(deep=True, index=True)
+    return pd.concat([usage, pd.Series({'TOTAL': usage.sum()})])
+
+
+def format_footprint(df):
+    usage = memory_footprint(df)
+    lines = [f"  {name:<32} {size / 2**20:8.2f} MB  {df[name].dtype if name in df.columns else ''}"
+             for name, size in usage.items() if name != 'TOTAL']
+    lines.append(f"In-memory size of {len(df)} rows x {df.shape[1]} columns: {usage['TOTAL'] / 2**20:.2f} MB")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    from store import read_processed
+
+    df = read_processed()
+    wide = df.copy()
+    for col in CATEGORY_COLS:
+        wide[col] = wide[col].astype('object')
+    for col in FLOAT32_COLS:
+        wide[col] = wide[col].astype('float64')
+    for col in INT_DTYPES:
+        wide[col] = wide[col].astype('Int64')
+    print("float64 / object layout:")
+    print(format_footprint(wide))
+    print("\ncompact layout:")
+    print(format_footprint(compact(df)))
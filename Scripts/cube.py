@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Aggregate Cube
+#
+# Materializes count / sum / min / max and a mergeable quantile sketch for the
+# ROI metrics over every combination of MAJOR_FIELD, CIP_2DIGIT, CREDLEV,
+# CONTROL and ROI_CATEGORY. Any roll-up or slice (e.g. median ROI by
+# MAJOR_FIELD, or by CREDLEV for public schools) is answered by summing cube
+# cells, without going back to the row-level data.
+#
+# The sketches are log-bucketed histograms (as in DDSketch): a value x > 0 falls
+# in bucket ceil(log_gamma(x)), so quantiles are accurate to a relative error
+# of ALPHA and two sketches merge by adding their bucket counts.
+#     python cube.py    # build from data/processed and time a few queries
+
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CUBE_DIMS = ['MAJOR_FIELD', 'CIP_2DIGIT', 'CREDLEV', 'CONTROL', 'ROI_CATEGORY']
+CUBE_METRICS = ['ROI_EARNINGS_TO_DEBT', 'EARN_MDN_5YR', 'DEBT_ALL_STGP_ANY_MDN', 'MONTHLY_PAYMENT_PCT']
+CUBE_NAME = 'roi_cube.npz'
+
+# Relative accuracy of the quantile sketches
+ALPHA = 0.005
+
+
+class RoiCube:
+    """Pre-aggregated statistics per cell (one cell per observed combination of dims)."""
+
+    def __init__(self, dims, categories, codes, measures, sketches, offsets, alpha=ALPHA):
+        self.dims = list(dims)
+        self.categories = categories    # dim -> list of values; codes index into it
+        self.codes = codes              # dim -> int array, one entry per cell
+        self.measures = measures        # metric -> {'count', 'sum', 'min', 'max'} arrays per cell
+        self.sketches = sketches        # metric -> (cells, buckets) int array; column 0 counts zeros
+        self.offsets = offsets          # metric -> bucket index stored in column 1
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._lookup = {dim: {value: i for i, value in enumerate(cats)} for dim, cats in categories.items()}
+        self._cuboids = {}
+
+    @property
+    def n_cells(self):
+        return len(next(iter(self.measures.values()))['count'])
+
+    @classmethod
+    def build(cls, df, dims=CUBE_DIMS, metrics=CUBE_METRICS, alpha=ALPHA):
+        """Aggregate the row-level processed frame into a cube."""
+        dims = [dim for dim in dims if dim in df.columns]
+        metrics = [metric for metric in metrics if metric in df.columns]
+        categories, row_codes = {}, []
+        for dim in dims:
+            codes, uniques = pd.factorize(df[dim], sort=True, use_na_sentinel=True)
+            cats = [_to_builtin(value) for value in uniques]
+            if (codes < 0).any():
+                codes = np.where(codes < 0, len(cats), codes)
+                cats.append(None)
+            categories[dim] = cats
+            row_codes.append(codes)
+
+        shape = tuple(len(categories[dim]) for dim in dims)
+        flat = np.ravel_multi_index(row_codes, shape)
+        cell_ids, cell_of_row = np.unique(flat, return_inverse=True)
+        n_cells = len(cell_ids)
+        codes = dict(zip(dims, np.unravel_index(cell_ids, shape)))
+
+        log_gamma = np.log((1 + alpha) / (1 - alpha))
+        measures, sketches, offsets = {}, {}, {}
+        for metric in metrics:
+            values = df[metric].to_numpy(dtype='float64', na_value=np.nan)
+            # inf (e.g. ROI with zero debt) and negatives have no place in a log sketch
+            keep = np.isfinite(values) & (values >= 0)
+            cells, values = cell_of_row[keep], values[keep]
+
+            minimum = np.full(n_cells, np.nan)
+            maximum = np.full(n_cells, np.nan)
+            np.fmin.at(minimum, cells, values)
+            np.fmax.at(maximum, cells, values)
+            measures[metric] = {
+                'count': np.bincount(cells, minlength=n_cells).astype('int64'),
+                'sum': np.bincount(cells, weights=values, minlength=n_cells),
+                'min': minimum,
+                'max': maximum,
+            }
+
+            positive = values > 0
+            buckets = np.zeros(len(values), dtype='int64')
+            buckets[positive] = np.ceil(np.log(values[positive]) / log_gamma).astype('int64')
+            offset = int(buckets[positive].min()) if positive.any() else 0
+            columns = np.where(positive, buckets - offset + 1, 0)
+            width = int(columns.max()) + 1 if len(columns) else 1
+            counts = np.bincount(cells * width + columns, minlength=n_cells * width)
+            sketches[metric] = counts.reshape(n_cells, width).astype('int32')
+            offsets[metric] = offset
+        return cls(dims, categories, codes, measures, sketches, offsets, alpha)
+
+    @classmethod
+    def merge(cls, cubes, orders=None):
+        """Combine cubes built from disjoint sets of rows (e.g. the chunks of a stream) into one.
+
+        Counts, sums, extremes and sketch buckets add up, so the result equals the
+        cube built from all rows at once (sums up to floating-point rounding).
+        Categories are ordered as in `orders` ({dim: values}) where given, else
+        sorted with a missing value last, as build() orders them.
+        """
+        cubes = [cube for cube in cubes if cube.n_cells]
+        first = cubes[0]
+        dims, metrics = first.dims, list(first.measures)
+        categories, row_codes = {}, []
+        for dim in dims:
+            observed = {value for cube in cubes for value in cube.categories[dim]}
+            if orders and dim in orders:
+                cats = [value for value in orders[dim] if value in observed]
+            else:
+                cats = sorted(value for value in observed if value is not None)
+            cats += [None] if None in observed else []
+            categories[dim] = cats
+            lookup = {value: i for i, value in enumerate(cats)}
+            row_codes.append(np.concatenate([
+                np.array([lookup[value] for value in cube.categories[dim]], dtype='int64')[cube.codes[dim]]
+                for cube in cubes]))
+
+        shape = tuple(len(categories[dim]) for dim in dims)
+        cell_ids, cell_of_row = np.unique(np.ravel_multi_index(row_codes, shape), return_inverse=True)
+        n_cells = len(cell_ids)
+        codes = dict(zip(dims, np.unravel_index(cell_ids, shape)))
+        bounds = np.cumsum([0] + [cube.n_cells for cube in cubes])
+
+        measures, sketches, offsets = {}, {}, {}
+        for metric in metrics:
+            count = np.zeros(n_cells, dtype='int64')
+            np.add.at(count, cell_of_row, np.concatenate([cube.measures[metric]['count'] for cube in cubes]))
+            minimum = np.full(n_cells, np.nan)
+            maximum = np.full(n_cells, np.nan)
+            np.fmin.at(minimum, cell_of_row, np.concatenate([cube.measures[metric]['min'] for cube in cubes]))
+            np.fmax.at(maximum, cell_of_row, np.concatenate([cube.measures[metric]['max'] for cube in cubes]))
+            measures[metric] = {
+                'count': count,
+                'sum': np.bincount(cell_of_row, weights=np.concatenate([cube.measures[metric]['sum'] for cube in cubes]),
+                                   minlength=n_cells),
+                'min': minimum,
+                'max': maximum,
+            }
+
+            # Re-base every sketch onto the smallest bucket seen; column 0 (zeros) stays put
+            positive = [cube for cube in cubes if cube.sketches[metric][:, 1:].any()]
+            offset = min(cube.offsets[metric] for cube in positive) if positive else 0
+            width = max(cube.sketches[metric].shape[1] + (cube.offsets[metric] - offset if cube in positive else 0)
+                        for cube in cubes)
+            merged = np.zeros((n_cells, width), dtype='int64')
+            for cube, start, stop in zip(cubes, bounds[:-1], bounds[1:]):
+                sketch, cells = cube.sketches[metric], cell_of_row[start:stop]
+                merged[cells, 0] += sketch[:, 0]
+                if cube in positive:
+                    shift = cube.offsets[metric] - offset
+                    merged[cells, 1 + shift:shift + sketch.shape[1]] += sketch[:, 1:]
+            sketches[metric] = merged.astype('int32')
+            offsets[metric] = offset
+        return cls(dims, categories, codes, measures, sketches, offsets, first.alpha)
+
+    def _mask(self, where):
+        mask = np.ones(self.n_cells, dtype=bool)
+        for dim, wanted in (where or {}).items():
+            wanted = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+            wanted_codes = [self._lookup[dim][value] for value in wanted if value in self._lookup[dim]]
+            mask &= np.isin(self.codes[dim], wanted_codes)
+        return mask
+
+    def _quantiles(self, sketch, counts, q, offset):
+        # Rank of the q-quantile within each group, then the first bucket reaching it
+        ranks = q * np.maximum(counts - 1, 0)
+        cumulative = np.cumsum(sketch, axis=1)
+        column = np.argmax(cumulative > ranks[:, None], axis=1)
+        values = 2 * self.gamma ** (column - 1 + offset) / (self.gamma + 1)
+        values = np.where(column == 0, 0.0, values)
+        return np.where(counts > 0, values, np.nan)
+
+    def query(self, metric, by=(), where=None, quantiles=(0.5,)):
+        """Roll up `metric` to the `by` dims over the cells matching `where`.
+
+        `where` maps a dim to a value or list of values, e.g. {'CONTROL': 'Public', 'CREDLEV': [5, 6]}.
+        Returns a DataFrame indexed by `by` with count, sum, mean, min, max and one
+        column per quantile (q50 for the median).
+        """
+        needed = tuple(dim for dim in self.dims if dim in set(by) | set(where or {}))
+        return self.cuboid(needed)._aggregate(metric, list(by), where, quantiles)
+
+    def cuboid(self, dims):
+        """The cube rolled up to `dims` only, materialized on first use and kept for later queries."""
+        dims = tuple(dims)
+        if dims == tuple(self.dims):
+            return self
+        if dims not in self._cuboids:
+            cells = np.arange(self.n_cells)
+            groups, group_of_cell, shape = self._group(cells, dims)
+            codes = dict(zip(dims, np.unravel_index(groups, shape)))
+            measures, sketches = {}, {}
+            for metric in self.measures:
+                count, total, minimum, maximum, merged = self._merge(metric, cells, group_of_cell, len(groups))
+                measures[metric] = {'count': count, 'sum': total, 'min': minimum, 'max': maximum}
+                sketches[metric] = merged
+            categories = {dim: self.categories[dim] for dim in dims}
+            self._cuboids[dims] = RoiCube(dims, categories, codes, measures, sketches, self.offsets, self.alpha)
+        return self._cuboids[dims]
+
+    def _group(self, cells, by):
+        if by:
+            shape = tuple(len(self.categories[dim]) for dim in by)
+            group_keys = np.ravel_multi_index([self.codes[dim][cells] for dim in by], shape)
+            groups, group_of_cell = np.unique(group_keys, return_inverse=True)
+        else:
+            shape = ()
+            groups, group_of_cell = np.zeros(1, dtype='int64'), np.zeros(len(cells), dtype='int64')
+        return groups, group_of_cell, shape
+
+    def _merge(self, metric, cells, group_of_cell, n_groups):
+        m = self.measures[metric]
+        count = np.bincount(group_of_cell, weights=m['count'][cells], minlength=n_groups).astype('int64')
+        total = np.bincount(group_of_cell, weights=m['sum'][cells], minlength=n_groups)
+        minimum = np.full(n_groups, np.nan)
+        maximum = np.full(n_groups, np.nan)
+        np.fmin.at(minimum, group_of_cell, m['min'][cells])
+        np.fmax.at(maximum, group_of_cell, m['max'][cells])
+
+        # Merge the sketches of each group's cells: sort cells by group, then add contiguous runs
+        sketch = self.sketches[metric]
+        if len(cells):
+            order = np.argsort(group_of_cell, kind='stable')
+            starts = np.flatnonzero(np.r_[True, np.diff(group_of_cell[order]) != 0])
+            merged = np.add.reduceat(sketch[cells[order]], starts, axis=0, dtype='int64')
+        else:
+            merged = np.zeros((n_groups, sketch.shape[1]), dtype='int64')
+        return count, total, minimum, maximum, merged
+
+    def _aggregate(self, metric, by, where, quantiles):
+        cells = np.flatnonzero(self._mask(where))
+        groups, group_of_cell, shape = self._group(cells, by)
+        count, total, minimum, maximum, merged = self._merge(metric, cells, group_of_cell, len(groups))
+
+        result = {'count': count, 'sum': total, 'mean': np.where(count > 0, total / np.maximum(count, 1), np.nan),
+                  'min': minimum, 'max': maximum}
+        for q in quantiles:
+            result[f'q{round(q * 100):g}'] = self._quantiles(merged, count, q, self.offsets[metric])
+
+        if by:
+            group_codes = np.unravel_index(groups, shape)
+            index = pd.MultiIndex.from_arrays(
+                [np.asarray(self.categories[dim], dtype=object)[codes] for dim, codes in zip(by, group_codes)],
+                names=by)
+            if len(by) == 1:
+                index = index.get_level_values(0)
+        else:
+            index = pd.Index(['all'])
+        return pd.DataFrame(result, index=index)
+
+    def save(self, path):
+        """Write the cube as a single .npz file."""
+        arrays = {f'codes__{dim}': codes for dim, codes in self.codes.items()}
+        for metric, m in self.measures.items():
+            for name, values in m.items():
+                arrays[f'{name}__{metric}'] = values
+            arrays[f'sketch__{metric}'] = self.sketches[metric]
+        meta = {'dims': self.dims, 'categories': self.categories, 'metrics': list(self.measures),
+                'offsets': self.offsets, 'alpha': self.alpha}
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp.npz')
+        np.savez(tmp_path, meta=np.array(json.dumps(meta)), **arrays)
+        tmp_path.replace(path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            codes = {dim: data[f'codes__{dim}'] for dim in meta['dims']}
+            measures = {metric: {name: data[f'{name}__{metric}'] for name in ['count', 'sum', 'min', 'max']}
+                        for metric in meta['metrics']}
+            sketches = {metric: data[f'sketch__{metric}'] for metric in meta['metrics']}
+        return cls(meta['dims'], meta['categories'], codes, measures, sketches, meta['offsets'], meta['alpha'])
+
+
+def _to_builtin(value):
+    # numpy scalars -> plain Python values so categories round-trip through JSON
+    return value.item() if hasattr(value, 'item') else value
+
+
+def build_cube(df, processed_dir=None):
+    """Build the cube from the processed frame and, if processed_dir is given, save it there."""
+    cube = RoiCube.build(df)
+    if processed_dir is not None:
+        cube.save(Path(processed_dir) / CUBE_NAME)
+    return cube
+
+
+def load_cube(processed_dir):
+    return RoiCube.load(Path(processed_dir) / CUBE_NAME)
+
+
+if __name__ == '__main__':
+    from store import PROCESSED_DIR, read_processed
+
+    df = read_processed(columns=CUBE_DIMS + CUBE_METRICS)
+    start = time.perf_counter()
+    cube = build_cube(df, PROCESSED_DIR)
+    print(f"Built cube with {cube.n_cells} cells from {len(df)} rows in {time.perf_counter() - start:.3f}s")
+
+    cube = load_cube(PROCESSED_DIR)
+    queries = [
+        ('median ROI by MAJOR_FIELD', dict(by=['MAJOR_FIELD'])),
+        ('ROI by CREDLEV x CONTROL', dict(by=['CREDLEV', 'CONTROL'])),
+        ('Master degrees at private non-profits', dict(where={'CREDLEV': 5, 'CONTROL': 'Private, nonprofit'})),
+    ]
+    for label, kwargs in queries:
+        cube.query('ROI_EARNINGS_TO_DEBT', **kwargs)
+        start = time.perf_counter()
+        for _ in range(100):
+            result = cube.query('ROI_EARNINGS_TO_DEBT', **kwargs)
+        print(f"\n{label}: {(time.perf_counter() - start) * 10:.3f} ms per query")
+        print(result.head(10).to_string())
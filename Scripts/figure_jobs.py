@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Parallel Figure Rendering
+#
+# Each figure is a FigureJob: the name of a shared data frame (plus an optional
+# column / dropna / sample slice), a plot kind from PLOTS, an output path under
+# figures/ and the plot options. render_jobs draws the jobs headless (Agg) on a
+# process pool. The frames are handed to each worker once, when it starts (with
+# the fork start method they are simply inherited), so a job only pickles its
+# small spec. Every job draws on a fresh figure that is closed after saving.
+# The 'density' kind bins all rows on a fixed grid (colored by hue) instead of
+# drawing one marker per row, so large scatters need no sampling.
+
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+FIGURES_DIR = Path('../figures')
+
+FigureJob = namedtuple('FigureJob', ['output', 'plot', 'frame', 'columns', 'dropna', 'sample', 'options'],
+                       defaults=(None, None, None, None))
+
+# Tick formatters by name, so job options stay picklable
+FORMATTERS = {
+    'thousands': lambda x, p: format(int(x), ','),
+    'percent': lambda x, p: f'{int(x*100)}%',
+    'dollars_k': lambda y, p: f'${int(y/1000):,}K',
+}
+
+# Frames shared by every job in the current worker
+_FRAMES = {}
+
+
+def _plot_hist(df, column=None, bins=50, figsize=None, layout=None, range=None, suptitle=None):
+    import matplotlib.pyplot as plt
+    if column is not None:
+        plt.figure()
+        df[column].hist(bins=bins, range=range)
+    else:
+        df.hist(bins=bins, figsize=figsize, layout=layout)
+    if suptitle:
+        plt.suptitle(suptitle)
+
+
+def _plot_scatter(df, x, y, hue=None, figsize=None, alpha=0.7, s=None):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    plt.figure(figsize=figsize)
+    size = {} if s is None else {'s': s}
+    sns.scatterplot(data=df, x=x, y=y, hue=hue, alpha=alpha, **size)
+
+
+def _hue_levels(values):
+    # Same level order seaborn uses: categories for a categorical, sorted values otherwise
+    if hasattr(values, 'cat'):
+        return [level for level in values.cat.categories if (values == level).any()]
+    return sorted(values.dropna().unique())
+
+
+def density_grid(x, y, codes, n_levels, bins, extent):
+    """Counts per (level, x bin, y bin) for the points inside extent, via one bincount."""
+    (x0, x1), (y0, y1) = extent
+    inside = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1) & (codes >= 0)
+    ix = np.minimum(((x[inside] - x0) / (x1 - x0) * bins).astype('int64'), bins - 1)
+    iy = np.minimum(((y[inside] - y0) / (y1 - y0) * bins).astype('int64'), bins - 1)
+    flat = (codes[inside] * bins + ix) * bins + iy
+    counts = np.bincount(flat, minlength=n_levels * bins * bins).reshape(n_levels, bins, bins)
+    return counts, inside
+
+
+def _plot_density(df, x, y, hue=None, bins=100, clip=(0.5, 99.5), figsize=None, s=6):
+    """Binned scatter: every row lands in a bins x bins grid shaded by count and colored by hue.
+
+    The cost of drawing is fixed by the grid, not the number of rows. Points
+    outside the `clip` percentile window of either axis are drawn as markers.
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    xs = df[x].to_numpy(dtype='float64', na_value=np.nan)
+    ys = df[y].to_numpy(dtype='float64', na_value=np.nan)
+    valid = np.isfinite(xs) & np.isfinite(ys)
+    if hue is not None:
+        levels = _hue_levels(df[hue])
+        codes = pd.Categorical(df[hue], categories=levels).codes.astype('int64')
+    else:
+        levels, codes = [None], np.zeros(len(df), dtype='int64')
+    codes = np.where(valid, codes, -1)
+    colors = np.asarray(sns.color_palette(n_colors=max(len(levels), 1)))[:len(levels)]
+
+    # Without a finite point there is nothing to place; draw empty unit axes
+    windows = (np.percentile(xs[valid], clip), np.percentile(ys[valid], clip)) if valid.any() else ((0, 1), (0, 1))
+    extent = tuple((low, high if high > low else low + 1) for low, high in windows)
+    counts, inside = density_grid(xs, ys, codes, len(levels), bins, extent)
+
+    # Each cell takes the count-weighted mix of its levels' colors; opacity grows with log(count)
+    total = counts.sum(axis=0)
+    rgb = np.einsum('kij,kc->ijc', counts, colors) / np.maximum(total, 1)[..., None]
+    alpha = np.where(total > 0, 0.25 + 0.75 * np.log1p(total) / np.log1p(max(total.max(), 1)), 0.0)
+    image = np.dstack([rgb, alpha]).transpose(1, 0, 2)
+
+    plt.figure(figsize=figsize)
+    ax = plt.gca()
+    (x0, x1), (y0, y1) = extent
+    ax.imshow(image, origin='lower', extent=(x0, x1, y0, y1), aspect='auto', interpolation='nearest')
+
+    outliers = valid & ~inside & (codes >= 0)
+    for code, (level, color) in enumerate(zip(levels, colors)):
+        rows = outliers & (codes == code)
+        ax.scatter(xs[rows], ys[rows], s=s, color=color, alpha=0.7, linewidths=0)
+        if level is not None:
+            ax.scatter([], [], color=color, label=level)
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    if hue is not None:
+        ax.legend(title=hue)
+
+
+def _plot_box(df, x, y, hue=None, order=None, palette=None, figsize=None):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    plt.figure(figsize=figsize)
+    if hue is None and palette is not None:
+        # seaborn only applies a palette through hue; color by x without a legend
+        hue, legend = x, False
+    else:
+        legend = 'auto'
+    sns.boxplot(data=df, x=x, y=y, hue=hue, order=order, palette=palette, legend=legend)
+
+
+def _plot_bar(df, x, y, estimator='mean', errorbar='sd', palette=None, figsize=None):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    plt.figure(figsize=figsize)
+    # seaborn only applies a palette through hue; color by x without a legend
+    hue = x if palette is not None else None
+    sns.barplot(data=df, x=x, y=y, hue=hue, estimator=estimator, errorbar=errorbar, palette=palette, legend=False)
+
+
+def _plot_regplot(df, x, y, figsize=None, alpha=0.5):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    plt.figure(figsize=figsize)
+    sns.regplot(data=df, x=x, y=y, scatter_kws={'alpha': alpha})
+
+
+def _plot_top_bottom(df, value, label, n=7, figsize=(16, 8), titles=('', ''), axis_labels=(None, None)):
+    """Side-by-side bar charts of the n largest and n smallest `value` per `label`."""
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    top = df.nlargest(n, value)
+    bottom = df.nsmallest(n, value)
+    xlabel, ylabel = axis_labels
+    fig, axes = plt.subplots(1, 2, figsize=figsize, sharex=False)
+    for ax, part, ascending, title in zip(axes, (top, bottom), (False, True), titles):
+        order = part.sort_values(value, ascending=ascending)[label]
+        sns.barplot(x=value, y=label, data=part, order=order, ax=ax, errorbar=None)
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+    axes[0].set_ylabel(ylabel)
+    axes[1].set_ylabel('')
+    plt.tight_layout()
+
+
+PLOTS = {
+    'hist': _plot_hist,
+    'scatter': _plot_scatter,
+    'density': _plot_density,
+    'box': _plot_box,
+    'bar': _plot_bar,
+    'regplot': _plot_regplot,
+    'top_bottom': _plot_top_bottom,
+}
+
+# Options applied to the current axes after the plot is drawn
+DECORATIONS = ['title', 'xlabel', 'ylabel', 'xlim', 'legend_title', 'xticks_rotation', 'x_format', 'y_format',
+               'tight_layout']
+
+
+def _decorate(options):
+    import matplotlib.pyplot as plt
+    if 'title' in options:
+        plt.title(options['title'])
+    if 'xlabel' in options:
+        plt.xlabel(options['xlabel'])
+    if 'ylabel' in options:
+        plt.ylabel(options['ylabel'])
+    if 'xlim' in options:
+        plt.xlim(*options['xlim'])
+    if 'xticks_rotation' in options:
+        plt.xticks(rotation=options['xticks_rotation'])
+    if 'legend_title' in options:
+        plt.legend(title=options['legend_title'])
+    if 'x_format' in options:
+        plt.gca().xaxis.set_major_formatter(plt.FuncFormatter(FORMATTERS[options['x_format']]))
+    if 'y_format' in options:
+        plt.gca().yaxis.set_major_formatter(plt.FuncFormatter(FORMATTERS[options['y_format']]))
+    if options.get('tight_layout'):
+        plt.tight_layout()
+
+
+def job_data(job, frames):
+    """The slice of the shared frame a job plots."""
+    df = frames[job.frame]
+    if job.columns is not None:
+        df = df[list(job.columns)]
+    if job.dropna is not None:
+        df = df.dropna(subset=list(job.dropna))
+    if job.sample is not None:
+        df = df.sample(n=min(job.sample, len(df)), random_state=42)
+    return df
+
+
+def _init_worker(frames=None, style=None, palette=None):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    plt.switch_backend('Agg')
+    if style:
+        plt.style.use(style)
+    if palette:
+        sns.set_palette(palette)
+    if frames is not None:
+        _FRAMES.clear()
+        _FRAMES.update(frames)
+
+
+def render_job(job, figures_dir=FIGURES_DIR):
+    """Draw one job on a fresh figure, save it and return (output path, seconds)."""
+    import matplotlib.pyplot as plt
+    start = time.perf_counter()
+    options = dict(job.options or {})
+    decorations = {key: options.pop(key) for key in DECORATIONS if key in options}
+    plt.close('all')
+    PLOTS[job.plot](job_data(job, _FRAMES), **options)
+    _decorate(decorations)
+    output = Path(figures_dir) / job.output
+    output.parent.mkdir(parents=True, exist_ok=True)
+    plt.savefig(output, bbox_inches='tight')
+    plt.close('all')
+    return str(output), time.perf_counter() - start
+
+
+def render_jobs(jobs, frames, figures_dir=FIGURES_DIR, workers=None, style=None, palette=None):
+    """Render all jobs, in parallel unless workers == 1; returns [(output path, seconds)] in job order."""
+    jobs = list(jobs)
+    workers = min(workers or os.cpu_count() or 1, len(jobs)) if jobs else 1
+    if workers <= 1:
+        _init_worker(frames, style, palette)
+        try:
+            return [render_job(job, figures_dir) for job in jobs]
+        finally:
+            _FRAMES.clear()
+
+    if 'fork' in mp.get_all_start_methods():
+        # Forked workers inherit the frames from this process without pickling them
+        context, initargs = mp.get_context('fork'), (None, style, palette)
+        _FRAMES.clear()
+        _FRAMES.update(frames)
+    else:
+        context, initargs = mp.get_context(), (frames, style, palette)
+    try:
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=initargs) as pool:
+            return list(pool.map(render_job, jobs, [figures_dir] * len(jobs)))
+    finally:
+        _FRAMES.clear()
+
+
+def report(results, elapsed):
+    """One line per figure plus the total wall time."""
+    lines = [f"  {seconds:6.2f}s  {output}" for output, seconds in results]
+    lines.append(f"Rendered {len(results)} figures in {elapsed:.2f}s")
+    return '\n'.join(lines)
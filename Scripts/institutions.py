@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Institution Dimension & Join
+#
+# Builds a one-row-per-institution table from the Institution-level file,
+# sorted by its integer key, and attaches its attributes to Field of Study rows
+# with a hash-index lookup and take() instead of name-based merges. Rows are
+# matched on UNITID by default (the campus-level key both files carry), so
+# campuses that share a name are no longer mixed up; OPEID6 can be used instead.
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from loader import NA_VALUES
+
+JOIN_KEY = 'UNITID'
+KEY_COLS = ['UNITID', 'OPEID6']
+ATTRIBUTE_COLS = ['TUITIONFEE_IN', 'UGDS_WOMEN']
+INSTITUTION_COLS = KEY_COLS + ['INSTNM'] + ATTRIBUTE_COLS
+DIMENSION_NAME = 'institutions.parquet'
+# data/ of this checkout, so load_joined() works from any working directory
+DATA_DIR = Path(__file__).resolve().parent.parent / 'data'
+# Parquet metadata entry recording what a saved dimension was built with
+DIMENSION_KEY = b'scorecard_dimension'
+
+
+def read_institutions(file_path):
+    """Read just the key and attribute columns from the Institution-level CSV."""
+    return pd.read_csv(file_path, usecols=INSTITUTION_COLS, na_values=NA_VALUES)
+
+
+def build_institution_dimension(df_inst_raw, key=JOIN_KEY):
+    """One row per `key`, sorted by it, with numeric attributes.
+
+    When the raw file has several rows for a key the first is kept (as before);
+    N_SOURCE_ROWS counts them and AMBIGUOUS flags keys whose rows disagree.
+    """
+    df = df_inst_raw[[key, 'INSTNM'] + ATTRIBUTE_COLS].copy()
+    for col in ATTRIBUTE_COLS:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df = df.dropna(subset=[key])
+    df[key] = df[key].astype('int64')
+    df = df.sort_values(key, kind='stable')
+
+    grouped = df.groupby(key, sort=True)[ATTRIBUTE_COLS]
+    n_rows = grouped.size()
+    n_distinct = grouped.nunique(dropna=False).max(axis=1)
+
+    dim = df.drop_duplicates(subset=[key], keep='first').reset_index(drop=True)
+    dim['N_SOURCE_ROWS'] = n_rows.to_numpy()
+    dim['AMBIGUOUS'] = (n_distinct > 1).to_numpy()
+    return dim
+
+
+def dimension_path(processed_dir, key=JOIN_KEY):
+    return Path(processed_dir) / f'{key.lower()}_{DIMENSION_NAME}'
+
+
+def _dimension_key(key):
+    return json.dumps({'key': key, 'attributes': ATTRIBUTE_COLS}).encode()
+
+
+def read_dimension(processed_dir, key=JOIN_KEY):
+    """Saved dimension for `key`, or None when missing or built with other key/attribute columns."""
+    dim_path = dimension_path(processed_dir, key)
+    if not dim_path.exists() or (pq.read_schema(dim_path).metadata or {}).get(DIMENSION_KEY) != _dimension_key(key):
+        return None
+    return pd.read_parquet(dim_path)
+
+
+def load_institution_dimension(raw_path, processed_dir, key=JOIN_KEY):
+    """Prebuilt dimension from processed_dir, rebuilt when the raw file is newer or the columns changed."""
+    dim_path = dimension_path(processed_dir, key)
+    if dim_path.exists() and dim_path.stat().st_mtime >= Path(raw_path).stat().st_mtime:
+        dim = read_dimension(processed_dir, key)
+        if dim is not None:
+            return dim
+    dim = build_institution_dimension(read_institutions(raw_path), key=key)
+    table = pa.Table.from_pandas(dim, preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata, DIMENSION_KEY: _dimension_key(key)})
+    dim_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = dim_path.with_suffix('.tmp')
+    pq.write_table(table, tmp_path)
+    tmp_path.replace(dim_path)
+    return dim
+
+
+def load_joined(processed_dir=None, key=JOIN_KEY, columns=None, raw_dir=None):
+    """Processed Field of Study data with the institution attributes joined on (as in 03_fairness.py).
+
+    The directories default to data/processed and data/raw of this checkout.
+    """
+    from rawdata import INSTITUTION_FILE, ensure_raw
+    from store import read_processed
+    processed_dir = Path(processed_dir or DATA_DIR / 'processed')
+    df = read_processed(processed_dir, columns=columns)
+    raw_path = ensure_raw(INSTITUTION_FILE, Path(raw_dir or DATA_DIR / 'raw'))
+    dim = load_institution_dimension(raw_path, processed_dir, key=key)
+    return join_institutions(df, dim, key=key)[0]
+
+
+def join_institutions(df_fos, dim, key=JOIN_KEY, columns=ATTRIBUTE_COLS):
+    """Left-join `columns` of the dimension onto df_fos by integer key.
+
+    Returns the joined frame and a report dict with matched/unmatched rows,
+    the unmatched and ambiguous keys, and institution names shared by several keys.
+    """
+    # Hash index over the (unique) dimension keys; -1 marks a key with no institution row
+    index = pd.Index(dim[key].to_numpy(dtype='int64'))
+    if not index.is_unique:
+        raise ValueError(f"Institution dimension must be unique on {key}")
+    has_key = df_fos[key].notna().to_numpy()
+    fact_keys = df_fos[key].to_numpy(dtype='float64', na_value=-1).astype('int64')
+    pos = np.where(has_key, index.get_indexer(fact_keys), -1)
+    matched = pos >= 0
+
+    df_joined = df_fos.copy()
+    take_pos = np.where(matched, pos, 0)
+    for col in columns:
+        values = dim[col].to_numpy(dtype='float64', na_value=np.nan)
+        df_joined[col] = np.where(matched, values.take(take_pos), np.nan) if len(values) else np.nan
+
+    used_mask = np.zeros(len(index), dtype=bool)
+    used_mask[pos[matched]] = True
+    used = np.flatnonzero(used_mask)
+    ambiguous = dim[key].to_numpy()[used[dim['AMBIGUOUS'].to_numpy()[used]]] if 'AMBIGUOUS' in dim else []
+    names = dim['INSTNM'].take(used).value_counts()
+    report = {
+        'rows': len(df_fos),
+        'matched_rows': int(matched.sum()),
+        'missing_key_rows': int((~has_key).sum()),
+        'unmatched_rows': int((has_key & ~matched).sum()),
+        'unmatched_keys': np.unique(fact_keys[has_key & ~matched]).tolist(),
+        'ambiguous_keys': list(np.asarray(ambiguous).tolist()),
+        'shared_names': names[names > 1].index.tolist(),
+    }
+    return df_joined, report
+
+
+def format_join_report(report, key=JOIN_KEY):
+    """Human-readable summary of a join_institutions report."""
+    lines = [
+        f"Joined on {key}: {report['matched_rows']} of {report['rows']} rows matched "
+        f"({report['unmatched_rows']} unmatched, {report['missing_key_rows']} without a key).",
+        f"Unmatched keys: {len(report['unmatched_keys'])} {report['unmatched_keys'][:10]}",
+        f"Ambiguous keys (conflicting institution rows): {len(report['ambiguous_keys'])} "
+        f"{report['ambiguous_keys'][:10]}",
+        f"Institution names shared by several {key}s: {len(report['shared_names'])} {report['shared_names'][:5]}",
+    ]
+    return '\n'.join(lines)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Field of Study CSV Loader
+#
+# Reads only the columns the pipeline uses, with dtypes declared up front,
+# streaming the file in chunks so the full raw table is never materialized.
+# Run directly to compare it against the old full-file read:
+#     python loader.py [path/to/Most-Recent-Cohorts-Field-of-Study.csv]
+
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+FOS_COLUMNS = [
+    'EARN_MDN_5YR',
+    'DEBT_ALL_STGP_ANY_MDN',
+    'DEBT_ALL_STGP_EVAL_MDN',
+    'DEBT_ALL_STGP_ANY_MDN10YRPAY',
+    'DEBT_ALL_STGP_EVAL_MDN10YRPAY',
+    'UNITID',
+    'OPEID6',
+    'INSTNM',
+    'CIPCODE',
+    'CIPDESC',
+    'CREDLEV',
+    'CREDDESC',
+    'CONTROL',
+    'IPEDSCOUNT2',
+]
+
+# Suppressed or missing cells become NaN while the file is parsed
+NA_VALUES = ['PrivacySuppressed', 'NULL']
+
+# Parsed straight into the compact types (see compact.py): float32 for whole
+# dollars and counts, narrow integers, and dictionary-encoded strings
+FOS_DTYPES = {
+    'EARN_MDN_5YR': 'float32',
+    'DEBT_ALL_STGP_ANY_MDN': 'float32',
+    'DEBT_ALL_STGP_EVAL_MDN': 'float32',
+    'DEBT_ALL_STGP_ANY_MDN10YRPAY': 'float64',
+    'DEBT_ALL_STGP_EVAL_MDN10YRPAY': 'float64',
+    'IPEDSCOUNT2': 'float32',
+    'UNITID': 'Int32',
+    'OPEID6': 'Int32',
+    'INSTNM': 'category',
+    'CIPCODE': 'Int32',
+    'CIPDESC': 'category',
+    'CREDLEV': 'Int8',
+    'CREDDESC': 'category',
+    'CONTROL': 'category',
+}
+
+DEFAULT_CHUNKSIZE = 200_000
+
+
+def _concat_chunks(chunks):
+    """Concatenate chunks, unioning categoricals so they stay categorical."""
+    if not chunks:
+        raise ValueError("No rows were read from the file.")
+    cat_cols = [c for c in chunks[0].columns if isinstance(chunks[0][c].dtype, pd.CategoricalDtype)]
+    for col in cat_cols:
+        # Recode every chunk onto the shared categories so concat keeps the dtype
+        categories = union_categoricals([chunk[col] for chunk in chunks], sort_categories=True).categories
+        for chunk in chunks:
+            chunk[col] = chunk[col].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def iter_field_of_study(file_path, columns=None, dtypes=None, chunksize=DEFAULT_CHUNKSIZE, nrows=None):
+    """Yield the Field of Study CSV in chunks of `chunksize` rows, keeping only `columns` with declared dtypes."""
+    columns = list(columns or FOS_COLUMNS)
+    dtypes = {**FOS_DTYPES, **(dtypes or {})}
+    reader = pd.read_csv(
+        file_path,
+        usecols=columns,
+        dtype={col: dtypes[col] for col in columns if col in dtypes},
+        na_values=NA_VALUES,
+        keep_default_na=True,
+        chunksize=chunksize,
+        nrows=nrows,
+    )
+    with reader:
+        # Columns come back in file order; reorder each chunk rather than the whole frame
+        for chunk in reader:
+            yield chunk[columns]
+
+
+def load_field_of_study(file_path, columns=None, dtypes=None, chunksize=DEFAULT_CHUNKSIZE):
+    """Stream the Field of Study CSV, keeping only `columns` with declared dtypes."""
+    return _concat_chunks(list(iter_field_of_study(file_path, columns, dtypes, chunksize)))
+
+
+def measure(func, *args, **kwargs):
+    # Time an untraced run; tracemalloc slows allocation-heavy parsing a lot,
+    # so peak memory comes from a second, traced run.
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    del result
+    tracemalloc.start()
+    result = func(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def _full_read(file_path):
+    # The original Part 1 / Part 3 path: read everything, then slice
+    df = pd.read_csv(file_path, low_memory=False)
+    return df[FOS_COLUMNS].copy()
+
+
+def compare_loaders(file_path, chunksize=DEFAULT_CHUNKSIZE):
+    """Report load time, peak allocated memory and result size for both load paths."""
+    rows = []
+    for name, func, kwargs in [
+        ('full read_csv + slice', _full_read, {}),
+        ('pruned streaming loader', load_field_of_study, {'chunksize': chunksize}),
+    ]:
+        df, elapsed, peak = measure(func, file_path, **kwargs)
+        rows.append({
+            'loader': name,
+            'seconds': round(elapsed, 3),
+            'peak_mb': round(peak / 1e6, 1),
+            'result_mb': round(df.memory_usage(deep=True).sum() / 1e6, 1),
+            'rows': len(df),
+        })
+        del df
+    report = pd.DataFrame(rows).set_index('loader')
+    report['speedup'] = (report['seconds'].iloc[0] / report['seconds']).round(2)
+    report['memory_ratio'] = (report['peak_mb'].iloc[0] / report['peak_mb']).round(2)
+    return report
+
+
+if __name__ == '__main__':
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path('../data/raw/Most-Recent-Cohorts-Field-of-Study.csv')
+    print(f"Comparing loaders on '{path}'")
+    print(compare_loaders(path).to_string())
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Comparable Programs
+#
+# Finds, for any program (an INSTNM x CIPCODE x CREDLEV row of the processed
+# data), the programs most like it: same credential level and 2-digit CIP
+# family (CONSTRAINTS), closest in median earnings, median debt and in-state
+# tuition (from the institution join). The dollar amounts are compared on a
+# log scale, standardized and weighted (WEIGHTS), with Euclidean distance.
+#
+# ProgramNeighbors splits the programs by their constraint values and builds
+# one KD-tree (scipy's cKDTree) per group, so a lookup only searches programs
+# it may be compared with. Batch queries run each group's tree over all of its
+# query rows at once, across every core; the full top-k table for all
+# programs is written to data/processed/program_neighbors.parquet:
+#     python neighbors.py                # all-pairs top-k, timings and a brute-force check
+#     python neighbors.py --k 20 --no-save
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+FEATURES = ['EARN_MDN_5YR', 'DEBT_ALL_STGP_ANY_MDN', 'TUITIONFEE_IN']
+WEIGHTS = {'EARN_MDN_5YR': 1.0, 'DEBT_ALL_STGP_ANY_MDN': 1.0, 'TUITIONFEE_IN': 0.5}
+# Comparable programs share these values
+CONSTRAINTS = ['CREDLEV', 'CIP_2DIGIT']
+KEY_COLUMNS = ['UNITID', 'CIPCODE', 'CREDLEV']
+DISPLAY_COLUMNS = ['UNITID', 'INSTNM', 'CIPCODE', 'CIPDESC', 'CREDENTIAL_LEVEL_NAME', 'CONTROL', 'EARN_MDN_5YR',
+                   'DEBT_ALL_STGP_ANY_MDN', 'TUITIONFEE_IN', 'ROI_EARNINGS_TO_DEBT']
+DEFAULT_K = 10
+NEIGHBORS_NAME = 'program_neighbors.parquet'
+
+
+class ProgramNeighbors:
+    """k-nearest comparable programs, one KD-tree per group of CONSTRAINTS values.
+
+    Tuition missing from the institution file is filled with the median of the
+    program's CONTROL type (IMPUTED_TUITION marks those rows).
+    """
+
+    def __init__(self, df, features=FEATURES, weights=None, constraints=CONSTRAINTS):
+        from scipy.spatial import cKDTree
+        self.features = list(features)
+        self.constraints = list(constraints)
+        weights = {**WEIGHTS, **(weights or {})}
+        keep = df[[col for col in self.features if col != 'TUITIONFEE_IN']].notna().all(axis=1).to_numpy()
+        self.programs = df.loc[keep, [col for col in dict.fromkeys(DISPLAY_COLUMNS + self.constraints)
+                                      if col in df.columns]].reset_index(drop=True)
+
+        values = np.column_stack([self.programs[col].to_numpy(dtype='float64', na_value=np.nan)
+                                  for col in self.features])
+        values = np.log1p(np.clip(values, 0, None))
+        if 'TUITIONFEE_IN' in self.features:
+            column = self.features.index('TUITIONFEE_IN')
+            missing = np.isnan(values[:, column])
+            fill = pd.Series(values[:, column]).groupby(self.programs['CONTROL'].astype(str).to_numpy()).transform(
+                'median').fillna(np.nanmedian(values[:, column]))
+            values[missing, column] = fill.to_numpy()[missing]
+            self.programs['IMPUTED_TUITION'] = missing
+        self.mean, self.std = values.mean(axis=0), values.std(axis=0)
+        scale = np.array([weights[col] for col in self.features]) / np.where(self.std > 0, self.std, 1.0)
+        self.X = (values - self.mean) * scale
+
+        # Programs sorted by group, so each group's members are one contiguous slice
+        self.group = self.programs.groupby(self.constraints, observed=True, sort=False).ngroup().to_numpy()
+        self.order = np.argsort(self.group, kind='stable')
+        self.offsets = np.searchsorted(self.group[self.order], np.arange(self.group.max() + 2))
+        self.trees = [cKDTree(self.X[self.members(g)]) for g in range(len(self.offsets) - 1)]
+        keys = pd.MultiIndex.from_frame(self.programs[KEY_COLUMNS].astype('int64'))
+        # A key repeated in the file resolves to its first row
+        first = ~keys.duplicated()
+        self._lookup = pd.Series(np.flatnonzero(first), index=keys[first])
+
+    @property
+    def n_programs(self):
+        return len(self.programs)
+
+    def members(self, group):
+        return self.order[self.offsets[group]:self.offsets[group + 1]]
+
+    def find(self, unitid, cipcode, credlev):
+        """Row position of a program, or a KeyError."""
+        try:
+            return int(self._lookup.loc[(int(unitid), int(cipcode), int(credlev))])
+        except KeyError:
+            raise KeyError(f"No program UNITID={unitid} CIPCODE={cipcode} CREDLEV={credlev}") from None
+
+    def query(self, positions, k=DEFAULT_K, workers=-1):
+        """The k nearest comparable programs of each position, excluding the program itself.
+
+        Returns (neighbors, distances), both (len(positions), k); slots beyond a
+        group's size hold -1 and inf.
+        """
+        positions = np.asarray(positions, dtype='int64')
+        neighbors = np.full((len(positions), k), -1, dtype='int64')
+        distances = np.full((len(positions), k), np.inf)
+        groups = self.group[positions]
+        for g in np.unique(groups):
+            rows = np.flatnonzero(groups == g)
+            members = self.members(g)
+            n = min(k + 1, len(members))
+            dist, idx = self.trees[g].query(self.X[positions[rows]], k=n, workers=workers)
+            found, dist = members[idx.reshape(len(rows), n)], dist.reshape(len(rows), n)
+            # Drop the program itself (normally the first hit, but ties can move it) and keep the first k
+            others = found != positions[rows, None]
+            order = np.argsort(~others, axis=1, kind='stable')[:, :k]
+            found, dist = np.take_along_axis(found, order, axis=1), np.take_along_axis(dist, order, axis=1)
+            valid = np.take_along_axis(others, order, axis=1)
+            neighbors[rows, :found.shape[1]] = np.where(valid, found, -1)
+            distances[rows, :dist.shape[1]] = np.where(valid, dist, np.inf)
+        return neighbors, distances
+
+    def brute_force(self, positions, k=DEFAULT_K):
+        """Same as query() by comparing against every member of the group; for checking the trees."""
+        positions = np.asarray(positions, dtype='int64')
+        neighbors = np.full((len(positions), k), -1, dtype='int64')
+        distances = np.full((len(positions), k), np.inf)
+        for i, position in enumerate(positions):
+            members = self.members(self.group[position])
+            members = members[members != position]
+            dist = np.sqrt(((self.X[members] - self.X[position]) ** 2).sum(axis=1))
+            best = np.argsort(dist, kind='stable')[:k]
+            neighbors[i, :len(best)], distances[i, :len(best)] = members[best], dist[best]
+        return neighbors, distances
+
+    def similar(self, unitid, cipcode, credlev, k=DEFAULT_K):
+        """Comparable programs for one program, closest first, with their distance."""
+        neighbors, distances = self.query([self.find(unitid, cipcode, credlev)], k)
+        found = neighbors[0] >= 0
+        result = self.programs.iloc[neighbors[0, found]].reset_index(drop=True)
+        result.insert(0, 'distance', distances[0, found])
+        return result
+
+    def to_frame(self, neighbors, distances, positions=None):
+        """Long table: one row per (program, rank) with both programs' keys and the distance."""
+        positions = np.arange(len(neighbors)) if positions is None else np.asarray(positions)
+        k = neighbors.shape[1]
+        found = (neighbors >= 0).ravel()
+        source = np.repeat(positions, k)[found]
+        target = neighbors.ravel()[found]
+        keys = self.programs[KEY_COLUMNS]
+        frame = pd.DataFrame({f'{col}': keys[col].to_numpy()[source] for col in KEY_COLUMNS})
+        frame['RANK'] = np.tile(np.arange(1, k + 1), len(neighbors))[found]
+        for col in KEY_COLUMNS:
+            frame[f'NEIGHBOR_{col}'] = keys[col].to_numpy()[target]
+        frame['DISTANCE'] = distances.ravel()[found]
+        return frame
+
+
+if __name__ == '__main__':
+    from institutions import load_joined
+    from store import PROCESSED_DIR
+
+    parser = argparse.ArgumentParser(description="Comparable-program index over the processed data.")
+    parser.add_argument('--k', type=int, default=DEFAULT_K, help="neighbors per program")
+    parser.add_argument('--no-save', action='store_true', help=f"do not write {NEIGHBORS_NAME}")
+    args = parser.parse_args()
+
+    df = load_joined()
+    start = time.perf_counter()
+    engine = ProgramNeighbors(df)
+    print(f"Indexed {engine.n_programs} programs in {len(engine.trees)} groups in "
+          f"{time.perf_counter() - start:.3f}s")
+
+    start = time.perf_counter()
+    neighbors, distances = engine.query(np.arange(engine.n_programs), args.k)
+    print(f"All-pairs top-{args.k} for {engine.n_programs} programs in {time.perf_counter() - start:.2f}s")
+
+    rng = np.random.default_rng(0)
+    sample = rng.choice(engine.n_programs, size=min(500, engine.n_programs), replace=False)
+    _, expected = engine.brute_force(sample, args.k)
+    print(f"Matches brute force on {len(sample)} programs: {np.allclose(distances[sample], expected)}")
+
+    keys = engine.programs[KEY_COLUMNS].iloc[sample[:200]].to_numpy()
+    start = time.perf_counter()
+    for unitid, cipcode, credlev in keys:
+        engine.similar(unitid, cipcode, credlev, args.k)
+    print(f"Single lookups: {(time.perf_counter() - start) / len(keys) * 1000:.2f} ms each")
+
+    unitid, cipcode, credlev = keys[0]
+    program = engine.programs.iloc[engine.find(unitid, cipcode, credlev)]
+    print(f"\nPrograms comparable to {program['INSTNM']} - {program['CIPDESC']} ({program['CREDENTIAL_LEVEL_NAME']}):")
+    print(engine.similar(unitid, cipcode, credlev, 5).round(3).to_string())
+
+    if not args.no_save:
+        path = Path(PROCESSED_DIR) / NEIGHBORS_NAME
+        engine.to_frame(neighbors, distances).to_parquet(path, index=False)
+        print(f"\nTop-{args.k} table written to: {path}")
@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Out-of-Core Execution
+#
+# Runs the select / clean / ROI / filter / categorize steps and the institution
+# join as streaming operators over chunks of the Field of Study CSV, so the
+# data never has to fit in memory:
+#   - the limit is for the whole process: the memory already in use when a run
+#     starts (interpreter, pandas / pyarrow imports) is subtracted first, and
+#     the chunk size is planned from a sample so that one chunk's working set
+#     (the parsed chunk, its transformed copy and the Arrow tables written)
+#     stays within what is left;
+#   - processed and joined chunks are appended to the partitioned Parquet
+#     datasets as they are produced (store.DatasetWriter);
+#   - the group-by statistics come from a cube per chunk, each merged into a
+#     running cube (the quantile sketches add up exactly, see RoiCube.merge);
+#   - the join is a hash join whose build side (the institution dimension) is
+#     hash-partitioned to disk when it does not fit in its share of the limit;
+#     each probe chunk is split by the same hash, joined one partition at a
+#     time and put back in row order.
+# Some costs do not shrink with the limit (the running cube, whose size depends
+# on its cells and sketch buckets, and what the allocators keep cached), so a
+# very small limit cannot be met; the planning is an estimate either way, and a
+# run whose peak RSS ends up above the limit says so. The outputs are the same files 01_preprocess.py writes (plus
+# the joined dataset), rows failing validation go to the same quarantine file,
+# and --verify checks them against the in-memory path. The limit comes from
+# --memory-limit or SCORECARD_MEMORY_LIMIT (e.g. 512M, 2G):
+#     python outofcore.py --memory-limit 256M
+#     python outofcore.py --memory-limit 64M --verify
+
+import argparse
+import math
+import os
+import resource
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from cube import CUBE_NAME, RoiCube
+from institutions import (
+    ATTRIBUTE_COLS, INSTITUTION_COLS, JOIN_KEY, build_institution_dimension, format_join_report, join_institutions,
+    read_institutions,
+)
+from loader import NA_VALUES, iter_field_of_study, load_field_of_study
+from profiling import Profiler
+from rawdata import FOS_FILE, INSTITUTION_FILE, RAW_DIR, ensure_raw
+from roi_metrics import DEFAULT_INCOME_SHARE, DEFAULT_INTEREST_RATE
+from store import DATASET_NAME, PARTITION_COLS, PROCESSED_DIR, DatasetWriter, read_processed, write_processed
+from transforms import (
+    AFFORD_BINS, AFFORD_LABELS, COLUMNS_TO_KEEP, EARNINGS_BOUNDS, MIN_CLASS_SIZE, NUMERIC_COLS, ROI_BINS, ROI_LABELS,
+    add_roi_features, categorize, clean, filter_rows, select_columns,
+)
+from validation import QUARANTINE_DIR, QUARANTINE_NAME, QuarantineWriter
+
+MEMORY_ENV = 'SCORECARD_MEMORY_LIMIT'
+DEFAULT_MEMORY_LIMIT = '1G'
+SPILL_DIR = Path('../data/spill')
+JOINED_NAME = 'field_of_study_joined.parquet'
+
+# Rows parsed to estimate the in-memory size of a row (kept small: the sample counts against the limit too)
+SAMPLE_ROWS = 5_000
+# A chunk's working set relative to its parsed size: the chunk, the selected /
+# filtered copies, the joined copy and the Arrow tables built to write them
+WORKING_SET_FACTOR = 8
+# Share of the limit for the join's build side; the rest goes to the chunk
+BUILD_SHARE = 0.25
+# In-memory size of the dimension build relative to the raw institution rows
+BUILD_FACTOR = 3
+MIN_CHUNK_ROWS = 1_000
+# Data budget used when the limit leaves less than this above the process baseline
+MIN_DATA_BUDGET = 8 * 2**20
+
+# Spilled institution rows: names as strings, keys and attributes as floats
+SPILL_SCHEMA = pa.schema([(col, pa.string() if col == 'INSTNM' else pa.float64()) for col in INSTITUTION_COLS])
+
+_UNITS = {'': 1, 'k': 2**10, 'm': 2**20, 'g': 2**30, 't': 2**40}
+
+
+def parse_size(value):
+    """'512M', '2g', '1.5G' or a plain number of bytes -> int bytes."""
+    text = str(value).strip().lower().removesuffix('b').removesuffix('i')
+    unit = text[-1] if text and text[-1] in _UNITS else ''
+    return int(float(text[:len(text) - len(unit)]) * _UNITS[unit])
+
+
+def memory_limit(value=None):
+    """The limit in bytes: `value`, else SCORECARD_MEMORY_LIMIT, else DEFAULT_MEMORY_LIMIT."""
+    return parse_size(value or os.environ.get(MEMORY_ENV) or DEFAULT_MEMORY_LIMIT)
+
+
+def _peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def _current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # No /proc (macOS): the peak so far is the closest available figure
+        return _peak_rss()
+
+
+def data_budget(limit):
+    """(budget, baseline): bytes of `limit` left for data after the memory the process already uses."""
+    baseline = _current_rss()
+    budget = limit - baseline
+    if budget < MIN_DATA_BUDGET:
+        print(f"Warning: the memory limit ({limit / 2**20:.0f} MB) leaves less than {MIN_DATA_BUDGET / 2**20:.0f} MB "
+              f"above the {baseline / 2**20:.0f} MB the process already uses; planning for "
+              f"{MIN_DATA_BUDGET / 2**20:.0f} MB of data", file=sys.stderr)
+        budget = MIN_DATA_BUDGET
+    return budget, baseline
+
+
+def plan_chunk_rows(fos_path, budget, columns=None):
+    """Rows per chunk so that a chunk's working set stays within (1 - BUILD_SHARE) of the data budget."""
+    sample = next(iter_field_of_study(fos_path, columns, chunksize=SAMPLE_ROWS, nrows=SAMPLE_ROWS))
+    row_bytes = max(sample.memory_usage(deep=True).sum() / max(len(sample), 1), 1)
+    return max(int(budget * (1 - BUILD_SHARE) / (WORKING_SET_FACTOR * row_bytes)), MIN_CHUNK_ROWS)
+
+
+def process_chunk(df, min_class_size=MIN_CLASS_SIZE, interest_rate=DEFAULT_INTEREST_RATE,
+                  income_share=DEFAULT_INCOME_SHARE, earnings_bounds=EARNINGS_BOUNDS, roi_bins=ROI_BINS,
+                  roi_labels=ROI_LABELS, afford_bins=AFFORD_BINS, afford_labels=AFFORD_LABELS, quarantine=None):
+    """Parts 3-7 on one chunk. Every step is row-local, so chunks can be processed independently.
+
+    Rows failing validation are passed to `quarantine` (a validation.QuarantineWriter) when given.
+    """
+    df = select_columns(df, COLUMNS_TO_KEEP, copy=False)
+    df = clean(df, NUMERIC_COLS, copy=False)
+    df = add_roi_features(df, interest_rate=interest_rate, income_share=income_share, copy=False)
+    df = filter_rows(df, min_class_size=min_class_size, earnings_bounds=earnings_bounds, quarantine=quarantine)
+    return categorize(df, roi_bins=roi_bins, roi_labels=roi_labels, afford_bins=afford_bins,
+                      afford_labels=afford_labels, copy=False)
+
+
+def _partition_of(keys, n_partitions):
+    # Missing keys never match; they go to partition 0 and come back unmatched
+    keys = np.where(np.isnan(keys), 0, keys).astype('int64')
+    return keys % n_partitions
+
+
+class SpillingHashJoin:
+    """Left join of streamed Field of Study chunks onto the institution dimension.
+
+    The build side is read from the Institution CSV in chunks. When its
+    estimated size fits in `budget` the dimension is built in memory;
+    otherwise the raw rows are hash-partitioned on the key into Parquet files
+    under spill_dir and each partition's dimension is built from its file.
+    A key never spans partitions, so build_institution_dimension's keep-first
+    and ambiguity rules give the same rows as on the whole file.
+    """
+
+    def __init__(self, inst_path, budget, spill_dir=SPILL_DIR, key=JOIN_KEY, chunksize=100_000):
+        self.key = key
+        self.budget = budget
+        self.spill_dir = None
+        self._dims = OrderedDict()
+        self._dim_bytes = 0
+        self.report = {'rows': 0, 'matched_rows': 0, 'missing_key_rows': 0, 'unmatched_rows': 0}
+        self._unmatched, self._ambiguous, self._names = set(), set(), {}
+
+        inst_path = Path(inst_path)
+        sample = pd.read_csv(inst_path, usecols=INSTITUTION_COLS, na_values=NA_VALUES, nrows=SAMPLE_ROWS)
+        with open(inst_path, 'rb') as f:
+            sample_bytes = sum(len(line) for _, line in zip(range(len(sample) + 1), f))
+        estimated = (sample.memory_usage(deep=True).sum() * inst_path.stat().st_size / max(sample_bytes, 1)
+                     * BUILD_FACTOR)
+        self.n_partitions = max(1, math.ceil(estimated / budget))
+        if self.n_partitions == 1:
+            self._dims[0] = build_institution_dimension(read_institutions(inst_path), key=key)
+            return
+
+        Path(spill_dir).mkdir(parents=True, exist_ok=True)
+        self.spill_dir = Path(tempfile.mkdtemp(prefix='join-', dir=spill_dir))
+        writers = {}
+        try:
+            for chunk in pd.read_csv(inst_path, usecols=INSTITUTION_COLS, na_values=NA_VALUES, chunksize=chunksize):
+                # Fixed column types, so every partition file has one schema
+                for col in INSTITUTION_COLS:
+                    if col != 'INSTNM':
+                        chunk[col] = pd.to_numeric(chunk[col], errors='coerce').astype('float64')
+                chunk['INSTNM'] = chunk['INSTNM'].astype(object)
+                chunk = chunk[chunk[key].notna()]
+                part = _partition_of(chunk[key].to_numpy(), self.n_partitions)
+                for p in np.unique(part):
+                    table = pa.Table.from_pandas(chunk[part == p], schema=SPILL_SCHEMA, preserve_index=False)
+                    if p not in writers:
+                        writers[p] = pq.ParquetWriter(self.spill_dir / f'raw-{p}.parquet', SPILL_SCHEMA)
+                    writers[p].write_table(table)
+        finally:
+            for writer in writers.values():
+                writer.close()
+        for p in range(self.n_partitions):
+            raw_path = self.spill_dir / f'raw-{p}.parquet'
+            raw = pd.read_parquet(raw_path) if raw_path.exists() else pd.DataFrame(columns=INSTITUTION_COLS)
+            build_institution_dimension(raw, key=key).to_parquet(self.spill_dir / f'dim-{p}.parquet', index=False)
+            raw_path.unlink(missing_ok=True)
+
+    def _dimension(self, p):
+        # Partitions read back from disk, the most recently used kept while they fit in the budget
+        if p in self._dims:
+            self._dims.move_to_end(p)
+            return self._dims[p]
+        dim = pd.read_parquet(self.spill_dir / f'dim-{p}.parquet')
+        size = dim.memory_usage(deep=True).sum()
+        while self._dims and self._dim_bytes + size > self.budget:
+            _, evicted = self._dims.popitem(last=False)
+            self._dim_bytes -= evicted.memory_usage(deep=True).sum()
+        self._dims[p] = dim
+        self._dim_bytes += size
+        return dim
+
+    def _probe_partition(self, df, dim):
+        joined, report = join_institutions(df, dim, key=self.key)
+        for name in ['rows', 'matched_rows', 'missing_key_rows', 'unmatched_rows']:
+            self.report[name] += report[name]
+        self._unmatched.update(report['unmatched_keys'])
+        self._ambiguous.update(report['ambiguous_keys'])
+        # Keys used from this partition, to find names shared by several keys over the whole run
+        keys = df[self.key].to_numpy(dtype='float64', na_value=np.nan)
+        pos = pd.Index(dim[self.key].to_numpy(dtype='int64')).get_indexer(keys[~np.isnan(keys)].astype('int64'))
+        used = np.unique(pos[pos >= 0])
+        for key, name in zip(dim[self.key].to_numpy()[used], dim['INSTNM'].to_numpy()[used]):
+            self._names.setdefault(name, set()).add(int(key))
+        return joined
+
+    def probe(self, df):
+        """The chunk with the dimension's attribute columns attached, rows in their original order."""
+        if self.n_partitions == 1:
+            return self._probe_partition(df, self._dims[0])
+        keys = df[self.key].to_numpy(dtype='float64', na_value=np.nan)
+        part = _partition_of(keys, self.n_partitions)
+        joined = df.copy()
+        values = {col: np.full(len(df), np.nan) for col in ATTRIBUTE_COLS}
+        for p in np.unique(part):
+            rows = np.flatnonzero(part == p)
+            result = self._probe_partition(df.take(rows), self._dimension(p))
+            for col in ATTRIBUTE_COLS:
+                values[col][rows] = result[col].to_numpy(dtype='float64')
+        for col in ATTRIBUTE_COLS:
+            joined[col] = values[col]
+        return joined
+
+    def join_report(self):
+        """The totals of join_institutions' reports over every probed chunk."""
+        counts = pd.Series({name: len(keys) for name, keys in self._names.items()}, dtype='int64')
+        counts = counts.sort_values(ascending=False, kind='stable')
+        return {**self.report, 'unmatched_keys': sorted(self._unmatched), 'ambiguous_keys': sorted(self._ambiguous),
+                'shared_names': counts[counts > 1].index.tolist()}
+
+    def close(self):
+        self._dims.clear()
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+
+def run(fos_path, inst_path, processed_dir=PROCESSED_DIR, limit=None, spill_dir=SPILL_DIR, params=None,
+        profiler=None, quarantine_dir=QUARANTINE_DIR):
+    """Stream the Field of Study file through Parts 3-7 and the join within `limit` bytes.
+
+    Writes the processed dataset, the joined dataset and the cube to processed_dir
+    and the rows failing validation to quarantine_dir; returns a summary dict with
+    the chunking, row counts, join report, and the baseline and peak RSS.
+    """
+    limit = memory_limit(limit)
+    budget, baseline = data_budget(limit)
+    params = params or {}
+    profiler = profiler or Profiler('outofcore', debug=False)
+    processed_dir = Path(processed_dir)
+    processed_dir.mkdir(parents=True, exist_ok=True)
+
+    with profiler.stage('Plan chunks'):
+        chunk_rows = plan_chunk_rows(fos_path, budget)
+    with profiler.stage('Build join side'):
+        join = SpillingHashJoin(inst_path, budget * BUILD_SHARE, spill_dir)
+
+    orders = {'ROI_CATEGORY': list(params.get('roi_labels', ROI_LABELS))}
+    cube, rows_in, chunks = None, 0, 0
+    try:
+        with profiler.stage('Stream chunks') as stage, \
+                DatasetWriter(processed_dir / DATASET_NAME, PARTITION_COLS) as processed, \
+                DatasetWriter(processed_dir / JOINED_NAME, PARTITION_COLS) as joined, \
+                QuarantineWriter(QUARANTINE_NAME, quarantine_dir) as quarantine:
+            for chunk in iter_field_of_study(fos_path, chunksize=chunk_rows):
+                rows_in += len(chunk)
+                chunks += 1
+                df = process_chunk(chunk, quarantine=quarantine, **params)
+                del chunk
+                if not len(df):
+                    continue
+                processed.write(df)
+                joined.write(join.probe(df))
+                # Merged as it goes: a cube's size depends on its cells and buckets, not on the rows behind it
+                chunk_cube = RoiCube.build(df)
+                cube = chunk_cube if cube is None else RoiCube.merge([cube, chunk_cube], orders)
+            stage.rows_in, stage.rows_out = rows_in, processed.rows
+        cube.save(processed_dir / CUBE_NAME)
+    finally:
+        join.close()
+
+    peak = _peak_rss()
+    return {
+        'limit_mb': round(limit / 2**20, 1),
+        'baseline_rss_mb': round(baseline / 2**20, 1),
+        'data_budget_mb': round(budget / 2**20, 1),
+        'chunk_rows': chunk_rows,
+        'chunks': chunks,
+        'join_partitions': join.n_partitions,
+        'rows_in': rows_in,
+        'rows_out': processed.rows,
+        'quarantined_rows': quarantine.writer.rows,
+        'cube_cells': cube.n_cells,
+        'join_report': join.join_report(),
+        'peak_rss_mb': round(peak / 2**20, 1),
+        'limit_exceeded': peak > limit,
+    }
+
+
+def _comparable(df):
+    # Category sets and their order depend on which rows a chunk held; compare values
+    df = df.copy()
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+    return df.reset_index(drop=True)
+
+
+def verify(fos_path, inst_path, processed_dir=PROCESSED_DIR, summary=None, params=None):
+    """Rerun the in-memory path and compare it with the out-of-core outputs in processed_dir.
+
+    Returns a list of differences (empty when everything matches).
+    """
+    processed_dir = Path(processed_dir)
+    df = process_chunk(load_field_of_study(fos_path), **(params or {}))
+    df_joined, report = join_institutions(df, build_institution_dimension(read_institutions(inst_path)))
+    problems = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Written and read back the same way, so both sides come out in partition order
+        for name, frame in [(DATASET_NAME, df), (JOINED_NAME, df_joined)]:
+            write_processed(frame, Path(tmp) / name)
+            expected = _comparable(read_processed(Path(tmp) / name))
+            actual = _comparable(read_processed(processed_dir, dataset_name=name))
+            try:
+                pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+            except AssertionError as error:
+                problems.append(f"{name}: {str(error).splitlines()[0]}")
+
+    cube, expected_cube = RoiCube.load(processed_dir / CUBE_NAME), RoiCube.build(df)
+    for dim in expected_cube.dims:
+        for metric in expected_cube.measures:
+            actual = cube.query(metric, by=[dim], quantiles=(0.25, 0.5, 0.75))
+            expected = expected_cube.query(metric, by=[dim], quantiles=(0.25, 0.5, 0.75))
+            try:
+                pd.testing.assert_frame_equal(actual, expected, check_exact=False, rtol=1e-9)
+            except AssertionError as error:
+                problems.append(f"cube {metric} by {dim}: {str(error).splitlines()[0]}")
+
+    if summary is not None:
+        actual = summary['join_report']
+        for name in ['rows', 'matched_rows', 'missing_key_rows', 'unmatched_rows', 'unmatched_keys', 'ambiguous_keys']:
+            if actual[name] != report[name]:
+                problems.append(f"join report {name}: {actual[name]} != {report[name]}")
+        if set(actual['shared_names']) != set(report['shared_names']):
+            problems.append("join report shared_names differ")
+    return problems
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run preprocessing and the institution join out of core.")
+    parser.add_argument('--memory-limit', default=None,
+                        help=f"working memory limit, e.g. 512M or 2G (default: ${MEMORY_ENV} or {DEFAULT_MEMORY_LIMIT})")
+    parser.add_argument('--fos', type=Path, default=None, help="Field of Study CSV (default: the raw data cache)")
+    parser.add_argument('--institutions', type=Path, default=None, help="Institution CSV (default: the raw data cache)")
+    parser.add_argument('--processed-dir', type=Path, default=PROCESSED_DIR)
+    parser.add_argument('--spill-dir', type=Path, default=SPILL_DIR, help="where the join spills its partitions")
+    parser.add_argument('--verify', action='store_true', help="compare the outputs with the in-memory path")
+    args = parser.parse_args()
+
+    fos_path = args.fos or ensure_raw(FOS_FILE, RAW_DIR)
+    inst_path = args.institutions or ensure_raw(INSTITUTION_FILE, RAW_DIR)
+    profiler = Profiler('outofcore', debug=False)
+    summary = run(fos_path, inst_path, args.processed_dir, args.memory_limit, args.spill_dir, profiler=profiler)
+    print(f"Streamed {summary['rows_in']:,} rows in {summary['chunks']} chunks of {summary['chunk_rows']:,} "
+          f"({summary['limit_mb']} MB limit, join build side in {summary['join_partitions']} partition(s)); "
+          f"{summary['rows_out']:,} rows written to {args.processed_dir}, {summary['quarantined_rows']:,} quarantined "
+          f"to {QUARANTINE_DIR}")
+    print(format_join_report(summary['join_report']))
+    print(f"Peak RSS: {summary['peak_rss_mb']} MB (baseline {summary['baseline_rss_mb']} MB, data budget "
+          f"{summary['data_budget_mb']} MB)")
+    if summary['limit_exceeded']:
+        print(f"Warning: peak RSS {summary['peak_rss_mb']} MB exceeded the {summary['limit_mb']} MB limit",
+              file=sys.stderr)
+
+    if args.verify:
+        with profiler.stage('Verify against in-memory path'):
+            problems = verify(fos_path, inst_path, args.processed_dir, summary)
+        print("Outputs match the in-memory path." if not problems else '\n'.join(['MISMATCH:'] + problems))
+
+    print("\nProfile:")
+    print(profiler.report())
+    print("Written to: {} and {}".format(*profiler.save()))
+    sys.exit(1 if args.verify and problems else 0)
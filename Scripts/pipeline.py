@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Incremental Pipeline Runner
+#
+# Runs the preprocessing, institution join and figure scripts as a graph of
+# stages. Every stage output is cached under data/cache/, keyed by a hash of
+# its upstream keys, its parameters and its code, so changing one parameter
+# only re-executes the stages downstream of it:
+#     python pipeline.py
+#     python pipeline.py --set min_class_size=20
+#     python pipeline.py --set 'earnings_bounds=[15000, 400000]' --until categorize
+
+import argparse
+import ast
+import hashlib
+import inspect
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import pandas as pd
+
+from cube import CUBE_NAME, build_cube
+from loader import load_field_of_study
+from rawdata import FOS_FILE, INSTITUTION_FILE, cached_digest, ensure_raw
+from roi_metrics import DEFAULT_INCOME_SHARE, DEFAULT_INTEREST_RATE
+from search import SEARCH_COLUMNS, SEARCH_NAME, build_search_index
+from store import DATASET_NAME, write_processed
+from institutions import build_institution_dimension, format_join_report, join_institutions, read_institutions
+from transforms import (
+    AFFORD_BINS, AFFORD_LABELS, COLUMNS_TO_KEEP, EARNINGS_BOUNDS, MIN_CLASS_SIZE, NUMERIC_COLS,
+    ROI_BINS, ROI_LABELS, add_roi_features, categorize, clean, filter_rows, select_columns,
+)
+from validation import QUARANTINE_NAME, QuarantineWriter, format_summary
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+SCRIPTS_DIR = ROOT_DIR / 'Scripts'
+RAW_DIR = ROOT_DIR / 'data' / 'raw'
+PROCESSED_DIR = ROOT_DIR / 'data' / 'processed'
+CACHE_DIR = ROOT_DIR / 'data' / 'cache'
+QUARANTINE_DIR = ROOT_DIR / 'data' / 'quarantine'
+
+FOS_PATH = RAW_DIR / FOS_FILE
+INST_PATH = RAW_DIR / INSTITUTION_FILE
+QUARANTINE_PATH = QUARANTINE_DIR / f'{QUARANTINE_NAME}_quarantine.parquet'
+
+DEFAULT_PARAMS = {
+    'min_class_size': MIN_CLASS_SIZE,
+    'interest_rate': DEFAULT_INTEREST_RATE,
+    'income_share': DEFAULT_INCOME_SHARE,
+    'earnings_bounds': list(EARNINGS_BOUNDS),
+    'roi_bins': ROI_BINS,
+    'roi_labels': ROI_LABELS,
+    'afford_bins': AFFORD_BINS,
+    'afford_labels': AFFORD_LABELS,
+}
+
+# name: stage name; func(inputs, **params) -> DataFrame; deps: upstream stage names;
+# params: keys of DEFAULT_PARAMS it uses; files: raw inputs hashed by content;
+# code: scripts whose source is part of the key, together with every script in
+# Scripts/ they import (so module constants and callees count); outputs: paths the
+# stage writes as a side effect. Such a stage is only skipped when those paths
+# exist and were last written by a run with the same key.
+Stage = namedtuple('Stage', ['name', 'func', 'deps', 'params', 'files', 'code', 'outputs'])
+
+
+def _load(inputs):
+    return load_field_of_study(ensure_raw(FOS_FILE, RAW_DIR))
+
+
+def _institutions(inputs):
+    return build_institution_dimension(read_institutions(ensure_raw(INSTITUTION_FILE, RAW_DIR)))
+
+
+def _select(inputs):
+    # 'load' is also read by the search stage, so select copies it; clean/roi/categorize
+    # then assign into their input in place, which has no other consumer
+    return select_columns(inputs['load'], COLUMNS_TO_KEEP)
+
+
+def _clean(inputs):
+    return clean(inputs['select'], NUMERIC_COLS, copy=False)
+
+
+def _roi(inputs, interest_rate, income_share):
+    return add_roi_features(inputs['clean'], interest_rate=interest_rate, income_share=income_share, copy=False)
+
+
+def _filter(inputs, min_class_size, earnings_bounds):
+    with QuarantineWriter(QUARANTINE_NAME, QUARANTINE_DIR) as quarantine:
+        df = filter_rows(inputs['roi'], min_class_size=min_class_size, earnings_bounds=earnings_bounds,
+                         quarantine=quarantine)
+    print(format_summary(quarantine.summary()))
+    return df
+
+
+def _categorize(inputs, roi_bins, roi_labels, afford_bins, afford_labels):
+    return categorize(inputs['filter'], roi_bins=roi_bins, roi_labels=roi_labels,
+                      afford_bins=afford_bins, afford_labels=afford_labels, copy=False)
+
+
+def _join(inputs):
+    # Reports how well the keys match; 03_fairness.py joins the processed data itself
+    df_joined, report = join_institutions(inputs['categorize'], inputs['institutions'])
+    print(format_join_report(report))
+    return df_joined
+
+
+def _export(inputs):
+    dataset_path, _ = write_processed(inputs['categorize'], PROCESSED_DIR)
+    return pd.DataFrame({'path': [str(dataset_path)], 'rows': [len(inputs['categorize'])]})
+
+
+def _cube(inputs):
+    cube = build_cube(inputs['categorize'], PROCESSED_DIR)
+    return pd.DataFrame({'path': [str(PROCESSED_DIR / CUBE_NAME)], 'cells': [cube.n_cells]})
+
+
+def _search(inputs):
+    # Built from every loaded row, so programs dropped by the filters can still be looked up
+    index = build_search_index(inputs['load'][SEARCH_COLUMNS], PROCESSED_DIR)
+    return pd.DataFrame({'path': [str(PROCESSED_DIR / SEARCH_NAME)], 'institutions': [len(index.institutions)],
+                         'programs': [len(index.programs)]})
+
+
+def _figures(inputs):
+    # The analysis scripts read data/processed and write figures/ themselves
+    env = {**os.environ, 'MPLBACKEND': 'Agg'}
+    rows = []
+    for script in ['02_analysis.py', '03_fairness.py']:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, script], cwd=SCRIPTS_DIR, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        rows.append({'script': script, 'seconds': round(time.perf_counter() - start, 3)})
+    return pd.DataFrame(rows)
+
+
+STAGES = [
+    Stage('load', _load, [], [], [FOS_PATH], ['loader.py'], []),
+    Stage('institutions', _institutions, [], [], [INST_PATH], ['institutions.py'], []),
+    Stage('select', _select, ['load'], [], [], ['transforms.py'], []),
+    Stage('clean', _clean, ['select'], [], [], ['transforms.py'], []),
+    Stage('roi', _roi, ['clean'], ['interest_rate', 'income_share'], [], ['transforms.py', 'roi_metrics.py'], []),
+    Stage('filter', _filter, ['roi'], ['min_class_size', 'earnings_bounds'], [],
+          ['transforms.py', 'validation.py'], [QUARANTINE_PATH]),
+    Stage('categorize', _categorize, ['filter'],
+          ['roi_bins', 'roi_labels', 'afford_bins', 'afford_labels'], [], ['transforms.py', 'compact.py'], []),
+    Stage('join', _join, ['categorize', 'institutions'], [], [], ['institutions.py'], []),
+    Stage('export', _export, ['categorize'], [], [], ['store.py'], [PROCESSED_DIR / DATASET_NAME]),
+    Stage('cube', _cube, ['categorize'], [], [], ['cube.py'], [PROCESSED_DIR / CUBE_NAME]),
+    Stage('search', _search, ['load'], [], [], ['search.py'], [PROCESSED_DIR / SEARCH_NAME]),
+    Stage('figures', _figures, ['export', 'cube', 'institutions'], [], [],
+          ['02_analysis.py', '03_fairness.py', 'figure_jobs.py'], [ROOT_DIR / 'figures']),
+]
+
+
+def _local_imports(path):
+    """Scripts in Scripts/ that `path` imports (at any level, including inside functions)."""
+    names = []
+    for node in ast.walk(ast.parse(path.read_text())):
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.append(node.module)
+    return [SCRIPTS_DIR / f'{name}.py' for name in names if (SCRIPTS_DIR / f'{name}.py').exists()]
+
+
+def _code_digest(stage):
+    # Whole files rather than single functions, so constants (MAJOR_MAP, FOS_DTYPES,
+    # CHECKS, ...) and helpers are part of the key, followed through local imports
+    sources = [inspect.getsource(stage.func)]
+    pending, seen = [SCRIPTS_DIR / name for name in stage.code], set()
+    while pending:
+        path = pending.pop(0)
+        if path in seen:
+            continue
+        seen.add(path)
+        sources.append(path.read_text())
+        pending.extend(_local_imports(path))
+    return hashlib.sha256('\n'.join(sources).encode()).hexdigest()
+
+
+def stage_key(stage, params, upstream_keys):
+    """Hash of everything that determines a stage's output."""
+    payload = {
+        'stage': stage.name,
+        'params': {name: params[name] for name in stage.params},
+        'deps': [upstream_keys[dep] for dep in stage.deps],
+        # Raw files are hashed once and then recognized by size + mtime
+        'files': [cached_digest(path) if path.exists() else None for path in stage.files],
+        'code': _code_digest(stage),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:20]
+
+
+def _cache_path(cache_dir, stage, key):
+    return cache_dir / f'{stage.name}-{key}.parquet'
+
+
+def run(params=None, until=None, force=(), cache_dir=CACHE_DIR):
+    """Run the stage graph, reusing cached outputs whose keys are unchanged.
+
+    Returns a DataFrame with one row per stage: key, whether it ran, and seconds.
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    stages = STAGES
+    if until is not None:
+        names = [stage.name for stage in STAGES]
+        stages = STAGES[:names.index(until) + 1]
+
+    keys, frames, report = {}, {}, []
+    by_name = {stage.name: stage for stage in STAGES}
+
+    def get(name):
+        # Cached outputs are only read back when a downstream stage actually needs them
+        if name not in frames:
+            frames[name] = pd.read_parquet(_cache_path(cache_dir, by_name[name], keys[name]))
+        return frames[name]
+
+    for stage in stages:
+        key = stage_key(stage, params, keys)
+        keys[stage.name] = key
+        path = _cache_path(cache_dir, stage, key)
+        marker = cache_dir / f'{stage.name}.published'
+        cached = (path.exists() and stage.name not in force
+                  and all(Path(output).exists() for output in stage.outputs)
+                  and (not stage.outputs or (marker.exists() and marker.read_text() == key)))
+        start = time.perf_counter()
+        if not cached:
+            inputs = {dep: get(dep) for dep in stage.deps}
+            result = stage.func(inputs, **{name: params[name] for name in stage.params})
+            tmp_path = path.with_suffix('.tmp')
+            result.to_parquet(tmp_path, index=False)
+            tmp_path.replace(path)
+            if stage.outputs:
+                marker.write_text(key)
+            frames[stage.name] = result
+        elapsed = time.perf_counter() - start
+        print(f"{stage.name:<13} {'cached' if cached else 'ran':<7} {elapsed:8.2f}s  {key}")
+        report.append({'stage': stage.name, 'key': key, 'ran': not cached, 'seconds': round(elapsed, 3)})
+    return pd.DataFrame(report).set_index('stage')
+
+
+def _parse_set(values):
+    params = {}
+    for item in values:
+        name, _, value = item.partition('=')
+        if name not in DEFAULT_PARAMS:
+            raise SystemExit(f"Unknown parameter '{name}'; expected one of {sorted(DEFAULT_PARAMS)}")
+        params[name] = json.loads(value)
+    return params
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the College Scorecard ROI pipeline with stage caching.")
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=JSON',
+                        help="override a parameter, e.g. min_class_size=20")
+    parser.add_argument('--until', choices=[stage.name for stage in STAGES],
+                        help="stop after this stage")
+    parser.add_argument('--force', action='append', default=[], choices=[stage.name for stage in STAGES],
+                        help="re-run this stage even if its output is cached")
+    args = parser.parse_args()
+    run(_parse_set(args.set), until=args.until, force=set(args.force))
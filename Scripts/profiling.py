@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Stage Instrumentation
+#
+# A Profiler records, for each stage of a script (each Part of
+# 01_preprocess.py, each block of the analysis scripts), its wall and CPU time,
+# how much it raised the peak RSS, rows in and out, and the bytes the process
+# read and wrote through system calls. Stages are opened with stage() and
+# closed with end() (or by using the stage as a context manager), so the
+# notebook-style scripts stay flat. save() writes the records as JSON and as a
+# Chrome trace (open it in chrome://tracing or https://ui.perfetto.dev).
+#
+# The scripts' verbose diagnostics (head(), info(), describe()) only run at the
+# debug level: pass --debug or set SCORECARD_DEBUG=1. Summarize saved profiles:
+#     python profiling.py ../data/profiles/01_preprocess.json
+
+import json
+import os
+import resource
+import sys
+import time
+from pathlib import Path
+
+PROFILES_DIR = Path('../data/profiles')
+DEBUG_ENV = 'SCORECARD_DEBUG'
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+_MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+def debug_enabled(argv=None):
+    """True when --debug is on the command line or SCORECARD_DEBUG is set (and not 0)."""
+    argv = sys.argv[1:] if argv is None else argv
+    return '--debug' in argv or os.environ.get(DEBUG_ENV, '') not in ('', '0')
+
+
+def _io_counters():
+    # Bytes through read()/write() calls (files, pipes and the terminal alike); Linux only
+    try:
+        with open('/proc/self/io') as f:
+            fields = dict(line.split(': ') for line in f.read().splitlines())
+        return int(fields['rchar']), int(fields['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _sample():
+    times = os.times()
+    read, written = _io_counters()
+    return {
+        'wall': time.perf_counter(),
+        # Includes pool workers once they have exited
+        'cpu': times.user + times.system + times.children_user + times.children_system,
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_UNIT,
+        'read': read,
+        'written': written,
+    }
+
+
+class Stage:
+    """One timed stage; closed by Profiler.end() or on leaving a `with` block."""
+
+    def __init__(self, profiler, name, rows_in, depth):
+        self.profiler = profiler
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.depth = depth
+        self.start = _sample()
+        self.record = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.record is None:
+            self.profiler.end(self.rows_out)
+
+
+class Profiler:
+    """Per-stage instrumentation for one script run."""
+
+    def __init__(self, name, debug=None):
+        self.name = name
+        self.debug = debug_enabled() if debug is None else debug
+        self.records = []
+        self._open = []
+        self._origin = _sample()
+
+    def stage(self, name, rows_in=None):
+        """Open a stage (nested inside any stage still open)."""
+        stage = Stage(self, name, rows_in, len(self._open))
+        self._open.append(stage)
+        return stage
+
+    def end(self, rows_out=None):
+        """Close the innermost open stage and return its record."""
+        stage = self._open.pop()
+        end = _sample()
+        start = stage.start
+        rows_out = stage.rows_out if rows_out is None else rows_out
+
+        def delta(key):
+            return None if start[key] is None or end[key] is None else end[key] - start[key]
+
+        stage.record = {
+            'stage': stage.name,
+            'depth': stage.depth,
+            'start_s': round(start['wall'] - self._origin['wall'], 6),
+            'wall_s': round(end['wall'] - start['wall'], 6),
+            'cpu_s': round(end['cpu'] - start['cpu'], 6),
+            'peak_rss_mb': round(end['peak_rss'] / 2**20, 2),
+            'peak_rss_delta_mb': round((end['peak_rss'] - start['peak_rss']) / 2**20, 2),
+            'rows_in': None if stage.rows_in is None else int(stage.rows_in),
+            'rows_out': None if rows_out is None else int(rows_out),
+            'bytes_read': delta('read'),
+            'bytes_written': delta('written'),
+        }
+        self.records.append(stage.record)
+        return stage.record
+
+    def close(self):
+        """Close every stage still open."""
+        while self._open:
+            self.end()
+
+    def to_json(self):
+        return {'script': self.name, 'pid': os.getpid(), 'debug': self.debug,
+                'stages': sorted(self.records, key=lambda record: record['start_s'])}
+
+    def to_chrome_trace(self):
+        """Trace Event Format: one complete event per stage plus an RSS counter track."""
+        pid = os.getpid()
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': self.name}}]
+        for record in sorted(self.records, key=lambda record: record['start_s']):
+            start_us = record['start_s'] * 1e6
+            args = {key: value for key, value in record.items() if key not in ('stage', 'start_s', 'depth')}
+            events.append({'name': record['stage'], 'cat': self.name, 'ph': 'X', 'pid': pid, 'tid': 0,
+                           'ts': start_us, 'dur': record['wall_s'] * 1e6, 'args': args})
+            events.append({'name': 'peak RSS (MB)', 'ph': 'C', 'pid': pid, 'tid': 0,
+                           'ts': start_us + record['wall_s'] * 1e6, 'args': {'MB': record['peak_rss_mb']}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self, profiles_dir=PROFILES_DIR):
+        """Write <name>.json and <name>.trace.json; returns both paths."""
+        self.close()
+        profiles_dir = Path(profiles_dir)
+        profiles_dir.mkdir(parents=True, exist_ok=True)
+        json_path = profiles_dir / f'{self.name}.json'
+        trace_path = profiles_dir / f'{self.name}.trace.json'
+        json_path.write_text(json.dumps(self.to_json(), indent=2))
+        trace_path.write_text(json.dumps(self.to_chrome_trace()))
+        return json_path, trace_path
+
+    def report(self):
+        return format_report(self.to_json()['stages'])
+
+
+def _mb(value):
+    return '' if value is None else f'{value / 2**20:.1f}'
+
+
+def format_report(records):
+    """Fixed-width table of stage records."""
+    lines = [f"{'stage':<44} {'wall s':>8} {'cpu s':>8} {'peak MB':>8} {'+MB':>7} {'rows in':>9} {'rows out':>9} "
+             f"{'read MB':>8} {'write MB':>8}"]
+    for record in records:
+        name = '  ' * record['depth'] + record['stage']
+        rows_in = '' if record['rows_in'] is None else record['rows_in']
+        rows_out = '' if record['rows_out'] is None else record['rows_out']
+        lines.append(f"{name[:44]:<44} {record['wall_s']:8.3f} {record['cpu_s']:8.3f} {record['peak_rss_mb']:8.1f} "
+                     f"{record['peak_rss_delta_mb']:7.1f} {rows_in:>9} {rows_out:>9} "
+                     f"{_mb(record['bytes_read']):>8} {_mb(record['bytes_written']):>8}")
+    top = [record for record in records if record['depth'] == 0]
+    lines.append(f"Total {sum(record['wall_s'] for record in top):.3f}s wall, "
+                 f"{sum(record['cpu_s'] for record in top):.3f}s CPU")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    paths = [Path(arg) for arg in sys.argv[1:]] or [
+        path for path in sorted(PROFILES_DIR.glob('*.json')) if not path.name.endswith('.trace.json')]
+    for path in paths:
+        profile = json.loads(path.read_text())
+        if not isinstance(profile, dict) or 'stages' not in profile:
+            # Not written by Profiler.save()
+            continue
+        print(f"\n{profile['script']} ({path})")
+        print(format_report(profile['stages']))
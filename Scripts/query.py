@@ -0,0 +1,503 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Query Service
+#
+# Answers filter, group and top-k questions over the processed Field of Study
+# data ("median ROI for Master's degrees in Business at private non-profits",
+# "top programs by ROI at institution X") without rerunning the scripts.
+#
+# RoiIndex is built once at load: rows are stored in descending ROI order, each
+# of INDEX_COLUMNS keeps one sorted posting list of row positions per value,
+# and each metric keeps every row's rank, so a filter intersects posting lists
+# and a group median is a lookup after one integer sort. QueryEngine puts an
+# LRU result cache and p50/p99 latency tracking in front of the index (and of
+# the name search index from search.py and the comparable-program index from
+# neighbors.py), and serve() exposes it as a small JSON HTTP service:
+#     python query.py                   # build the index and time a query mix
+#     python query.py --serve --port 8000
+#     curl 'localhost:8000/group?metric=ROI_EARNINGS_TO_DEBT&MAJOR_FIELD=Business&CONTROL=Private,%20nonprofit'
+#     curl 'localhost:8000/search?institution=univ%20of%20nothern%20colorado&program=nursing'
+#     curl 'localhost:8000/similar?unitid=100654&cipcode=5202&credlev=3&k=5'
+
+import argparse
+import json
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+INDEX_COLUMNS = ['MAJOR_FIELD', 'CREDENTIAL_LEVEL_NAME', 'CONTROL', 'ROI_CATEGORY', 'INSTNM']
+METRICS = ['ROI_EARNINGS_TO_DEBT', 'EARN_MDN_5YR', 'DEBT_ALL_STGP_ANY_MDN', 'MONTHLY_PAYMENT_PCT', 'PAYBACK_YEARS']
+DISPLAY_COLUMNS = ['UNITID', 'INSTNM', 'CIPDESC', 'CREDENTIAL_LEVEL_NAME', 'CONTROL', 'MAJOR_FIELD', 'ROI_CATEGORY']
+ORDER_BY = 'ROI_EARNINGS_TO_DEBT'
+
+CACHE_SIZE = 4096
+# Latencies kept for the percentiles (most recent queries)
+LATENCY_WINDOW = 100_000
+DEFAULT_LIMIT = 100
+
+HOST = '127.0.0.1'
+PORT = 8000
+
+
+class QueryError(ValueError):
+    """A query names an unknown column or metric, or has an invalid parameter."""
+
+
+class UnknownEndpoint(LookupError):
+    """The request path is not one of the service's endpoints."""
+
+
+def _metric_values(df, metric):
+    # inf (zero debt, payments that never cover interest) counts as missing, as in 02_analysis.py
+    values = df[metric].to_numpy(dtype='float64', na_value=np.nan)
+    return np.where(np.isfinite(values), values, np.nan)
+
+
+class RoiIndex:
+    """Posting lists and metric ranks over the processed rows; read-only once built."""
+
+    def __init__(self, df, columns=INDEX_COLUMNS, metrics=METRICS, order_by=ORDER_BY):
+        self.columns = [col for col in columns if col in df.columns]
+        self.metrics = [metric for metric in metrics if metric in df.columns]
+        order = np.argsort(-_metric_values(df, order_by), kind='stable')    # NaN last
+        display = [col for col in DISPLAY_COLUMNS if col in df.columns]
+        self.rows = df.take(order)[display + self.metrics].reset_index(drop=True)
+        self.n_rows = len(self.rows)
+        self.order_by = order_by
+        self._all = np.arange(self.n_rows, dtype='int32')
+
+        self.categories, self.codes, self.postings, self._lookup = {}, {}, {}, {}
+        for col in self.columns:
+            values = pd.Categorical(self.rows[col]).remove_unused_categories()
+            codes = values.codes.astype('int32')
+            # A stable sort by code leaves each value's rows in ROI order; missing values (-1) come first
+            by_code = np.argsort(codes, kind='stable').astype('int32')
+            counts = np.bincount(codes[codes >= 0], minlength=len(values.categories))
+            self.postings[col] = np.split(by_code[int((codes < 0).sum()):], np.cumsum(counts)[:-1])
+            self.categories[col] = [str(value) for value in values.categories]
+            self.codes[col] = codes
+            self._lookup[col] = {value.casefold(): code for code, value in enumerate(self.categories[col])}
+
+        # rank[metric][row]: position of the row in ascending metric order; rows ranked >= n_valid are missing
+        self.rank, self.sorted_values, self.n_valid = {}, {}, {}
+        for metric in self.metrics:
+            values = _metric_values(self.rows, metric)
+            ascending = np.argsort(values, kind='stable')
+            rank = np.empty(self.n_rows, dtype='int64')
+            rank[ascending] = np.arange(self.n_rows)
+            self.rank[metric] = rank
+            self.sorted_values[metric] = values[ascending]
+            self.n_valid[metric] = int(np.isfinite(values).sum())
+
+    def _codes_for(self, col, values):
+        return sorted({self._lookup[col][value] for value in values if value in self._lookup[col]})
+
+    def select(self, where=()):
+        """Sorted positions of the rows matching every (column, values) pair in `where`.
+
+        Starts from the shortest posting list and checks the other columns' codes on
+        those rows only, so the cost follows the most selective condition.
+        """
+        conditions = []
+        for col, values in where:
+            codes = self._codes_for(col, values)
+            if not codes:
+                return self._all[:0]
+            conditions.append((sum(len(self.postings[col][code]) for code in codes), col, codes))
+        if not conditions:
+            return self._all
+        conditions.sort(key=lambda condition: condition[0])
+        _, col, codes = conditions[0]
+        if len(codes) == 1:
+            rows = self.postings[col][codes[0]]
+        else:
+            rows = np.sort(np.concatenate([self.postings[col][code] for code in codes]))
+        for _, col, codes in conditions[1:]:
+            rows = rows[np.isin(self.codes[col][rows], codes)]
+        return rows
+
+    def count(self, where=()):
+        return len(self.select(where))
+
+    def filter(self, where=(), limit=DEFAULT_LIMIT, offset=0):
+        """Matching rows in descending ROI order (a page of `limit` rows from `offset`)."""
+        rows = self.select(where)[offset:offset + limit]
+        return self.rows.take(rows).reset_index(drop=True)
+
+    def top(self, metric=ORDER_BY, k=10, where=(), ascending=False):
+        """The k rows with the highest (or lowest) `metric` among the matching rows."""
+        rows = self.select(where)
+        rank = self.rank[metric][rows]
+        rows, rank = rows[rank < self.n_valid[metric]], rank[rank < self.n_valid[metric]]
+        if metric == self.order_by:
+            # Rows are stored in descending ROI order already
+            chosen = rows[-k:][::-1] if ascending else rows[:k]
+        else:
+            key = rank if ascending else -rank
+            if len(key) > k:
+                part = np.argpartition(key, k - 1)[:k]
+                rows, key = rows[part], key[part]
+            chosen = rows[np.argsort(key, kind='stable')]
+        return self.rows.take(chosen).reset_index(drop=True)
+
+    def group(self, metric=ORDER_BY, by=(), where=()):
+        """count, mean, median, min and max of `metric` per combination of `by`, over the matching rows."""
+        rows = self.select(where)
+        rank = self.rank[metric][rows]
+        valid = rank < self.n_valid[metric]
+        by = list(by)
+        if by:
+            codes = [self.codes[col][rows] for col in by]
+            for col_codes in codes:
+                valid &= col_codes >= 0
+            shape = tuple(len(self.categories[col]) for col in by)
+            keys = np.ravel_multi_index([col_codes[valid] for col_codes in codes], shape)
+            groups, group_of_row = np.unique(keys, return_inverse=True)
+        else:
+            groups, group_of_row = np.zeros(1, dtype='int64'), np.zeros(int(valid.sum()), dtype='int64')
+        rank = rank[valid]
+
+        # One sort of (group, rank) puts each group's values in order; the median is read off by position
+        ordered = np.sort(group_of_row * self.n_rows + rank) % self.n_rows
+        counts = np.bincount(group_of_row, minlength=len(groups))
+        starts = np.cumsum(counts) - counts
+        values = self.sorted_values[metric]
+        result = {'count': counts}
+        if len(ordered):
+            # Every group has at least one row here
+            result['mean'] = np.bincount(group_of_row, weights=values[rank], minlength=len(groups)) / counts
+            result['median'] = (values[ordered[starts + (counts - 1) // 2]] + values[ordered[starts + counts // 2]]) / 2
+            result['min'] = values[ordered[starts]]
+            result['max'] = values[ordered[starts + counts - 1]]
+        else:
+            result.update({name: np.full(len(groups), np.nan) for name in ['mean', 'median', 'min', 'max']})
+
+        if by:
+            labels = np.unravel_index(groups, shape)
+            index = pd.MultiIndex.from_arrays(
+                [np.asarray(self.categories[col], dtype=object)[codes] for col, codes in zip(by, labels)], names=by)
+            if len(by) == 1:
+                index = index.get_level_values(0)
+        else:
+            index = pd.Index(['all'])
+        return pd.DataFrame(result, index=index)
+
+
+class LatencyRecorder:
+    """Query latencies over a sliding window of the most recent `window` queries."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = np.zeros(window)
+        self.count = 0
+
+    def record(self, seconds):
+        self._samples[self.count % len(self._samples)] = seconds
+        self.count += 1
+
+    def summary(self):
+        samples = self._samples[:min(self.count, len(self._samples))]
+        if not len(samples):
+            return {'queries': 0, 'p50_ms': None, 'p99_ms': None, 'max_ms': None}
+        p50, p99, worst = (float(value) * 1000 for value in (*np.percentile(samples, [50, 99]), samples.max()))
+        return {'queries': self.count, 'p50_ms': round(p50, 4), 'p99_ms': round(p99, 4), 'max_ms': round(worst, 4)}
+
+
+class QueryEngine:
+    """Validated, cached queries over a RoiIndex.
+
+    `where` maps an index column to a value or a list of values (matched
+    case-insensitively), e.g. {'MAJOR_FIELD': 'Business', 'CONTROL': ['Public']}.
+    Results are cached by their normalized query, so the same question asked
+    with different spelling or list order is answered from the cache. Name
+    lookups (search()) need a search.SearchIndex and comparable programs
+    (similar()) a neighbors.ProgramNeighbors.
+    """
+
+    def __init__(self, index, cache_size=CACHE_SIZE, search_index=None, neighbors=None):
+        self.index = index
+        self.search_index = search_index
+        self.neighbors = neighbors
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        self.latency = LatencyRecorder()
+
+    @classmethod
+    def from_processed(cls, processed_dir=None, cache_size=CACHE_SIZE):
+        """Index the processed dataset, with the saved search index if pipeline.py has built one.
+
+        Comparable programs are indexed when the institution dimension has been
+        saved (by 03_fairness.py or neighbors.py), since they need its tuition.
+        """
+        from institutions import JOIN_KEY, join_institutions, read_dimension
+        from search import SEARCH_NAME, load_search_index
+        from store import PROCESSED_DIR, read_processed
+        processed_dir = Path(processed_dir or PROCESSED_DIR)
+        search_index = load_search_index(processed_dir) if (processed_dir / SEARCH_NAME).exists() else None
+        df = read_processed(processed_dir)
+        neighbors = None
+        dim = read_dimension(processed_dir, JOIN_KEY)
+        if dim is not None:
+            from neighbors import ProgramNeighbors
+            neighbors = ProgramNeighbors(join_institutions(df, dim, key=JOIN_KEY)[0])
+        return cls(RoiIndex(df), cache_size, search_index, neighbors)
+
+    def _where(self, where):
+        normalized = []
+        for col, values in (where or {}).items():
+            if col not in self.index.columns:
+                raise QueryError(f"Unknown filter column '{col}'; use one of {self.index.columns}")
+            values = values if isinstance(values, (list, tuple, set)) else [values]
+            normalized.append((col, tuple(sorted({str(value).casefold() for value in values}))))
+        return tuple(sorted(normalized))
+
+    def _metric(self, metric):
+        if metric not in self.index.metrics:
+            raise QueryError(f"Unknown metric '{metric}'; use one of {self.index.metrics}")
+        return metric
+
+    def _run(self, kind, **params):
+        start = time.perf_counter()
+        key = (kind,) + tuple(sorted(params.items()))
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+        if result is None:
+            if kind == 'similar':
+                source = self.neighbors
+            else:
+                source = self.search_index if kind.startswith('find_') else self.index
+            result = getattr(source, kind)(**params)
+            with self._lock:
+                self.misses += 1
+                if self.cache_size:
+                    self._cache[key] = result
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+        with self._lock:
+            self.latency.record(time.perf_counter() - start)
+        # Cached frames are shared, so callers get their own copy
+        return result.copy() if isinstance(result, pd.DataFrame) else result
+
+    def count(self, where=None):
+        return self._run('count', where=self._where(where))
+
+    def filter(self, where=None, limit=DEFAULT_LIMIT, offset=0):
+        if limit < 0 or offset < 0:
+            raise QueryError("limit and offset must not be negative")
+        return self._run('filter', where=self._where(where), limit=int(limit), offset=int(offset))
+
+    def top(self, metric=ORDER_BY, k=10, where=None, ascending=False):
+        if k < 1:
+            raise QueryError("k must be at least 1")
+        return self._run('top', metric=self._metric(metric), k=int(k), where=self._where(where),
+                         ascending=bool(ascending))
+
+    def group(self, metric=ORDER_BY, by=(), where=None):
+        by = tuple(by)
+        for col in by:
+            if col not in self.index.columns:
+                raise QueryError(f"Unknown group column '{col}'; use one of {self.index.columns}")
+        return self._run('group', metric=self._metric(metric), by=by, where=self._where(where))
+
+    def search(self, institution=None, program=None, limit=10, prefix=False):
+        """Institutions and/or programs by (possibly misspelled or partial) name, with their keys."""
+        if self.search_index is None:
+            raise QueryError("No search index loaded; run pipeline.py (search stage) first")
+        if limit < 1:
+            raise QueryError("limit must be at least 1")
+        if institution and program:
+            return self._run('find_offerings', institution=institution, program=program, limit=int(limit),
+                             prefix=bool(prefix))
+        if institution:
+            return self._run('find_institutions', query=institution, limit=int(limit), prefix=bool(prefix))
+        if program:
+            return self._run('find_programs', query=program, limit=int(limit), prefix=bool(prefix))
+        raise QueryError("Give an institution and/or a program name to search for")
+
+    def similar(self, unitid, cipcode, credlev, k=10):
+        """The k programs most like one program (same credential level and CIP family), closest first."""
+        if self.neighbors is None:
+            raise QueryError("No comparable-program index loaded; run 03_fairness.py or neighbors.py first")
+        if k < 1:
+            raise QueryError("k must be at least 1")
+        try:
+            return self._run('similar', unitid=int(unitid), cipcode=int(cipcode), credlev=int(credlev), k=int(k))
+        except KeyError as error:
+            raise QueryError(error.args[0]) from None
+
+    def values(self):
+        """The values of every index column, e.g. for a front end's dropdowns."""
+        return dict(self.index.categories)
+
+    def metrics(self):
+        """Query count, latency percentiles and cache statistics."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {**self.latency.summary(), 'cache_hits': self.hits, 'cache_misses': self.misses,
+                    'cache_hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                    'cache_entries': len(self._cache), 'cache_size': self.cache_size}
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+
+def _records(frame, index=False):
+    # to_json writes NaN as null and numpy scalars as plain numbers
+    frame = frame.reset_index() if index else frame
+    return json.loads(frame.to_json(orient='records'))
+
+
+def _first(params, name, default, convert=str):
+    try:
+        return convert(params[name][0]) if name in params else default
+    except ValueError:
+        raise QueryError(f"Invalid value for '{name}': {params[name][0]!r}")
+
+
+def handle(engine, path, params):
+    """Answer one HTTP request path with its parsed query string; returns a JSON-ready dict."""
+    where = {col: params[col] for col in engine.index.columns if col in params}
+    metric = _first(params, 'metric', ORDER_BY)
+    if path == '/filter':
+        limit = _first(params, 'limit', DEFAULT_LIMIT, int)
+        offset = _first(params, 'offset', 0, int)
+        return {'total': engine.count(where), 'rows': _records(engine.filter(where, limit, offset))}
+    if path == '/top':
+        k = _first(params, 'k', 10, int)
+        ascending = _first(params, 'order', 'desc') == 'asc'
+        return {'rows': _records(engine.top(metric, k, where, ascending))}
+    if path == '/group':
+        by = [col for value in params.get('by', []) for col in value.split(',') if col]
+        result = engine.group(metric, by, where)
+        return {'groups': _records(result, index=True)}
+    if path == '/search':
+        limit = _first(params, 'limit', 10, int)
+        prefix = _first(params, 'prefix', '0') not in ('0', 'false', '')
+        result = engine.search(_first(params, 'institution', None), _first(params, 'program', None), limit, prefix)
+        return {'results': _records(result)}
+    if path == '/similar':
+        keys = [_first(params, name, None, int) for name in ('unitid', 'cipcode', 'credlev')]
+        if None in keys:
+            raise QueryError("Give the program's unitid, cipcode and credlev")
+        return {'rows': _records(engine.similar(*keys, k=_first(params, 'k', 10, int)))}
+    if path == '/count':
+        return {'total': engine.count(where)}
+    if path == '/values':
+        return engine.values()
+    if path == '/metrics':
+        return engine.metrics()
+    raise UnknownEndpoint(path)
+
+
+def make_handler(engine):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            try:
+                status, body = 200, handle(engine, url.path, parse_qs(url.query))
+            except QueryError as error:
+                status, body = 400, {'error': str(error)}
+            except UnknownEndpoint:
+                status, body = 404, {'error': f"Unknown endpoint '{url.path}'"}
+            except Exception as error:
+                # A bug in the engine still gets an answer instead of a dropped connection
+                status, body = 500, {'error': f"Internal error: {type(error).__name__}: {error}"}
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            # One log line per query would dominate the service time
+            pass
+
+    return Handler
+
+
+def serve(engine, host=HOST, port=PORT):
+    server = ThreadingHTTPServer((host, port), make_handler(engine))
+    print(f"Serving {engine.index.n_rows} rows on http://{host}:{port} "
+          f"(/filter, /top, /group, /search, /similar, /count, /values, /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def query_mix(index, n_distinct=500, seed=0):
+    """Random filter / top / group queries over the index's values, as (method, kwargs) pairs."""
+    rng = np.random.default_rng(seed)
+    small = [col for col in index.columns if col != 'INSTNM']
+    queries = []
+    for _ in range(n_distinct):
+        cols = rng.choice(small, size=rng.integers(0, 3), replace=False)
+        where = {col: index.categories[col][rng.integers(len(index.categories[col]))] for col in cols}
+        kind = rng.choice(['group', 'top', 'filter', 'institution'])
+        if kind == 'group':
+            by = [col for col in small if col not in where][:rng.integers(0, 2)]
+            queries.append(('group', {'metric': str(rng.choice(index.metrics)), 'by': by, 'where': where}))
+        elif kind == 'top':
+            queries.append(('top', {'metric': str(rng.choice(index.metrics)), 'k': 10, 'where': where}))
+        elif kind == 'filter':
+            queries.append(('filter', {'where': where, 'limit': 50}))
+        else:
+            name = index.categories['INSTNM'][rng.integers(len(index.categories['INSTNM']))]
+            queries.append(('top', {'k': 10, 'where': {'INSTNM': name}}))
+    return queries
+
+
+def benchmark(engine, queries, n_queries=20_000, seed=1):
+    """Run n_queries drawn (with Zipf-like repetition) from `queries`; returns queries per second."""
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, len(queries) + 1)
+    picks = rng.choice(len(queries), size=n_queries, p=weights / weights.sum())
+    start = time.perf_counter()
+    for pick in picks:
+        method, kwargs = queries[pick]
+        getattr(engine, method)(**kwargs)
+    return n_queries / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Query the processed ROI data from Python or over HTTP.")
+    parser.add_argument('--serve', action='store_true', help="run the HTTP service")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help="LRU entries (0 disables the cache)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    engine = QueryEngine.from_processed(cache_size=args.cache_size)
+    print(f"Indexed {engine.index.n_rows} rows in {time.perf_counter() - start:.3f}s")
+    if args.serve:
+        serve(engine, args.host, args.port)
+    else:
+        print("\nMedian ROI, Master Degree in Business at private non-profits:")
+        print(engine.group(where={'MAJOR_FIELD': 'Business', 'CREDENTIAL_LEVEL_NAME': 'Master Degree',
+                                  'CONTROL': 'Private, nonprofit'}).to_string())
+        print("\nMedian ROI by credential level:")
+        print(engine.group(by=['CREDENTIAL_LEVEL_NAME']).round(3).to_string())
+
+        queries = query_mix(engine.index)
+        for label, cache_size in [('no cache', 0), (f'LRU cache of {args.cache_size}', args.cache_size)]:
+            engine = QueryEngine(engine.index, cache_size)
+            qps = benchmark(engine, queries)
+            summary = engine.metrics()
+            print(f"\n{label}: {qps:,.0f} queries/s, p50 {summary['p50_ms']} ms, p99 {summary['p99_ms']} ms, "
+                  f"hit rate {summary['cache_hit_rate']}")
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Raw Data Cache
+#
+# Resolves the raw CSVs under data/raw/ through one place. RAW_FILES lists
+# every file with its source (Google Drive or plain HTTP) and, once pinned,
+# its expected SHA-256 and size. Files not pinned there get the size and
+# SHA-256 of their first fetch (or of the copy found on first use)
+# recorded in data/raw/.verified.json; every later run, and any copy fetched
+# again, is checked against them (--accept takes a new release instead). A file
+# is only used after it verifies; a missing or corrupt file is fetched again
+# into a '.part' file that is renamed into place only after it checks out, so
+# an interrupted download never looks complete.
+#
+# Setting SCORECARD_MIRROR to a directory copies files from that local mirror
+# instead of downloading them (for offline runs); SCORECARD_OFFLINE=1 forbids
+# network sources altogether. Verified checksums are remembered per file with
+# its size and mtime, so unchanged files are not re-hashed on every run:
+#     python rawdata.py                 # fetch anything missing and verify all
+#     python rawdata.py --pin           # print the checksums to pin in RAW_FILES
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import urllib.request
+from collections import namedtuple
+from pathlib import Path
+
+RAW_DIR = Path('../data/raw')
+FINGERPRINTS_NAME = '.fingerprints.json'
+# Size and sha256 recorded for files without pinned values in RAW_FILES
+VERIFIED_NAME = '.verified.json'
+
+MIRROR_ENV = 'SCORECARD_MIRROR'
+OFFLINE_ENV = 'SCORECARD_OFFLINE'
+
+# source: 'drive' (via gdown) or 'http'; sha256/size: expected values, None until pinned
+RawFile = namedtuple('RawFile', ['name', 'source', 'url', 'sha256', 'size'], defaults=(None, None))
+
+FOS_FILE = 'Most-Recent-Cohorts-Field-of-Study.csv'
+INSTITUTION_FILE = 'Most-Recent-Cohorts-Institution.csv'
+
+RAW_FILES = {
+    FOS_FILE: RawFile(
+        FOS_FILE, 'drive', "https://drive.google.com/file/d/1ER-vyYO-dxN-qLAwDFsovOU_-JSw30SP/view?usp=sharing"),
+    INSTITUTION_FILE: RawFile(
+        INSTITUTION_FILE, 'drive', "https://drive.google.com/file/d/1EhS5gZPAqkQI23SJBPRN9ixaniogTnR8/view?usp=sharing"),
+}
+
+
+class RawDataError(RuntimeError):
+    """A raw file is missing and cannot be fetched, or does not match its checksum."""
+
+
+def file_digest(path, block_size=1 << 20):
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _fingerprint(path):
+    stat = Path(path).stat()
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _fingerprints_path(path):
+    return Path(path).parent / FINGERPRINTS_NAME
+
+
+def _read_fingerprints(path):
+    try:
+        return json.loads(_fingerprints_path(path).read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _remember(path, digest):
+    fingerprints = _read_fingerprints(path)
+    fingerprints[Path(path).name] = {**_fingerprint(path), 'sha256': digest}
+    tmp_path = _fingerprints_path(path).with_suffix('.tmp')
+    tmp_path.write_text(json.dumps(fingerprints, indent=2, sort_keys=True))
+    tmp_path.replace(_fingerprints_path(path))
+
+
+def cached_digest(path):
+    """SHA-256 of path, re-hashed only when its size or mtime changed since it was last hashed."""
+    entry = _read_fingerprints(path).get(Path(path).name)
+    if entry and {key: entry.get(key) for key in ('size', 'mtime_ns')} == _fingerprint(path):
+        return entry['sha256']
+    digest = file_digest(path)
+    _remember(path, digest)
+    return digest
+
+
+def _read_verified(raw_dir):
+    try:
+        return json.loads((Path(raw_dir) / VERIFIED_NAME).read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _record_verified(path, digest, source):
+    verified = _read_verified(path.parent)
+    verified[path.name] = {'sha256': digest, 'size': path.stat().st_size, 'source': source}
+    tmp_path = path.parent / (VERIFIED_NAME + '.tmp')
+    tmp_path.write_text(json.dumps(verified, indent=2, sort_keys=True))
+    tmp_path.replace(path.parent / VERIFIED_NAME)
+
+
+def expected(name, raw_dir=RAW_DIR):
+    """RAW_FILES entry with any missing sha256/size filled from the values recorded in raw_dir."""
+    spec = RAW_FILES[name]
+    recorded = _read_verified(raw_dir).get(name, {})
+    return spec._replace(sha256=spec.sha256 or recorded.get('sha256'), size=spec.size or recorded.get('size'))
+
+
+def _problem(path, spec, digest=None):
+    # Size is checked first so a truncated file is caught without hashing it
+    size = Path(path).stat().st_size
+    if spec.size is not None and size != spec.size:
+        return f"size {size} != expected {spec.size}"
+    if spec.sha256 is not None:
+        digest = digest or cached_digest(path)
+        if digest != spec.sha256:
+            return f"sha256 {digest[:12]}... != expected {spec.sha256[:12]}..."
+    return None
+
+
+def _fetch_drive(spec, dest):
+    import gdown
+    if gdown.download(spec.url, str(dest), fuzzy=True) is None:
+        raise RawDataError(f"Google Drive download of '{spec.name}' failed")
+
+
+def _fetch_http(spec, dest):
+    with urllib.request.urlopen(spec.url) as response, open(dest, 'wb') as f:
+        shutil.copyfileobj(response, f, length=1 << 20)
+
+
+SOURCES = {
+    'drive': _fetch_drive,
+    'http': _fetch_http,
+}
+
+
+def _fetch(spec, dest, mirror=None, offline=False):
+    """Fetch spec into dest; returns a description of the source used."""
+    if mirror is not None:
+        mirrored = Path(mirror) / spec.name
+        if mirrored.exists():
+            print(f"Copying '{spec.name}' from mirror '{mirror}'...")
+            shutil.copyfile(mirrored, dest)
+            return f"mirror '{mirror}'"
+        if offline:
+            raise RawDataError(f"'{spec.name}' is not in the mirror '{mirror}' and network sources are disabled")
+    if offline:
+        raise RawDataError(f"'{spec.name}' is missing and network sources are disabled ({OFFLINE_ENV}=1)")
+    print(f"Downloading '{spec.name}' ({spec.source})...")
+    SOURCES[spec.source](spec, dest)
+    return f"{spec.source} download"
+
+
+def ensure_raw(name, raw_dir=RAW_DIR, mirror=None, offline=None, accept=False):
+    """Path to a verified copy of raw file `name`, fetching it if missing or corrupt.
+
+    A fetched copy must match the pinned checksum, or else the recorded one;
+    accept=True lets it replace a recorded checksum it does not match (a new
+    release). mirror/offline default to the SCORECARD_MIRROR / SCORECARD_OFFLINE
+    environment variables.
+    """
+    spec = expected(name, raw_dir)
+    mirror = mirror if mirror is not None else os.environ.get(MIRROR_ENV) or None
+    offline = offline if offline is not None else os.environ.get(OFFLINE_ENV, '') not in ('', '0')
+    path = Path(raw_dir) / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    if path.exists():
+        if spec.sha256 is None and spec.size is None:
+            # Nothing to check against yet: this copy becomes the reference for later runs
+            _record_verified(path, cached_digest(path), 'existing file')
+            print(f"File already exists at '{path}'; recorded its size and sha256 for later runs, skip download.")
+            return path
+        problem = _problem(path, spec)
+        if problem is None:
+            print(f"File already exists at '{path}', skip download.")
+            return path
+        print(f"'{path}' failed verification ({problem}); fetching it again.")
+
+    part_path = path.with_name(path.name + '.part')
+    part_path.unlink(missing_ok=True)
+    try:
+        source = _fetch(spec, part_path, mirror=mirror, offline=offline)
+        digest = file_digest(part_path)
+        pinned = RAW_FILES[name]
+        problem = _problem(part_path, pinned if accept else spec, digest)
+        if problem is not None:
+            hint = '' if pinned.sha256 or spec.sha256 is None else '; pass --accept if the source has a new release'
+            raise RawDataError(f"Fetched '{name}' failed verification ({problem}){hint}")
+        part_path.replace(path)
+    finally:
+        part_path.unlink(missing_ok=True)
+    _remember(path, digest)
+    if pinned.sha256 is not None:
+        print(f"Fetched '{name}' from {source}; it matches its pinned checksum.")
+    elif spec.sha256 is not None and digest == spec.sha256:
+        print(f"Fetched '{name}' from {source}; it matches its recorded checksum.")
+    else:
+        # Nothing trusted to compare with (first fetch, or accepted): record this copy
+        _record_verified(path, digest, source)
+        print(f"Fetched '{name}' from {source} and recorded its checksum (not verified: nothing pinned).")
+    return path
+
+
+def status(raw_dir=RAW_DIR):
+    """One row per raw file: present, size and whether it matches its pinned or recorded checksum."""
+    rows = []
+    for name in RAW_FILES:
+        spec = expected(name, raw_dir)
+        pinned = 'pinned' if RAW_FILES[name].sha256 else 'recorded' if spec.sha256 else 'unpinned'
+        path = Path(raw_dir) / name
+        if not path.exists():
+            rows.append({'file': name, 'present': False, 'size': None, 'sha256': None, 'pinned': pinned,
+                         'problem': 'missing'})
+            continue
+        rows.append({'file': name, 'present': True, 'size': path.stat().st_size, 'sha256': cached_digest(path),
+                     'pinned': pinned, 'problem': _problem(path, spec)})
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fetch and verify the raw College Scorecard files.")
+    parser.add_argument('--mirror', help=f"local mirror directory (default: ${MIRROR_ENV})")
+    parser.add_argument('--offline', action='store_true', help="never use network sources")
+    parser.add_argument('--pin', action='store_true', help="print sha256/size values to pin in RAW_FILES")
+    parser.add_argument('--accept', action='store_true',
+                        help="accept a fetched file that differs from its recorded (not pinned) checksum")
+    args = parser.parse_args()
+
+    failed = False
+    for name in RAW_FILES:
+        try:
+            ensure_raw(name, mirror=args.mirror, offline=args.offline or None, accept=args.accept)
+        except RawDataError as error:
+            print(f"ERROR: {error}")
+            failed = True
+    for row in status():
+        print(f"{row['file']:<45} {'ok' if row['present'] and not row['problem'] else row['problem']:<10} "
+              f"{row['pinned']}")
+        if args.pin and row['present']:
+            print(f"    sha256={row['sha256']!r}, size={row['size']}")
+    sys.exit(1 if failed else 0)
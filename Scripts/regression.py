@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Regression Models of ROI
+#
+# Weighted least squares of ROI_EARNINGS_TO_DEBT on field, credential level,
+# control, in-state tuition and the share of women, weighted by class size
+# (IPEDSCOUNT2), with standard errors clustered by institution. Categorical
+# regressors go into a scipy.sparse design matrix (one stored value per row
+# and column group) instead of a dense get_dummies() frame.
+#
+# High-dimensional fixed effects (institution, full CIPCODE) are absorbed
+# rather than estimated: the outcome and regressors are demeaned within each
+# fixed-effect group, one sparse group-indicator product at a time, and the
+# sweeps alternate until the within transformation stops changing (the method
+# of alternating projections). Regressors the fixed effects absorb (CONTROL
+# and tuition are constant within an institution, MAJOR_FIELD within a CIP
+# code) are dropped from that model and listed. Institutions are keyed on
+# UNITID, since INSTNM repeats across campuses. scipy is imported when a
+# model is built, not with the module. Run directly to fit MODELS
+# and check one against a dense statsmodels fit on a sample:
+#     python regression.py
+#     python regression.py --models cip --no-check
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+OUTCOME = 'ROI_EARNINGS_TO_DEBT'
+WEIGHTS = 'IPEDSCOUNT2'
+CLUSTER = 'UNITID'
+CATEGORICAL = ['MAJOR_FIELD', 'CREDLEV', 'CONTROL']
+# TUITIONFEE_IN in thousands of dollars, so its coefficient is per $1,000
+NUMERIC = ['TUITIONFEE_IN_K', 'UGDS_WOMEN']
+MODELS = {
+    'pooled': [],
+    'cip': ['CIPCODE'],
+    'institution_cip': ['UNITID', 'CIPCODE'],
+}
+
+DEMEAN_TOL = 1e-8
+DEMEAN_MAXITER = 10_000
+# Share of a column's (weighted, centered) variation below which it counts as absorbed / collinear
+COLLINEAR_TOL = 1e-9
+RESULTS_PATH = Path('../figures/notebook2/roi_regression.csv')
+
+
+def model_frame(df, outcome=OUTCOME, numeric=NUMERIC, categorical=CATEGORICAL, absorb=(), weights=WEIGHTS,
+                cluster=CLUSTER):
+    """The rows and columns a model uses: finite outcome and regressors, positive weight, every key present.
+
+    Observations alone in a fixed-effect group are dropped (repeatedly, as each
+    drop can create new singletons); they are fit exactly and carry no information.
+    """
+    if 'TUITIONFEE_IN_K' in numeric and 'TUITIONFEE_IN_K' not in df:
+        df = df.assign(TUITIONFEE_IN_K=df['TUITIONFEE_IN'] / 1000)
+    columns = list(dict.fromkeys([outcome, *numeric, *categorical, *absorb, weights, cluster]))
+    frame = df[columns]
+    keep = frame.notna().all(axis=1).to_numpy()
+    for col in [outcome, *numeric, weights]:
+        keep &= np.isfinite(frame[col].to_numpy(dtype='float64', na_value=np.nan))
+    keep &= frame[weights].to_numpy(dtype='float64', na_value=np.nan) > 0
+    frame = frame.loc[keep]
+    while absorb:
+        singleton = np.zeros(len(frame), dtype=bool)
+        for col in absorb:
+            codes = pd.factorize(frame[col])[0]
+            singleton |= np.bincount(codes)[codes] == 1
+        if not singleton.any():
+            break
+        frame = frame.loc[~singleton]
+    return frame.reset_index(drop=True)
+
+
+def _codes(series):
+    codes, levels = pd.factorize(series, sort=True)
+    return codes, list(levels)
+
+
+def _indicator(codes, n_levels):
+    import scipy.sparse as sp
+    return sp.csr_matrix((np.ones(len(codes)), (np.arange(len(codes)), codes)), shape=(len(codes), n_levels))
+
+
+def sparse_design(frame, numeric=NUMERIC, categorical=CATEGORICAL, intercept=True):
+    """CSR design matrix and column names; each categorical column drops its first level as the reference."""
+    import scipy.sparse as sp
+    n = len(frame)
+    blocks, names = [], []
+    if intercept:
+        blocks.append(sp.csr_matrix(np.ones((n, 1))))
+        names.append('Intercept')
+    for col in numeric:
+        blocks.append(sp.csr_matrix(frame[col].to_numpy(dtype='float64').reshape(-1, 1)))
+        names.append(col)
+    for col in categorical:
+        codes, levels = _codes(frame[col])
+        blocks.append(_indicator(codes, len(levels))[:, 1:])
+        names.extend(f'{col}[T.{level}]' for level in levels[1:])
+    return sp.hstack(blocks, format='csr'), names
+
+
+def demean(M, fixed_effects, weights, tol=DEMEAN_TOL, maxiter=DEMEAN_MAXITER):
+    """Weighted within transformation of the columns of M for several sets of group codes.
+
+    Each sweep subtracts the weighted group means of every fixed effect in turn;
+    returns (demeaned copy of M, sweeps). One fixed effect needs a single sweep.
+    """
+    import scipy.sparse as sp
+    M = np.array(M, dtype='float64')
+    projections = []
+    for codes in fixed_effects:
+        D = _indicator(codes, codes.max() + 1)
+        projections.append((D, (D.T @ sp.diags(weights)).tocsr(), np.bincount(codes, weights=weights)))
+    scale = np.maximum(np.abs(M).max(axis=0), 1.0)
+    for sweep in range(1, maxiter + 1):
+        change = np.zeros(M.shape[1])
+        for D, DtW, group_weight in projections:
+            means = (DtW @ M) / group_weight[:, None]
+            M -= D @ means
+            change = np.maximum(change, np.abs(means).max(axis=0))
+        if len(projections) == 1 or (change / scale).max() < tol:
+            return M, sweep
+    raise RuntimeError(f"Demeaning did not converge in {maxiter} sweeps (last change {(change / scale).max():.2e})")
+
+
+def _independent_columns(gram, reference):
+    """Columns of a Gram matrix that are not (nearly) spanned by the earlier ones or by the fixed effects."""
+    keep = []
+    for j in range(gram.shape[0]):
+        if gram[j, j] <= COLLINEAR_TOL * reference[j]:
+            continue
+        residual = gram[j, j]
+        if keep:
+            residual -= gram[j, keep] @ np.linalg.solve(gram[np.ix_(keep, keep)], gram[keep, j])
+        if residual > COLLINEAR_TOL * gram[j, j]:
+            keep.append(j)
+    return keep
+
+
+def _absorbed_dof(fixed_effects, cluster_codes):
+    """Degrees of freedom used by the fixed effects.
+
+    Levels minus redundancies (connected components between the first two sets,
+    one per further set); a fixed effect nested within the clusters counts no
+    levels, as in Stata's reghdfe.
+    """
+    import scipy.sparse as sp
+    from scipy.sparse.csgraph import connected_components
+    levels = [codes.max() + 1 for codes in fixed_effects]
+    dof = sum(levels)
+    if len(fixed_effects) >= 2:
+        a, b = fixed_effects[:2]
+        graph = sp.csr_matrix((np.ones(len(a)), (a, b + levels[0])), shape=(sum(levels[:2]),) * 2)
+        dof -= connected_components(graph, directed=False)[0] + len(fixed_effects) - 2
+    for codes, n_levels in zip(fixed_effects, levels):
+        # Nested: every group of the fixed effect lies within one cluster
+        pairs = np.unique(np.column_stack([codes, cluster_codes]), axis=0)
+        if len(pairs) == n_levels:
+            dof -= n_levels
+    return max(dof, 0)
+
+
+class RegressionResult:
+    """Coefficients, cluster-robust standard errors and fit statistics of one model."""
+
+    def __init__(self, name, table, dropped, nobs, n_clusters, df_resid, r2, r2_within, sweeps, seconds):
+        self.name = name
+        self.table = table
+        self.dropped = dropped
+        self.nobs = nobs
+        self.n_clusters = n_clusters
+        self.df_resid = df_resid
+        self.r2 = r2
+        self.r2_within = r2_within
+        self.sweeps = sweeps
+        self.seconds = seconds
+
+    @property
+    def params(self):
+        return self.table['coef']
+
+    @property
+    def bse(self):
+        return self.table['std_err']
+
+    def summary(self):
+        lines = [
+            f"Model '{self.name}': {self.nobs} observations, {self.n_clusters} clusters, "
+            f"R^2 {self.r2:.4f} (within {self.r2_within:.4f}), {self.sweeps} demeaning sweeps, {self.seconds:.2f}s",
+            self.table.round(4).to_string(),
+        ]
+        if self.dropped:
+            lines.append(f"Absorbed or collinear, dropped: {', '.join(self.dropped)}")
+        return '\n'.join(lines)
+
+
+def fit(df, absorb=(), outcome=OUTCOME, numeric=NUMERIC, categorical=CATEGORICAL, weights=WEIGHTS,
+        cluster=CLUSTER, name=None, alpha=0.05):
+    """WLS of `outcome` with the `absorb` fixed effects absorbed and CR1 standard errors clustered on `cluster`."""
+    import scipy.sparse as sp
+    from scipy import stats
+    start = time.perf_counter()
+    absorb = list(absorb)
+    frame = model_frame(df, outcome, numeric, categorical, absorb, weights, cluster)
+    if frame.empty:
+        raise ValueError("No complete observations for the model")
+    w = frame[weights].to_numpy(dtype='float64')
+    y = frame[outcome].to_numpy(dtype='float64')
+    X, names = sparse_design(frame, numeric, categorical, intercept=not absorb)
+    cluster_codes = _codes(frame[cluster])[0]
+
+    # Weighted variation of each column before the fixed effects, to tell absorbed columns apart
+    Xw = X.multiply(w[:, None]).tocsc()
+    column_mean = np.asarray(Xw.sum(axis=0)).ravel() / w.sum()
+    reference = np.asarray((X.multiply(Xw)).sum(axis=0)).ravel() - w.sum() * column_mean ** 2
+    if absorb:
+        fixed_effects = [_codes(frame[col])[0] for col in absorb]
+        demeaned, sweeps = demean(np.column_stack([y, X.toarray()]), fixed_effects, w)
+        y_within, X = demeaned[:, 0], demeaned[:, 1:]
+        gram = X.T @ (X * w[:, None])
+        dof_absorbed = _absorbed_dof(fixed_effects, cluster_codes)
+    else:
+        y_within, sweeps, dof_absorbed = y - np.average(y, weights=w), 0, 0
+        gram = (X.T @ Xw).toarray()
+        reference[names.index('Intercept')] = w.sum()
+    keep = _independent_columns(gram, reference)
+    dropped = [names[j] for j in range(len(names)) if j not in keep]
+    X = X[:, keep]
+    names = [names[j] for j in keep]
+    bread = np.linalg.inv(gram[np.ix_(keep, keep)])
+    beta = bread @ (X.T @ (w * y_within if absorb else w * y))
+    resid = (y_within if absorb else y) - X @ beta
+
+    # CR1: sum the scores within each cluster, with the small-sample correction
+    weighted = X.multiply((w * resid)[:, None]) if sp.issparse(X) else X * (w * resid)[:, None]
+    scores = _indicator(cluster_codes, cluster_codes.max() + 1).T @ weighted
+    scores = scores.toarray() if sp.issparse(scores) else scores
+    nobs, n_clusters, k = len(y), int(cluster_codes.max() + 1), len(keep) + dof_absorbed
+    correction = n_clusters / (n_clusters - 1) * (nobs - 1) / (nobs - k)
+    std_err = np.sqrt(np.diag(correction * bread @ (scores.T @ scores) @ bread))
+
+    t = beta / std_err
+    critical = stats.t.ppf(1 - alpha / 2, n_clusters - 1)
+    table = pd.DataFrame({
+        'coef': beta,
+        'std_err': std_err,
+        't': t,
+        'p_value': 2 * stats.t.sf(np.abs(t), n_clusters - 1),
+        'ci_low': beta - critical * std_err,
+        'ci_high': beta + critical * std_err,
+    }, index=pd.Index(names, name='term'))
+
+    ssr = np.sum(w * resid ** 2)
+    tss = np.sum(w * (y - np.average(y, weights=w)) ** 2)
+    return RegressionResult(name or ' + '.join(absorb) or 'pooled', table, dropped, nobs, n_clusters,
+                            nobs - k, 1 - ssr / tss, 1 - ssr / np.sum(w * y_within ** 2), sweeps,
+                            time.perf_counter() - start)
+
+
+def fit_models(df, models=MODELS, **options):
+    return {name: fit(df, absorb, name=name, **options) for name, absorb in models.items()}
+
+
+def compare_with_statsmodels(df, absorb, n=20_000, seed=0):
+    """Coefficients and standard errors against statsmodels WLS with dense dummies, on a sample of rows.
+
+    Returns the side-by-side table and both timings.
+    """
+    import statsmodels.api as sm
+
+    frame = model_frame(df, absorb=absorb)
+    frame = frame.sample(min(n, len(frame)), random_state=seed)
+    start = time.perf_counter()
+    result = fit(frame, absorb)
+    sparse_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    X, names = sparse_design(frame, NUMERIC, CATEGORICAL + list(absorb))
+    # Without the columns the absorbed fit found collinear, so both designs have full rank
+    columns = [j for j, name in enumerate(names) if name not in result.dropped]
+    X, names = X[:, columns].toarray(), [names[j] for j in columns]
+    model = sm.WLS(frame[OUTCOME].to_numpy(dtype='float64'), X, weights=frame[WEIGHTS].to_numpy())
+    reference = model.fit(cov_type='cluster', cov_kwds={'groups': _codes(frame[CLUSTER])[0]})
+    dense_seconds = time.perf_counter() - start
+
+    dense = pd.DataFrame({'statsmodels_coef': reference.params, 'statsmodels_std_err': reference.bse}, index=names)
+    table = result.table[['coef', 'std_err']].join(dense)
+    return table, sparse_seconds, dense_seconds
+
+
+if __name__ == '__main__':
+    from institutions import load_joined
+
+    parser = argparse.ArgumentParser(description="Fit regression models of ROI with absorbed fixed effects.")
+    parser.add_argument('--models', nargs='+', choices=list(MODELS), default=list(MODELS), help="models to fit")
+    parser.add_argument('--no-check', action='store_true', help="skip the comparison with statsmodels")
+    args = parser.parse_args()
+
+    columns = [OUTCOME, WEIGHTS, 'UNITID', 'CIPCODE', 'MAJOR_FIELD', 'CREDLEV', 'CONTROL']
+    df = load_joined(columns=columns)
+    print(f"Loaded {len(df)} rows")
+
+    results = fit_models(df, {name: MODELS[name] for name in args.models})
+    for result in results.values():
+        print(f"\n{result.summary()}")
+
+    frames = [result.table.assign(model=name) for name, result in results.items()]
+    RESULTS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    pd.concat(frames).reset_index().set_index(['model', 'term']).to_csv(RESULTS_PATH)
+    print(f"\nCoefficients written to: {RESULTS_PATH}")
+
+    if not args.no_check:
+        table, sparse_seconds, dense_seconds = compare_with_statsmodels(df, ['CIPCODE'])
+        print("\nCIP fixed effects on a sample, absorbed vs statsmodels with dummies:")
+        print(table.round(6).to_string())
+        print(f"max |coef diff| {(table['coef'] - table['statsmodels_coef']).abs().max():.2e}, "
+              f"max |std err diff| {(table['std_err'] - table['statsmodels_std_err']).abs().max():.2e}; "
+              f"absorbed: {sparse_seconds:.2f}s, dense: {dense_seconds:.2f}s")
@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Name Search Index
+#
+# Typo-tolerant lookup of institutions (INSTNM -> UNITID / OPEID6) and programs
+# (CIPDESC -> CIPCODE), and of the programs an institution offers. Names are
+# normalized first (case, accents and punctuation dropped, common abbreviations
+# such as "Univ." and "Coll." expanded), then indexed as trigram posting lists.
+# A lookup adds up the postings of the query's trigrams with one bincount and
+# ranks institution names by trigram similarity (fuzzy) or by how much of the
+# query they contain (prefix, for search-as-you-type). Program descriptions are
+# long next to a typical query ("computer science" against "Computer and
+# Information Sciences, General."), so they are always ranked by how much of
+# the query they contain. The index is saved as one .npz file next to the
+# processed data, so it is built once (by pipeline.py) and loaded on startup;
+# --check runs the misspelled program lookups in TYPO_CHECKS against it:
+#     python search.py "univ of nothern colorado"
+#     python search.py --program "computr science" --institution "state univ"
+#     python search.py --check
+
+import argparse
+import re
+import time
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SEARCH_NAME = 'search_index.npz'
+SEARCH_COLUMNS = ['UNITID', 'OPEID6', 'INSTNM', 'CIPCODE', 'CIPDESC']
+
+# Results below this similarity are not returned
+MIN_SCORE = 0.3
+# Program descriptions (scored by containment) share common trigrams with
+# unrelated queries ("nursing" finds 0.375 of its trigrams in "Business,
+# Management, Marketing, ..."), so they need more of the query
+MIN_CONTAINMENT = 0.6
+# Institutions / programs considered when combining both in offerings()
+CANDIDATES = 50
+# Misspelled program lookups whose best match must contain the expected CIP title text
+# (None: no program may match)
+TYPO_CHECKS = [
+    ('computr scince', 'Computer and Information Sciences'),
+    ('psycology', 'Psychology'),
+    ('bussiness admin', 'Business'),
+    ('underwater basket weaving', None),
+]
+
+ABBREVIATIONS = {
+    'univ': 'university',
+    'coll': 'college',
+    'inst': 'institute',
+    'cc': 'community college',
+    'comm': 'community',
+    'mt': 'mount',
+    'ft': 'fort',
+    'sch': 'school',
+    'ctr': 'center',
+    'intl': 'international',
+    'natl': 'national',
+    'sci': 'science',
+    'sciences': 'science',
+    'tech': 'technology',
+    'engr': 'engineering',
+    'mgmt': 'management',
+    'admin': 'administration',
+}
+STOP_WORDS = {'the'}
+
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(text):
+    """Lowercase ASCII words with punctuation dropped and abbreviations expanded."""
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode().casefold()
+    text = text.replace('&', ' and ').replace("'", '')
+    return ' '.join(ABBREVIATIONS.get(token, token) for token in _NON_WORD.sub(' ', text).split()
+                    if token not in STOP_WORDS)
+
+
+def trigrams(text, prefix=False):
+    """Set of padded trigrams of normalized text; a prefix has no end-of-text trigram."""
+    padded = f'  {text}' if prefix else f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)} if text else set()
+
+
+class TrigramIndex:
+    """Trigram posting lists (CSR: grams, offsets, docs) over a list of names."""
+
+    def __init__(self, names, normalized, grams, offsets, docs, sizes):
+        self.names = names              # original text per doc
+        self.normalized = normalized    # normalized text per doc
+        self.grams = grams              # sorted unique trigrams
+        self.offsets = offsets          # postings of grams[i] are docs[offsets[i]:offsets[i + 1]]
+        self.docs = docs
+        self.sizes = sizes              # trigram count per doc
+
+    @classmethod
+    def build(cls, names):
+        names = np.asarray([str(name) for name in names])
+        normalized = np.asarray([normalize(name) for name in names])
+        doc_grams = [sorted(trigrams(text)) for text in normalized]
+        sizes = np.array([len(grams) for grams in doc_grams], dtype='int32')
+        flat = np.asarray([gram for grams in doc_grams for gram in grams], dtype='<U3')
+        doc_of_gram = np.repeat(np.arange(len(names), dtype='int32'), sizes)
+        order = np.argsort(flat, kind='stable')
+        grams, starts = np.unique(flat[order], return_index=True)
+        offsets = np.append(starts, len(flat)).astype('int64')
+        return cls(names, normalized, grams, offsets, doc_of_gram[order], sizes)
+
+    def __len__(self):
+        return len(self.names)
+
+    def scores(self, query, prefix=False, containment=False):
+        """Similarity of every doc to query (0 to 1).
+
+        fuzzy: shared / union of trigrams (Jaccard); prefix or containment: share
+        of the query's trigrams the doc contains, so a partly typed name matches
+        in full and a short query is not penalized for a long name.
+        """
+        text = normalize(query)
+        query_grams = np.asarray(sorted(trigrams(text, prefix)), dtype='<U3')
+        if not len(query_grams) or not len(self.grams):
+            return np.zeros(len(self))
+        pos = np.minimum(np.searchsorted(self.grams, query_grams), len(self.grams) - 1)
+        pos = pos[self.grams[pos] == query_grams]
+        postings = [self.docs[self.offsets[p]:self.offsets[p + 1]] for p in pos]
+        shared = np.bincount(np.concatenate(postings), minlength=len(self)) if postings else np.zeros(len(self))
+        if prefix or containment:
+            return shared / len(query_grams)
+        return shared / (len(query_grams) + self.sizes - shared)
+
+    def best(self, query, limit=10, prefix=False, min_score=MIN_SCORE, containment=False):
+        """(doc positions, scores) of the `limit` best docs scoring at least min_score, best first."""
+        scores = self.scores(query, prefix, containment)
+        candidates = np.flatnonzero(scores >= min_score)
+        if prefix and len(candidates):
+            # Names that start with the query exactly rank above the typo-tolerant matches
+            exact = np.char.startswith(self.normalized[candidates], normalize(query))
+            scores[candidates] += exact
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        # Ties go to the shorter name
+        order = np.lexsort((self.sizes[candidates], -scores[candidates]))
+        return candidates[order], np.minimum(scores[candidates[order]], 1.0)
+
+    def to_arrays(self, prefix):
+        return {f'{prefix}__{name}': getattr(self, name)
+                for name in ['names', 'normalized', 'grams', 'offsets', 'docs', 'sizes']}
+
+    @classmethod
+    def from_arrays(cls, data, prefix):
+        return cls(*(data[f'{prefix}__{name}'] for name in ['names', 'normalized', 'grams', 'offsets', 'docs', 'sizes']))
+
+
+def _int_keys(series):
+    # Nullable integer keys -> int64 with -1 for missing
+    values = series.to_numpy(dtype='float64', na_value=np.nan)
+    return np.where(np.isnan(values), -1, values).astype('int64')
+
+
+class SearchIndex:
+    """Institution and program name indexes plus which programs each institution offers."""
+
+    def __init__(self, institutions, unitid, opeid6, programs, cipcode, offer_offsets, offer_programs):
+        self.institutions = institutions    # TrigramIndex over distinct (INSTNM, UNITID, OPEID6)
+        self.unitid = unitid
+        self.opeid6 = opeid6
+        self.programs = programs            # TrigramIndex over distinct (CIPDESC, CIPCODE)
+        self.cipcode = cipcode
+        # Programs offered by institution doc i: offer_programs[offer_offsets[i]:offer_offsets[i + 1]]
+        self.offer_offsets = offer_offsets
+        self.offer_programs = offer_programs
+
+    @classmethod
+    def build(cls, df):
+        """Index the names and keys of a Field of Study frame (raw or processed)."""
+        rows = pd.DataFrame({
+            'INSTNM': df['INSTNM'].astype(str).to_numpy(),
+            'UNITID': _int_keys(df['UNITID']),
+            'OPEID6': _int_keys(df['OPEID6']),
+            'CIPDESC': df['CIPDESC'].astype(str).to_numpy(),
+            'CIPCODE': _int_keys(df['CIPCODE']),
+        })
+        inst_cols, prog_cols = ['INSTNM', 'UNITID', 'OPEID6'], ['CIPDESC', 'CIPCODE']
+        inst_codes = rows.groupby(inst_cols, sort=True).ngroup().to_numpy()
+        prog_codes = rows.groupby(prog_cols, sort=True).ngroup().to_numpy()
+        inst = rows[inst_cols].drop_duplicates().sort_values(inst_cols, ignore_index=True)
+        prog = rows[prog_cols].drop_duplicates().sort_values(prog_cols, ignore_index=True)
+
+        offers = np.unique(inst_codes.astype('int64') * len(prog) + prog_codes)
+        offer_inst, offer_programs = np.divmod(offers, len(prog))
+        offer_offsets = np.searchsorted(offer_inst, np.arange(len(inst) + 1)).astype('int64')
+        return cls(TrigramIndex.build(inst['INSTNM']), inst['UNITID'].to_numpy(), inst['OPEID6'].to_numpy(),
+                   TrigramIndex.build(prog['CIPDESC']), prog['CIPCODE'].to_numpy(),
+                   offer_offsets, offer_programs.astype('int32'))
+
+    def find_institutions(self, query, limit=10, prefix=False, min_score=MIN_SCORE):
+        """Best matching institutions: INSTNM, UNITID, OPEID6 and score."""
+        docs, scores = self.institutions.best(query, limit, prefix, min_score)
+        return pd.DataFrame({'INSTNM': self.institutions.names[docs], 'UNITID': self.unitid[docs],
+                             'OPEID6': self.opeid6[docs], 'score': scores})
+
+    def find_programs(self, query, limit=10, prefix=False, min_score=MIN_CONTAINMENT):
+        """Best matching program descriptions: CIPDESC, CIPCODE and score."""
+        docs, scores = self.programs.best(query, limit, prefix, min_score, containment=True)
+        return pd.DataFrame({'CIPDESC': self.programs.names[docs], 'CIPCODE': self.cipcode[docs], 'score': scores})
+
+    def find_offerings(self, institution, program, limit=20, prefix=False, min_score=MIN_SCORE,
+                       program_min_score=MIN_CONTAINMENT):
+        """Programs matching `program` at institutions matching `institution`, by combined score."""
+        inst_docs, inst_scores = self.institutions.best(institution, CANDIDATES, prefix, min_score)
+        prog_scores = self.programs.scores(program, prefix, containment=True)
+        starts, ends = self.offer_offsets[inst_docs], self.offer_offsets[inst_docs + 1]
+        lengths = ends - starts
+        offer = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        inst_of_offer = np.repeat(np.arange(len(inst_docs)), lengths)
+        prog_docs = self.offer_programs[offer]
+        keep = prog_scores[prog_docs] >= program_min_score
+        inst_of_offer, prog_docs = inst_of_offer[keep], prog_docs[keep]
+        scores = inst_scores[inst_of_offer] * prog_scores[prog_docs]
+        best = np.argsort(-scores, kind='stable')[:limit]
+        inst_docs, prog_docs = inst_docs[inst_of_offer[best]], prog_docs[best]
+        return pd.DataFrame({
+            'INSTNM': self.institutions.names[inst_docs], 'UNITID': self.unitid[inst_docs],
+            'OPEID6': self.opeid6[inst_docs], 'CIPDESC': self.programs.names[prog_docs],
+            'CIPCODE': self.cipcode[prog_docs], 'score': scores[best],
+        })
+
+    def save(self, path):
+        """Write the index as a single .npz file."""
+        arrays = {**self.institutions.to_arrays('institutions'), **self.programs.to_arrays('programs'),
+                  'unitid': self.unitid, 'opeid6': self.opeid6, 'cipcode': self.cipcode,
+                  'offer_offsets': self.offer_offsets, 'offer_programs': self.offer_programs}
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp.npz')
+        np.savez(tmp_path, **arrays)
+        tmp_path.replace(path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(TrigramIndex.from_arrays(data, 'institutions'), data['unitid'], data['opeid6'],
+                       TrigramIndex.from_arrays(data, 'programs'), data['cipcode'],
+                       data['offer_offsets'], data['offer_programs'])
+
+
+def build_search_index(df, processed_dir=None):
+    """Build the index from a Field of Study frame and, if processed_dir is given, save it there."""
+    index = SearchIndex.build(df)
+    if processed_dir is not None:
+        index.save(Path(processed_dir) / SEARCH_NAME)
+    return index
+
+
+def load_search_index(processed_dir):
+    return SearchIndex.load(Path(processed_dir) / SEARCH_NAME)
+
+
+if __name__ == '__main__':
+    from loader import load_field_of_study
+    from rawdata import FOS_FILE, ensure_raw
+    from store import PROCESSED_DIR
+
+    parser = argparse.ArgumentParser(description="Look up institutions and programs by (misspelled) name.")
+    parser.add_argument('query', nargs='?', help="institution name to look up")
+    parser.add_argument('--program', help="program description to look up")
+    parser.add_argument('--institution', help="with --program: only programs at institutions matching this")
+    parser.add_argument('--prefix', action='store_true', help="treat the query as the start of a name")
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--rebuild', action='store_true', help="rebuild the index from the raw file")
+    parser.add_argument('--check', action='store_true', help="run the misspelled program lookups in TYPO_CHECKS")
+    args = parser.parse_args()
+
+    path = PROCESSED_DIR / SEARCH_NAME
+    if args.rebuild or not path.exists():
+        start = time.perf_counter()
+        df = load_field_of_study(ensure_raw(FOS_FILE), columns=SEARCH_COLUMNS)
+        index = build_search_index(df, PROCESSED_DIR)
+        print(f"Indexed {len(index.institutions)} institutions and {len(index.programs)} program names "
+              f"({len(df)} program rows) in {time.perf_counter() - start:.2f}s -> {path}")
+    start = time.perf_counter()
+    index = load_search_index(PROCESSED_DIR)
+    print(f"Loaded index in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    if args.check:
+        failed = 0
+        for query, expected in TYPO_CHECKS:
+            names = index.find_programs(query)['CIPDESC'].tolist()
+            ok = not names if expected is None else bool(names) and expected.casefold() in names[0].casefold()
+            failed += not ok
+            print(f"{'ok' if ok else 'FAIL':<5} {query!r:<28} -> {names[0] if names else '(no match)'}")
+        raise SystemExit(1 if failed else 0)
+
+    lookups = []
+    if args.program and args.institution:
+        lookups.append(lambda: index.find_offerings(args.institution, args.program, args.limit, args.prefix))
+    elif args.program:
+        lookups.append(lambda: index.find_programs(args.program, args.limit, args.prefix))
+    if args.query:
+        lookups.append(lambda: index.find_institutions(args.query, args.limit, args.prefix))
+    for lookup in lookups:
+        result = lookup()
+        start = time.perf_counter()
+        for _ in range(200):
+            lookup()
+        print(f"\n{(time.perf_counter() - start) / 200 * 1000:.3f} ms per lookup")
+        print(result.to_string(index=False))
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Processed Data Store
+#
+# The processed Field of Study table is written as a hive-partitioned Parquet
+# dataset (partitioned by CREDLEV and CONTROL) so downstream scripts keep the
+# categorical dtypes and can push column selections and filters down to the
+# files instead of re-parsing a CSV. The CSV remains available as an export.
+# Run directly to compare the two downstream load paths:
+#     python store.py
+
+import shutil
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from loader import measure
+
+PROCESSED_DIR = Path('../data/processed')
+DATASET_NAME = 'field_of_study_processed.parquet'
+CSV_NAME = 'field_of_study_processed.csv'
+PARTITION_COLS = ['CREDLEV', 'CONTROL']
+
+
+def write_processed(df, processed_dir=PROCESSED_DIR, partition_cols=PARTITION_COLS, export_csv=False):
+    """Write the processed frame as a partitioned Parquet dataset (and optionally a CSV)."""
+    processed_dir = Path(processed_dir)
+    processed_dir.mkdir(parents=True, exist_ok=True)
+    dataset_path = processed_dir / DATASET_NAME
+
+    # Write next to the target and swap in, so readers never see a half-written dataset
+    tmp_path = processed_dir / (DATASET_NAME + '.tmp')
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_to_dataset(table, tmp_path, partition_cols=list(partition_cols))
+    shutil.rmtree(dataset_path, ignore_errors=True)
+    tmp_path.rename(dataset_path)
+
+    csv_path = None
+    if export_csv:
+        csv_path = processed_dir / CSV_NAME
+        df.to_csv(csv_path, index=False)
+    return dataset_path, csv_path
+
+
+class DatasetWriter:
+    """Appends frames (e.g. the chunks of a stream) to a new partitioned Parquet dataset.
+
+    Each write() adds one file per partition, numbered so that reading the
+    dataset back returns the rows in the order they were written. The dataset
+    is built next to the target and swapped in by close().
+    """
+
+    def __init__(self, dataset_path, partition_cols=PARTITION_COLS, tmp_path=None):
+        self.dataset_path = Path(dataset_path)
+        self.partition_cols = list(partition_cols)
+        self.tmp_path = Path(tmp_path or self.dataset_path.with_name(self.dataset_path.name + '.tmp'))
+        self.schema = None
+        self.parts = 0
+        self.rows = 0
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        self.tmp_path.mkdir(parents=True)
+
+    def write(self, df):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self.schema is None:
+            # Categoricals become dictionaries with the narrowest index type for their
+            # categories; widen them once so every chunk shares one schema
+            self.schema = pa.schema([
+                field.with_type(pa.dictionary(pa.int32(), pa.string()))
+                if pa.types.is_dictionary(field.type) else field
+                for field in table.schema], metadata=table.schema.metadata)
+        table = table.cast(self.schema)
+        pq.write_to_dataset(table, self.tmp_path, partition_cols=self.partition_cols,
+                            basename_template=f'part-{self.parts:06d}-{{i}}.parquet')
+        self.parts += 1
+        self.rows += len(df)
+
+    def close(self):
+        shutil.rmtree(self.dataset_path, ignore_errors=True)
+        self.tmp_path.rename(self.dataset_path)
+        return self.dataset_path
+
+    def abort(self):
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _restore_pandas_dtypes(df, schema):
+    # Partition columns come back from the directory names as inferred types;
+    # the pandas metadata stored in the files records what they were.
+    meta = schema.pandas_metadata or {}
+    columns = [c for c in meta.get('columns', []) if c['name'] in df.columns]
+    for col in columns:
+        name, numpy_type = col['name'], col['numpy_type']
+        if col['pandas_type'] == 'categorical':
+            if not isinstance(df[name].dtype, pd.CategoricalDtype):
+                df[name] = df[name].astype('category')
+        elif str(df[name].dtype) != numpy_type:
+            df[name] = df[name].astype(numpy_type)
+    # Partition keys that are not stored in the files (e.g. YEAR) go last
+    names = [c['name'] for c in columns]
+    return df[names + [name for name in df.columns if name not in names]]
+
+
+def read_processed(processed_dir=PROCESSED_DIR, columns=None, filters=None, dataset_name=DATASET_NAME):
+    """Load the processed dataset, reading only `columns` and the partitions/row groups matching `filters`.
+
+    `filters` uses the pyarrow form, e.g. [('CREDLEV', '=', 5), ('CONTROL', 'in', ['Public'])].
+    """
+    dataset_path = Path(processed_dir) / dataset_name
+    partitioning = ds.HivePartitioning.discover(infer_dictionary=False)
+    table = pq.read_table(dataset_path, columns=columns, filters=filters, partitioning=partitioning)
+    return _restore_pandas_dtypes(table.to_pandas(), pq.read_schema(next(dataset_path.rglob('*.parquet'))))
+
+
+def compare_downstream_loads(processed_dir=PROCESSED_DIR, columns=None):
+    """Report load time and peak memory for the CSV and Parquet versions of the processed data."""
+    processed_dir = Path(processed_dir)
+    rows = []
+    for name, func in [
+        ('read_csv', lambda: pd.read_csv(processed_dir / CSV_NAME, usecols=columns)),
+        ('parquet', lambda: read_processed(processed_dir, columns=columns)),
+    ]:
+        df, elapsed, peak = measure(func)
+        rows.append({
+            'loader': name,
+            'seconds': round(elapsed, 3),
+            'peak_mb': round(peak / 1e6, 1),
+            'result_mb': round(df.memory_usage(deep=True).sum() / 1e6, 1),
+        })
+        del df
+    report = pd.DataFrame(rows).set_index('loader')
+    report['speedup'] = (report['seconds'].iloc[0] / report['seconds']).round(2)
+    report['memory_ratio'] = (report['peak_mb'].iloc[0] / report['peak_mb']).round(2)
+    return report
+
+
+if __name__ == '__main__':
+    processed_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else PROCESSED_DIR
+    if not (processed_dir / CSV_NAME).exists():
+        print(f"No CSV export at '{processed_dir / CSV_NAME}'; rerun 01_preprocess.py with --csv first.")
+        sys.exit(1)
+    print(compare_downstream_loads(processed_dir).to_string())
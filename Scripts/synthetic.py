@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Synthetic Scorecard Data
+#
+# Writes a Field of Study CSV and an Institution CSV with the real file names,
+# column names and cell conventions ('PrivacySuppressed', 'NULL'), at any
+# scale from thousands to hundreds of millions of rows, for benchmarks and for
+# running the scripts without the real downloads. The distributions follow the
+# real files in the ways the pipeline cares about:
+#   - institutions offer a skewed number of programs; branch campuses have
+#     their own UNITID but share an OPEID6, and some names repeat;
+#   - CIPCODEs are 4-digit codes inside real 2-digit families (some outside
+#     the analysed majors), with the family title in CIPDESC;
+#   - class sizes (IPEDSCOUNT2) are heavily right-skewed, and earnings / debt
+#     are suppressed mostly for small cohorts;
+#   - earnings rise with credential level and field, debt with credential
+#     level and for-profit control.
+# Rows are generated in seeded chunks on a process pool and written with
+# Arrow's CSV writer; the output only depends on the row count and seed. Point
+# SCORECARD_MIRROR at the output directory to run the pipeline on it:
+#     python synthetic.py --rows 1m --out ../data/synthetic/1m
+
+import argparse
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+from rawdata import FOS_FILE, INSTITUTION_FILE
+
+SYNTHETIC_DIR = Path('../data/synthetic')
+PARAMS_NAME = '_synthetic.json'
+CHUNK_ROWS = 500_000
+# Programs per institution in the real file
+ROWS_PER_INSTITUTION = 38
+# Extra numeric columns, so rows are about as wide as the real file's
+DEFAULT_PADDING = 40
+
+SCALES = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+    '10m': 10_000_000,
+    '100m': 100_000_000,
+}
+
+CONTROLS = ['Public', 'Private, nonprofit', 'Private, for-profit']
+CONTROL_WEIGHTS = [0.35, 0.30, 0.35]
+# Debt relative to a public institution
+CONTROL_DEBT = [0.85, 1.1, 1.3]
+
+# CREDLEV: (CREDDESC, share of programs, median earnings, median debt)
+CREDENTIALS = {
+    1: ('Undergraduate Certificate or Diploma', 0.15, 28_000, 9_000),
+    2: ("Associate's Degree", 0.20, 35_000, 12_000),
+    3: ("Bachelor's Degree", 0.35, 48_000, 24_000),
+    4: ('Post-baccalaureate Certificate', 0.03, 45_000, 20_000),
+    5: ("Master's Degree", 0.18, 62_000, 45_000),
+    6: ('Doctoral Degree', 0.05, 85_000, 90_000),
+    7: ('First Professional Degree', 0.01, 110_000, 160_000),
+    8: ('Graduate/Professional Certificate', 0.03, 60_000, 30_000),
+}
+
+# 2-digit CIP family: (title, share of programs, earnings multiplier, 4-digit codes in the family)
+CIP_FAMILIES = {
+    11: ('Computer and Information Sciences', 0.06, 1.35, 6),
+    12: ('Personal and Culinary Services', 0.04, 0.75, 4),
+    13: ('Education', 0.08, 0.85, 9),
+    14: ('Engineering', 0.06, 1.40, 9),
+    15: ('Engineering/Engineering-Related Technologies', 0.04, 1.15, 6),
+    23: ('English Language and Literature/Letters', 0.03, 0.85, 3),
+    24: ('Liberal Arts and Sciences, General Studies and Humanities', 0.05, 0.80, 1),
+    26: ('Biological and Biomedical Sciences', 0.05, 0.95, 8),
+    27: ('Mathematics and Statistics', 0.02, 1.15, 3),
+    30: ('Multi/Interdisciplinary Studies', 0.03, 0.90, 5),
+    40: ('Physical Sciences', 0.03, 1.05, 6),
+    42: ('Psychology', 0.04, 0.85, 3),
+    43: ('Homeland Security, Law Enforcement, Firefighting', 0.03, 0.95, 3),
+    45: ('Social Sciences', 0.05, 0.95, 9),
+    47: ('Mechanic and Repair Technologies/Technicians', 0.03, 1.00, 5),
+    50: ('Visual and Performing Arts', 0.06, 0.75, 9),
+    51: ('Health Professions and Related Programs', 0.17, 1.15, 9),
+    52: ('Business, Management, Marketing, and Related Support Services', 0.13, 1.10, 9),
+}
+SUBFIELDS = ['General', 'Applied', 'Administration', 'Technology', 'Management', 'Research', 'Services', 'Studies',
+             'Other']
+
+NAME_PLACES = ['Adams', 'Bay', 'Blue Ridge', 'Cedar', 'Central', 'Clark', 'Coastal', 'Columbia', 'Eastern', 'Franklin',
+               'Golden', 'Grand', 'Great Lakes', 'Hamilton', 'Highland', 'Hudson', 'Jefferson', 'Lake', 'Lincoln',
+               'Madison', 'Marion', 'Midwest', 'Monroe', 'Mountain', 'North', 'Northern', 'Pacific', 'Pine', 'Prairie',
+               'Red River', 'Saint Mary', 'South', 'Southern', 'Summit', 'Valley', 'Washington', 'Western', 'Wood']
+NAME_KINDS = ['University', 'State University', 'College', 'Community College', 'Technical College',
+              'Institute of Technology', 'School of Nursing', 'Beauty Academy', 'Career College', 'Seminary']
+CAMPUSES = ['Main Campus', 'Online', 'Downtown', 'North Campus', 'South Campus', 'East', 'West', 'Satellite']
+STATES = ['AL', 'AZ', 'CA', 'CO', 'FL', 'GA', 'IL', 'IN', 'MA', 'MI', 'MN', 'MO', 'NC', 'NJ', 'NY', 'OH', 'OR', 'PA',
+          'TN', 'TX', 'VA', 'WA', 'WI']
+
+FOS_PREFIX = ['UNITID', 'OPEID6', 'INSTNM', 'CONTROL', 'MAIN', 'CIPCODE', 'CIPDESC', 'CREDLEV', 'CREDDESC',
+              'IPEDSCOUNT1', 'IPEDSCOUNT2', 'DEBT_ALL_STGP_ANY_N', 'DEBT_ALL_STGP_ANY_MDN',
+              'DEBT_ALL_STGP_ANY_MDN10YRPAY', 'DEBT_ALL_STGP_EVAL_N', 'DEBT_ALL_STGP_EVAL_MDN',
+              'DEBT_ALL_STGP_EVAL_MDN10YRPAY', 'EARN_COUNT_WNE_HI_1YR', 'EARN_MDN_HI_1YR', 'EARN_COUNT_WNE_HI_2YR',
+              'EARN_MDN_HI_2YR', 'EARN_COUNT_WNE_5YR', 'EARN_MDN_5YR']
+INSTITUTION_COLUMNS = ['UNITID', 'OPEID', 'OPEID6', 'INSTNM', 'CITY', 'STABBR', 'CONTROL', 'MAIN', 'UGDS',
+                       'UGDS_WOMEN', 'TUITIONFEE_IN', 'TUITIONFEE_OUT']
+
+# Cohorts below this many students are usually suppressed
+SUPPRESSION_COUNT = 30
+# 10-year repayment at this annual rate for the ...MDN10YRPAY columns
+PAYMENT_RATE = 0.05
+
+
+def parse_rows(value):
+    """'100k', '1m', '2.5m' or a plain number -> int."""
+    value = str(value).strip().lower().replace('_', '')
+    if value in SCALES:
+        return SCALES[value]
+    for suffix, factor in (('k', 1_000), ('m', 1_000_000), ('b', 1_000_000_000)):
+        if value.endswith(suffix):
+            return int(float(value[:-1]) * factor)
+    return int(value)
+
+
+def _seeds(seed, n):
+    return np.random.SeedSequence(seed).spawn(n)
+
+
+def institutions(rows, seed=0):
+    """The institution table behind `rows` program rows (one row per UNITID)."""
+    rng = np.random.default_rng(_seeds(seed, 1)[0])
+    n = max(rows // ROWS_PER_INSTITUTION, 20)
+    # Campuses per OPEID6: mostly one, a few systems with several branches
+    campuses = np.minimum(rng.geometric(0.75, size=n), len(CAMPUSES))
+    groups = np.repeat(np.arange(n), campuses)[:n]
+    n_groups = groups[-1] + 1
+    is_first = np.r_[True, groups[1:] != groups[:-1]]
+    campus = np.arange(n) - np.maximum.accumulate(np.where(is_first, np.arange(n), 0))
+
+    opeid6 = (1_000 + rng.permutation(max(n_groups * 3, 100_000))[:n_groups])[groups]
+    place = rng.integers(len(NAME_PLACES), size=n_groups)[groups]
+    kind = rng.choice(len(NAME_KINDS), size=n_groups, p=_normalized([6, 5, 6, 6, 3, 2, 2, 2, 2, 1]))[groups]
+    names = np.char.add(np.char.add(np.asarray(NAME_PLACES)[place], ' '), np.asarray(NAME_KINDS)[kind])
+    branch = np.char.add(' - ', np.asarray(CAMPUSES)[np.minimum(campus, len(CAMPUSES) - 1)])
+    names = np.where(campus > 0, np.char.add(names, branch), names)
+
+    control = rng.choice(len(CONTROLS), size=n_groups, p=CONTROL_WEIGHTS)[groups]
+    public = control == 0
+    tuition = np.round(np.where(public, rng.lognormal(np.log(8_000), 0.35, n), rng.lognormal(np.log(22_000), 0.6, n)))
+    return pd.DataFrame({
+        'UNITID': 100_000 + rng.permutation(n * 4)[:n],
+        'OPEID': opeid6 * 100 + campus,
+        'OPEID6': opeid6,
+        'INSTNM': names,
+        'CITY': np.asarray(NAME_PLACES)[rng.integers(len(NAME_PLACES), size=n)],
+        'STABBR': np.asarray(STATES)[rng.integers(len(STATES), size=n_groups)[groups]],
+        'CONTROL': np.asarray(CONTROLS)[control],
+        'MAIN': (campus == 0).astype('int8'),
+        'UGDS': np.round(rng.lognormal(np.log(1_500), 1.3, n)),
+        # Not reported by some institutions
+        'UGDS_WOMEN': np.where(rng.random(n) < 0.08, np.nan, np.round(rng.beta(6, 5, n), 4)),
+        'TUITIONFEE_IN': np.where(rng.random(n) < 0.05, np.nan, tuition),
+        'TUITIONFEE_OUT': np.round(np.where(public, tuition * rng.uniform(1.8, 3.0, n), tuition)),
+        # Relative number of programs offered
+        '_weight': rng.lognormal(0, 1.1, n),
+    })
+
+
+def _normalized(weights):
+    weights = np.asarray(weights, dtype='float64')
+    return weights / weights.sum()
+
+
+def _cip_table():
+    codes, descriptions, families = [], [], []
+    for family, (title, _, _, n_codes) in CIP_FAMILIES.items():
+        for sub in range(1, n_codes + 1):
+            codes.append(family * 100 + sub)
+            suffix = SUBFIELDS[(sub - 1) % len(SUBFIELDS)]
+            descriptions.append(f'{title}, General' if sub == 1 else f'{title}, {suffix} {sub:02d}')
+            families.append(family)
+    return np.array(codes), np.array(descriptions), np.array(families)
+
+
+def _monthly_payment(debt):
+    rate = PAYMENT_RATE / 12
+    return np.round(debt * rate / (1 - (1 + rate) ** -120), 2)
+
+
+def field_of_study_chunk(rows, inst, seed, padding=DEFAULT_PADDING):
+    """`rows` program rows drawn against the institution table, as an Arrow table (suppressed cells null)."""
+    rng = np.random.default_rng(seed)
+    at = rng.choice(len(inst), size=rows, p=_normalized(inst['_weight']))
+    codes, descriptions, families = _cip_table()
+    family_share = {family: share for family, (_, share, _, _) in CIP_FAMILIES.items()}
+    code_weights = _normalized([family_share[f] / CIP_FAMILIES[f][3] for f in families])
+    cip = rng.choice(len(codes), size=rows, p=code_weights)
+    levels = np.array(list(CREDENTIALS))
+    credlev = levels[rng.choice(len(levels), size=rows, p=_normalized([c[1] for c in CREDENTIALS.values()]))]
+    cred_index = credlev - 1
+    control = pd.Categorical(inst['CONTROL'].to_numpy()[at], categories=CONTROLS).codes
+
+    # Heavily skewed cohort sizes: most programs are small, a few enormous
+    count2 = np.floor(rng.lognormal(2.2, 1.3, rows))
+    count1 = np.floor(count2 * rng.uniform(0.7, 1.3, rows))
+    cohort = np.floor(count2 * rng.uniform(1.0, 3.0, rows))
+    # Suppressed with high probability below the threshold, rarely above it
+    suppressed = rng.random(rows) < np.where(cohort < SUPPRESSION_COUNT, 0.92, 0.08)
+    earn_suppressed = suppressed | (rng.random(rows) < 0.1)
+
+    multiplier = np.array([CIP_FAMILIES[f][2] for f in families])[cip]
+    earnings = (np.array([c[2] for c in CREDENTIALS.values()])[cred_index] * multiplier
+                * rng.lognormal(0, 0.3, rows))
+    debt = (np.array([c[3] for c in CREDENTIALS.values()])[cred_index] * np.array(CONTROL_DEBT)[control]
+            * rng.lognormal(0, 0.35, rows))
+    eval_debt = debt * rng.lognormal(0, 0.1, rows)
+
+    def masked(values, mask, dtype='int64'):
+        # Nullable, so counts and dollar amounts are written as integers and missing cells as nulls
+        return pa.array(values.astype(dtype), mask=mask)
+
+    frame = {
+        'UNITID': inst['UNITID'].to_numpy()[at],
+        'OPEID6': inst['OPEID6'].to_numpy()[at],
+        'INSTNM': inst['INSTNM'].to_numpy()[at],
+        'CONTROL': inst['CONTROL'].to_numpy()[at],
+        'MAIN': inst['MAIN'].to_numpy()[at],
+        'CIPCODE': codes[cip],
+        'CIPDESC': descriptions[cip],
+        'CREDLEV': credlev,
+        'CREDDESC': np.array([c[0] for c in CREDENTIALS.values()])[cred_index],
+        'IPEDSCOUNT1': masked(count1, rng.random(rows) < 0.03),
+        'IPEDSCOUNT2': masked(count2, rng.random(rows) < 0.03),
+        'DEBT_ALL_STGP_ANY_N': masked(cohort, suppressed),
+        'DEBT_ALL_STGP_ANY_MDN': masked(np.round(debt), suppressed),
+        'DEBT_ALL_STGP_ANY_MDN10YRPAY': masked(_monthly_payment(np.round(debt)), suppressed, 'float64'),
+        'DEBT_ALL_STGP_EVAL_N': masked(np.floor(cohort * 0.9), suppressed),
+        'DEBT_ALL_STGP_EVAL_MDN': masked(np.round(eval_debt), suppressed),
+        'DEBT_ALL_STGP_EVAL_MDN10YRPAY': masked(_monthly_payment(np.round(eval_debt)), suppressed, 'float64'),
+        'EARN_COUNT_WNE_HI_1YR': masked(np.floor(cohort * 0.7), earn_suppressed),
+        'EARN_MDN_HI_1YR': masked(np.round(earnings * 0.75), earn_suppressed),
+        'EARN_COUNT_WNE_HI_2YR': masked(np.floor(cohort * 0.65), earn_suppressed),
+        'EARN_MDN_HI_2YR': masked(np.round(earnings * 0.85), earn_suppressed),
+        'EARN_COUNT_WNE_5YR': masked(np.floor(cohort * 0.6), earn_suppressed),
+        'EARN_MDN_5YR': masked(np.round(earnings), earn_suppressed),
+    }
+    for i in range(padding):
+        frame[f'EXTRA_{i:02d}'] = masked(np.round(rng.lognormal(7, 0.5, rows)), rng.random(rows) < 0.6)
+    return pa.table(frame)
+
+
+def _write_chunk(path, rows, inst_rows, seed, chunk_seed, padding):
+    inst = institutions(inst_rows, seed)
+    table = field_of_study_chunk(rows, inst, chunk_seed, padding)
+    pa_csv.write_csv(table, path, pa_csv.WriteOptions(include_header=False, null_string='PrivacySuppressed'))
+    return path
+
+
+def generate(rows, out_dir, seed=0, padding=DEFAULT_PADDING, workers=None, chunk_rows=CHUNK_ROWS):
+    """Write both CSVs for `rows` program rows into out_dir; returns their paths.
+
+    Chunks are written to part files in parallel and then concatenated.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    inst = institutions(rows, seed)
+    inst_path = out_dir / INSTITUTION_FILE
+    inst[INSTITUTION_COLUMNS].to_csv(inst_path, index=False, na_rep='NULL', float_format='%.10g')
+
+    sizes = [min(chunk_rows, rows - start) for start in range(0, rows, chunk_rows)]
+    chunk_seeds = _seeds(seed + 1, len(sizes))
+    parts = [out_dir / f'_part-{i:05d}.csv' for i in range(len(sizes))]
+    workers = min(workers or os.cpu_count() or 1, len(sizes))
+    fos_path = out_dir / FOS_FILE
+    try:
+        if workers <= 1:
+            for part, size, chunk_seed in zip(parts, sizes, chunk_seeds):
+                _write_chunk(part, size, rows, seed, chunk_seed, padding)
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                list(pool.map(_write_chunk, parts, sizes, [rows] * len(sizes), [seed] * len(sizes), chunk_seeds,
+                              [padding] * len(sizes)))
+        columns = FOS_PREFIX + [f'EXTRA_{i:02d}' for i in range(padding)]
+        tmp_path = fos_path.with_name(fos_path.name + '.part')
+        with open(tmp_path, 'w') as out:
+            out.write(','.join(columns) + '\n')
+            out.flush()
+            for part in parts:
+                with open(part) as f:
+                    shutil.copyfileobj(f, out, length=1 << 22)
+        tmp_path.replace(fos_path)
+    finally:
+        for part in parts:
+            part.unlink(missing_ok=True)
+    (out_dir / PARAMS_NAME).write_text(json.dumps({'rows': rows, 'seed': seed, 'padding': padding}))
+    return fos_path, inst_path
+
+
+def ensure_synthetic(rows, out_dir=None, seed=0, padding=DEFAULT_PADDING, workers=None):
+    """Generate the files for `rows` unless out_dir already holds them for the same parameters."""
+    out_dir = Path(out_dir or SYNTHETIC_DIR / str(rows))
+    params_path = out_dir / PARAMS_NAME
+    wanted = {'rows': rows, 'seed': seed, 'padding': padding}
+    if (params_path.exists() and json.loads(params_path.read_text()) == wanted
+            and (out_dir / FOS_FILE).exists() and (out_dir / INSTITUTION_FILE).exists()):
+        return out_dir / FOS_FILE, out_dir / INSTITUTION_FILE
+    return generate(rows, out_dir, seed, padding, workers)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic College Scorecard CSVs.")
+    parser.add_argument('--rows', default='100k', help=f"program rows, e.g. 250000 or one of {list(SCALES)}")
+    parser.add_argument('--out', type=Path, default=None, help="output directory (default: ../data/synthetic/ROWS)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--padding', type=int, default=DEFAULT_PADDING, help="extra numeric columns per row")
+    parser.add_argument('--workers', type=int, default=None, help="parallel chunk writers (default: all cores)")
+    args = parser.parse_args()
+
+    rows = parse_rows(args.rows)
+    start = time.perf_counter()
+    fos_path, inst_path = generate(rows, args.out or SYNTHETIC_DIR / str(rows), args.seed, args.padding, args.workers)
+    print(f"Wrote {rows:,} program rows to {fos_path} ({fos_path.stat().st_size / 2**20:.1f} MB) and "
+          f"{inst_path} in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Shared Transformation Steps
+#
+# The column selection, cleaning, ROI features, filtering and categorization
+# steps used by 01_preprocess.py and pipeline.py. Each step copies its input
+# unless called with copy=False, in which case columns are assigned in place.
+# Filtering is the validation stage: the rows failing preprocess_rules are
+# dropped, or handed to a validation.QuarantineWriter when one is given.
+
+import pandas as pd
+
+from compact import compact
+from loader import FOS_COLUMNS
+from roi_metrics import DEFAULT_INCOME_SHARE, DEFAULT_INTEREST_RATE, METRIC_COLS, bucketize, compute_metrics
+from validation import Rule, validate
+
+COLUMNS_TO_KEEP = list(FOS_COLUMNS)
+
+NUMERIC_COLS = [
+    'EARN_MDN_5YR', 'DEBT_ALL_STGP_ANY_MDN', 'DEBT_ALL_STGP_EVAL_MDN',
+    'DEBT_ALL_STGP_ANY_MDN10YRPAY', 'DEBT_ALL_STGP_EVAL_MDN10YRPAY', 'IPEDSCOUNT2'
+]
+
+MIN_CLASS_SIZE = 10
+EARNINGS_BOUNDS = (10000, 500000)
+
+CREDENTIAL_MAP = {
+    1: 'Undergraduate Certificate',
+    2: 'Associate Degree',
+    3: 'Bachelor Degree',
+    4: 'Post-baccalaureate Certificate',
+    5: 'Master Degree',
+    6: 'Doctoral Degree',
+    7: 'First Professional Degree',
+    8: 'Graduate Certificate'
+}
+
+MAJOR_MAP = {
+    '11': 'Computer Science',
+    '14': 'Engineering',
+    '15': 'Engineering Technology',
+    '26': 'Biological Sciences',
+    '27': 'Mathematics',
+    '40': 'Physical Sciences',
+    '52': 'Business',
+    '51': 'Health Professions',
+    '42': 'Psychology',
+    '45': 'Social Sciences',
+    '23': 'English Language',
+    '24': 'Liberal Arts & Humanities',
+    '50': 'Visual & Performing Arts',
+    '13': 'Education',
+}
+
+ROI_BINS = [0, 1, 1.5, 2.5, 4, float('inf')]
+ROI_LABELS = ['Poor (<1)', 'Low (1-1.5)', 'Average (1.5-2.5)', 'Good (2.5-4)', 'Excellent (>4)']
+
+AFFORD_BINS = [0, 8, 12, 20, float('inf')]
+AFFORD_LABELS = ['Very Affordable (<8%)', 'Affordable (8-12%)', 'Moderate (12-20%)', 'Expensive (>20%)']
+
+
+def select_columns(df, columns=COLUMNS_TO_KEEP, copy=True):
+    """Part 3: keep only the columns used for the ROI analysis."""
+    columns = list(columns)
+    if not copy and list(df.columns) == columns:
+        return df
+    # take() returns a new frame (one copy) that later steps can assign into
+    return df.take([df.columns.get_loc(col) for col in columns], axis=1)
+
+
+def clean(df, numeric_cols=NUMERIC_COLS, copy=True):
+    """Part 4: coerce the earnings/debt/count columns to numbers."""
+    if copy:
+        df = df.copy()
+    for col in numeric_cols:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+
+def add_roi_features(df, interest_rate=DEFAULT_INTEREST_RATE, income_share=DEFAULT_INCOME_SHARE, copy=True):
+    """Part 5: earnings-to-debt ROI, debt-to-income, amortized payback and monthly payment share."""
+    if copy:
+        df = df.copy()
+    metrics = compute_metrics(df['EARN_MDN_5YR'], df['DEBT_ALL_STGP_ANY_MDN'], df['DEBT_ALL_STGP_ANY_MDN10YRPAY'],
+                              interest_rate=interest_rate, income_share=income_share)
+    for col in METRIC_COLS:
+        df[col] = metrics[col]
+    return df
+
+
+def preprocess_rules(min_class_size=MIN_CLASS_SIZE, earnings_bounds=EARNINGS_BOUNDS):
+    """The schema, range and key rules of Part 6 (see validation.py for the checks and actions)."""
+    low, high = earnings_bounds
+    return [
+        Rule('numeric_columns', 'dtype', [*NUMERIC_COLS, 'ROI_EARNINGS_TO_DEBT'], {'kind': 'number'}, 'error'),
+        Rule('key_columns', 'dtype', ['UNITID', 'OPEID6', 'CIPCODE', 'CREDLEV'], {'kind': 'integer'}, 'error'),
+        Rule('roi_present', 'not_null', ['ROI_EARNINGS_TO_DEBT']),
+        # Zero debt gives an infinite earnings-to-debt ratio
+        Rule('roi_finite', 'not_inf', ['ROI_EARNINGS_TO_DEBT']),
+        Rule('min_class_size', 'range', ['IPEDSCOUNT2'], {'low': min_class_size}),
+        Rule('earnings_range', 'range', ['EARN_MDN_5YR'], {'low': low, 'high': high}),
+        Rule('cip_format', 'cip', ['CIPCODE']),
+        Rule('credential_level', 'isin', ['CREDLEV'], {'values': list(CREDENTIAL_MAP)}),
+        # Campuses sharing an OPEID6 repeat its program rows, so repeats are reported, not removed
+        Rule('unique_program', 'unique', ['OPEID6', 'CIPCODE', 'CREDLEV'], action='warn'),
+    ]
+
+
+def filter_rows(df, min_class_size=MIN_CLASS_SIZE, earnings_bounds=EARNINGS_BOUNDS, quarantine=None):
+    """Part 6: validate the rows and keep those passing every quarantine rule of preprocess_rules.
+
+    With a validation.QuarantineWriter the failing rows and the per-rule counts
+    (including the 'warn' rules, which are skipped otherwise) are passed to it.
+    """
+    rules = preprocess_rules(min_class_size, earnings_bounds)
+    if quarantine is None:
+        rules = [rule for rule in rules if rule.action != 'warn']
+    validation = validate(df, rules)
+    if quarantine is not None:
+        quarantine.add(validation)
+    return validation.valid
+
+
+def categorize(df, roi_bins=ROI_BINS, roi_labels=ROI_LABELS, afford_bins=AFFORD_BINS, afford_labels=AFFORD_LABELS,
+               copy=True):
+    """Part 7: credential names, major field groups and the ROI / affordability buckets."""
+    if copy:
+        df = df.copy()
+    # Categories in credential-level order (certificate, associate, bachelor, ...)
+    df['CREDENTIAL_LEVEL_NAME'] = pd.Categorical(
+        df['CREDLEV'].map(CREDENTIAL_MAP), categories=list(CREDENTIAL_MAP.values())
+    ).remove_unused_categories()
+    # CIPCODE is read as an integer, so 0101 is 101: the family is the code // 100, zero-padded
+    df['CIP_2DIGIT'] = (df['CIPCODE'] // 100).astype('string').str.zfill(2).astype(object)
+    df['MAJOR_FIELD'] = df['CIP_2DIGIT'].map(MAJOR_MAP).fillna('Other')
+    df['ROI_CATEGORY'] = bucketize(df['ROI_EARNINGS_TO_DEBT'], roi_bins, roi_labels)
+    df['AFFORDABILITY'] = bucketize(df['MONTHLY_PAYMENT_PCT'], afford_bins, afford_labels)
+    return compact(df)
+
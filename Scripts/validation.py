@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# College Scorecard ROI Analysis - Data Validation
+#
+# Declarative data-quality rules, checked in one vectorized pass. A Rule names
+# a check from CHECKS, its column(s), the check's parameters and what happens
+# when it fails: 'error' rules check the schema (column present, dtype kind)
+# and stop the run; rows failing a 'quarantine' rule are moved to a side file
+# instead of being dropped silently; 'warn' rules are only counted. validate()
+# turns every row rule into one bit of a per-row bitmask, so the per-rule
+# counts, the rows kept and each quarantined row's FAILED_RULES all come from
+# the same pass. QuarantineWriter collects the results of one or more chunks
+# into data/quarantine/<name>_quarantine.parquet and <name>_validation.json.
+# The preprocessing rules are transforms.preprocess_rules. Run directly to
+# validate raw Field of Study files and print the summary and timing:
+#     python validation.py
+#     python validation.py ../data/raw/field_of_study/*.csv
+
+import argparse
+import json
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from store import DatasetWriter
+
+QUARANTINE_DIR = Path('../data/quarantine')
+# Name of the side files of the most recent Field of Study file (01_preprocess.py, outofcore.py)
+QUARANTINE_NAME = 'field_of_study'
+ACTIONS = ('error', 'quarantine', 'warn')
+FAILED_COL = 'FAILED_RULES'
+# CIP 2020 two-digit families run from 01 to 61
+CIP_FAMILY_RANGE = (1, 61)
+# Failing rows kept per rule in the summary
+EXAMPLES = 3
+
+Rule = namedtuple('Rule', ['name', 'check', 'columns', 'params', 'action'], defaults=(None, 'quarantine'))
+
+
+class ValidationError(ValueError):
+    """An 'error' rule failed, so the rows cannot be validated."""
+
+
+def _dtype_ok(dtype, kind):
+    if kind == 'integer':
+        return pd.api.types.is_integer_dtype(dtype)
+    if kind == 'number':
+        return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+    if kind == 'text':
+        return (pd.api.types.is_string_dtype(dtype) or isinstance(dtype, pd.CategoricalDtype)
+                or pd.api.types.is_object_dtype(dtype))
+    raise ValueError(f"Unknown dtype kind '{kind}'")
+
+
+def _not_null(column, params):
+    return column.isna().to_numpy()
+
+
+def _not_inf(column, params):
+    return np.isinf(column.to_numpy(dtype='float64', na_value=np.nan))
+
+
+def _in_range(column, params):
+    # Missing values fail: they are not known to be in range
+    values = column.to_numpy(dtype='float64', na_value=np.nan)
+    ok = ~np.isnan(values)
+    if params.get('low') is not None:
+        ok &= values >= params['low']
+    if params.get('high') is not None:
+        ok &= values <= params['high']
+    return ~ok
+
+
+def _in_set(column, params):
+    return ~np.isin(column.to_numpy(dtype='float64', na_value=np.nan), list(params['values']))
+
+
+def _cip_code(column, params):
+    """Four-digit CIP code stored as an integer (0101 is 101): whole, below 10000, in a known family."""
+    values = column.to_numpy(dtype='float64', na_value=np.nan)
+    low, high = params.get('families', CIP_FAMILY_RANGE)
+    family = values // 100
+    return ~((values == np.floor(values)) & (values >= 0) & (values < 10000) & (family >= low) & (family <= high))
+
+
+# Row checks: (column, params) -> boolean array, True where the row fails
+CHECKS = {
+    'not_null': _not_null,
+    'not_inf': _not_inf,
+    'range': _in_range,
+    'isin': _in_set,
+    'cip': _cip_code,
+}
+
+
+def check_schema(df, rules):
+    """Problems with the 'error' (dtype) rules: missing columns or columns of the wrong kind."""
+    problems = []
+    for rule in rules:
+        for col in rule.columns:
+            if col not in df.columns:
+                problems.append(f"{rule.name}: column '{col}' is missing")
+            elif not _dtype_ok(df[col].dtype, rule.params['kind']):
+                problems.append(f"{rule.name}: column '{col}' is {df[col].dtype}, expected {rule.params['kind']}")
+    return problems
+
+
+def _examples(df, columns, failing):
+    rows = df[list(columns)].iloc[failing[:EXAMPLES]]
+    # to_json writes NA as null and numpy scalars as plain numbers
+    return json.loads(rows.to_json(orient='records'))
+
+
+class Validation:
+    """Result of validate(): per-rule counts, the rows that pass and the quarantined rows."""
+
+    def __init__(self, df, rules, failures):
+        self.rules = rules
+        self.rows = len(df)
+        self.counts = {rule.name: int(fail.sum()) for rule, fail in zip(rules, failures)}
+        self.examples = {rule.name: _examples(df, rule.columns, np.flatnonzero(fail))
+                         for rule, fail in zip(rules, failures) if fail.any()}
+
+        bits = np.zeros(len(df), dtype='uint64')
+        quarantine_bits = np.uint64(0)
+        for i, (rule, fail) in enumerate(zip(rules, failures)):
+            bits |= fail.astype('uint64') << np.uint64(i)
+            if rule.action == 'quarantine':
+                quarantine_bits |= np.uint64(1) << np.uint64(i)
+        quarantined = (bits & quarantine_bits) != 0
+        self.valid = df.take(np.flatnonzero(~quarantined))
+
+        # One label per distinct combination of failed rules
+        positions = np.flatnonzero(quarantined)
+        combinations, inverse = np.unique(bits[positions], return_inverse=True)
+        labels = [', '.join(rule.name for i, rule in enumerate(rules) if int(combination) >> i & 1)
+                  for combination in combinations]
+        self.quarantined = df.take(positions).assign(**{
+            FAILED_COL: pd.Categorical.from_codes(inverse.reshape(-1), labels) if len(labels) else
+            pd.Categorical([], categories=[])})
+
+    def to_dict(self):
+        return summarize(self.rules, self.rows, len(self.valid), self.counts, self.examples)
+
+
+def validate(df, rules):
+    """Check `rules` against df in one pass over its columns; raises ValidationError if an 'error' rule fails."""
+    for rule in rules:
+        if rule.action not in ACTIONS:
+            raise ValueError(f"Rule '{rule.name}' has unknown action '{rule.action}'")
+    problems = check_schema(df, [rule for rule in rules if rule.action == 'error'])
+    if problems:
+        raise ValidationError('Schema validation failed:\n  ' + '\n  '.join(problems))
+
+    rules = [rule for rule in rules if rule.action != 'error']
+    failures = []
+    for rule in rules:
+        if rule.check == 'unique':
+            # Every repeat of a key after its first row
+            failures.append(df.duplicated(subset=list(rule.columns), keep='first').to_numpy())
+        else:
+            fail = np.zeros(len(df), dtype=bool)
+            for col in rule.columns:
+                fail |= CHECKS[rule.check](df[col], rule.params or {})
+            failures.append(fail)
+    return Validation(df, rules, failures)
+
+
+def summarize(rules, rows, valid_rows, counts, examples):
+    """JSON-ready summary: row totals and, per rule, its violations and a few failing rows."""
+    return {
+        'rows': rows,
+        'valid_rows': valid_rows,
+        'quarantined_rows': rows - valid_rows,
+        'rules': [{'rule': rule.name, 'check': rule.check, 'columns': list(rule.columns), 'action': rule.action,
+                   'violations': counts[rule.name],
+                   'share': round(counts[rule.name] / rows, 6) if rows else 0.0,
+                   'examples': examples.get(rule.name, [])} for rule in rules],
+    }
+
+
+def format_summary(summary):
+    lines = [f"Validated {summary['rows']} rows: {summary['valid_rows']} kept, "
+             f"{summary['quarantined_rows']} quarantined",
+             f"{'rule':<22} {'action':<10} {'violations':>10} {'share':>8}"]
+    for rule in summary['rules']:
+        lines.append(f"{rule['rule']:<22} {rule['action']:<10} {rule['violations']:>10} {rule['share']:>8.2%}")
+    return '\n'.join(lines)
+
+
+class QuarantineWriter:
+    """Collects the validations of a stream of chunks: quarantined rows to one Parquet dataset, counts to JSON.
+
+    A 'unique' rule only sees one chunk at a time, so keys repeated across chunks are not counted.
+    """
+
+    def __init__(self, name, quarantine_dir=QUARANTINE_DIR):
+        self.quarantine_dir = Path(quarantine_dir)
+        self.dataset_path = self.quarantine_dir / f'{name}_quarantine.parquet'
+        self.summary_path = self.quarantine_dir / f'{name}_validation.json'
+        self.writer = DatasetWriter(self.dataset_path, partition_cols=[])
+        self.rules = None
+        self.rows = self.valid_rows = 0
+        self.counts, self.examples = {}, {}
+
+    def add(self, validation):
+        if self.rules is None:
+            self.rules = validation.rules
+            self.counts = dict.fromkeys(validation.counts, 0)
+        self.rows += validation.rows
+        self.valid_rows += len(validation.valid)
+        for name, count in validation.counts.items():
+            self.counts[name] += count
+        for name, rows in validation.examples.items():
+            self.examples[name] = (self.examples.get(name, []) + rows)[:EXAMPLES]
+        # The first chunk is always written, so the dataset has a schema even when nothing fails
+        if len(validation.quarantined) or not self.writer.parts:
+            self.writer.write(validation.quarantined)
+
+    def summary(self):
+        return summarize(self.rules or [], self.rows, self.valid_rows, self.counts, self.examples)
+
+    def close(self):
+        self.writer.close()
+        tmp_path = self.summary_path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(self.summary(), indent=2))
+        tmp_path.replace(self.summary_path)
+        return self.dataset_path, self.summary_path
+
+    def abort(self):
+        self.writer.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+if __name__ == '__main__':
+    from loader import FOS_COLUMNS, FOS_DTYPES, load_field_of_study
+    from rawdata import FOS_FILE, RAW_DIR
+    from transforms import NUMERIC_COLS, add_roi_features, clean, preprocess_rules, select_columns
+
+    parser = argparse.ArgumentParser(description="Validate raw Field of Study files against the preprocessing rules.")
+    parser.add_argument('paths', nargs='*', type=Path, default=[RAW_DIR / FOS_FILE], help="raw CSV files")
+    args = parser.parse_args()
+
+    rules = preprocess_rules()
+    for path in args.paths:
+        # Older releases lack some columns (as in cohorts.py); they stay empty and fail their rules
+        header = pd.read_csv(path, nrows=0).columns
+        df = load_field_of_study(path, columns=[col for col in FOS_COLUMNS if col in header])
+        df = df.assign(**{col: pd.Series(index=df.index, dtype=FOS_DTYPES[col]) for col in FOS_COLUMNS
+                          if col not in header})
+        df = add_roi_features(clean(select_columns(df), NUMERIC_COLS, copy=False), copy=False)
+        start = time.perf_counter()
+        validation = validate(df, rules)
+        seconds = time.perf_counter() - start
+        print(f"\n{path.name}: validated in {seconds:.3f}s ({len(df) / max(seconds, 1e-9):,.0f} rows/s)")
+        print(format_summary(validation.to_dict()))